@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Compare requests/sec of the development and production settings on home and shop.
+
+    python benchmark.py                  # settings vs settings_production
+    python benchmark.py --requests 500 --settings ecommarce.settings ecommarce.settings_production
+    python benchmark.py --settings ecommarce.settings_production --interfaces wsgi asgi --concurrency 16
+
+Each settings module (and entry point) is benchmarked in its own process,
+calling the WSGI or ASGI application directly (no network), against the
+database configured in the settings. Under ASGI the async views are routed, as
+ecommarce/asgi.py does. ``--concurrency`` keeps that many requests in flight:
+threads for WSGI, tasks on one event loop for ASGI. "cold" clears the cache
+before every request so the full view and template path is measured; "warm"
+lets the page cache answer.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+URLS = {
+    'home': '/',
+    'shop': '/shop/',
+    'shop (sorted, page 1)': '/shop/?sort=price_low',
+}
+
+
+def run_child(settings_module, requests, interface='wsgi', concurrency=1):
+    """Benchmark one settings module in this process and print the results as JSON."""
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    os.environ['DJANGO_ASYNC_VIEWS'] = '1' if interface == 'asgi' else '0'
+    sys.path.insert(0, BASE_DIR)
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+
+    if 'Manifest' in settings.STORAGES['staticfiles']['BACKEND']:
+        call_command('collectstatic', interactive=False, verbosity=0)
+    from myapp.models import Product
+
+    urls = dict(URLS)
+    product_id = Product.objects.filter(stock__gt=0).order_by('id').values_list('id', flat=True).first()
+    if product_id:
+        urls['product'] = f'/product/{product_id}/'
+    bench = asgi_bench if interface == 'asgi' else wsgi_bench
+    print(json.dumps(bench(urls, requests, concurrency)))
+
+
+def wsgi_bench(urls, requests, concurrency):
+    from django.core.cache import cache
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+
+    def request(path, cold=False):
+        if cold:
+            cache.clear()
+        url_path, _, query = path.partition('?')
+        environ = {'PATH_INFO': url_path, 'QUERY_STRING': query, 'HTTP_HOST': 'localhost'}
+        setup_testing_defaults(environ)
+        status = []
+        body = b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+        if not status[0].startswith('200'):
+            raise SystemExit(f'{path} returned {status[0]}')
+        return body
+
+    results = {}
+    with ThreadPoolExecutor(concurrency) as pool:
+        for name, path in urls.items():
+            for _ in range(10):
+                request(path)  # warm up connections, template caches, imports
+            for mode in ('cold', 'warm'):
+                start = time.perf_counter()
+                list(pool.map(request, [path] * requests, [mode == 'cold'] * requests))
+                results[f'{name} [{mode}]'] = requests / (time.perf_counter() - start)
+    return results
+
+
+def asgi_bench(urls, requests, concurrency):
+    from django.core.asgi import get_asgi_application
+    from django.core.cache import cache
+
+    application = get_asgi_application()
+
+    async def request(path, cold=False):
+        if cold:
+            await cache.aclear()
+        url_path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': url_path, 'raw_path': url_path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        disconnected = asyncio.Event()
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await disconnected.wait()  # the client stays connected until the response is complete
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, receive, send)
+        status = sent[0]['status']
+        if status != 200:
+            raise SystemExit(f'{path} returned {status}')
+        return b''.join(message.get('body', b'') for message in sent[1:])
+
+    async def run(path, cold):
+        remaining = iter(range(requests))
+
+        async def client():
+            for _ in remaining:
+                await request(path, cold)
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    async def bench():
+        results = {}
+        for name, path in urls.items():
+            for _ in range(10):
+                await request(path)
+            for mode in ('cold', 'warm'):
+                start = time.perf_counter()
+                await run(path, mode == 'cold')
+                results[f'{name} [{mode}]'] = requests / (time.perf_counter() - start)
+        return results
+
+    return asyncio.run(bench())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per URL and mode.')
+    parser.add_argument('--settings', nargs='+', default=['ecommarce.settings', 'ecommarce.settings_production'])
+    parser.add_argument('--interfaces', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi'])
+    parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight at once.')
+    parser.add_argument('--interface', choices=['wsgi', 'asgi'], default='wsgi', help=argparse.SUPPRESS)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.requests, args.interface, args.concurrency)
+        return
+
+    columns = {}
+    with tempfile.TemporaryDirectory() as static_root:
+        env = {**os.environ, 'DJANGO_STATIC_ROOT': static_root, 'DJANGO_ALLOWED_HOSTS': 'localhost'}
+        for module in args.settings:
+            for interface in args.interfaces:
+                child = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', module, '--interface', interface,
+                     '--requests', str(args.requests), '--concurrency', str(args.concurrency)],
+                    env=env, capture_output=True, text=True,
+                )
+                label = module.rsplit('.', 1)[-1]
+                if len(args.interfaces) > 1:
+                    label += f' {interface}'
+                if child.returncode:
+                    raise SystemExit(f'{label} failed:\n{child.stderr}')
+                columns[label] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    modules = list(columns)
+    width = max(len(name) for name in columns[modules[0]]) + 2
+    column = max(22, *(len(m) + 2 for m in modules))
+    print('req/s'.ljust(width) + ''.join(m.rjust(column) for m in modules) + '     change')
+    for name in columns[modules[0]]:
+        values = [columns[m][name] for m in modules]
+        change = f'{values[-1] / values[0]:>10.2f}x' if len(values) > 1 else ''
+        print(name.ljust(width) + ''.join(f'{v:>{column}.1f}' for v in values) + change)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,14 @@ ASGI config for ecommarce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serving through this entry point (e.g. ``uvicorn ecommarce.asgi:application``)
+enables the server-sent events push for chat threads (myapp.views.chat_stream);
+under WSGI the chat pages fall back to polling. Set DJANGO_ASYNC_VIEWS=1 to
+also route the read-heavy storefront views to their async versions
+(myapp/async_views.py). That is off by default: the middleware chain is
+sync-only, so every async view crosses the sync/async boundary, and page
+cache hits come out slower than the sync views (see benchmark.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'myapp.middleware.QueryInspectorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,6 +65,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'myapp.context_processors.cart_summary',
+                'myapp.context_processors.catalog_cache',
             ],
         },
     },
@@ -79,6 +82,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Transactions take the write lock at BEGIN and wait for it (busy_timeout),
+            # instead of failing when a read transaction later tries to write.
+            # busy_timeout and the other per-connection pragmas are set in myapp.db.configure_sqlite;
+            # WAL mode is stored in the file by migration 0016_sqlite_wal.
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -129,3 +139,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL='login'
+
+# Route the read-heavy storefront views to their async versions (myapp/async_views.py).
+# Opt-in, and only under ecommarce/asgi.py; under WSGI each async view would run in its own event loop.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '0') == '1'
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import UserProfile, Category, Product, Cart, CartItem, Order, OrderItem, Coupon,ContactMessage, MessageReply
+from .jobs import requeue_dead
+from .models import UserProfile, Category, Product, Cart, CartItem, Order, OrderItem, Coupon,ContactMessage, MessageReply, Job, Review
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -14,10 +15,10 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'stock', 'category', 'created_at')
+    list_display = ('name', 'price', 'stock', 'category', 'rating_avg', 'rating_count', 'created_at')
     list_filter = ('category', 'created_at')
     search_fields = ('name', 'description')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'rating_avg', 'rating_count')
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -60,3 +61,39 @@ class MessageReplyAdmin(admin.ModelAdmin):
     list_filter = ('is_admin', 'created_at')
     search_fields = ('message__subject', 'user__username', 'content')
     readonly_fields = ('created_at',)
+
+@admin.register(Review)
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ('product', 'user', 'rating', 'is_approved', 'created_at')
+    list_filter = ('is_approved', 'rating', 'created_at')
+    search_fields = ('product__name', 'user__username', 'comment')
+    readonly_fields = ('created_at',)
+    actions = ['approve', 'unapprove']
+
+    # Saved one by one (not queryset.update) so the product rating signals run
+    @admin.action(description='Approve selected reviews')
+    def approve(self, request, queryset):
+        self._set_approved(request, queryset, True)
+
+    @admin.action(description='Unapprove selected reviews')
+    def unapprove(self, request, queryset):
+        self._set_approved(request, queryset, False)
+
+    def _set_approved(self, request, queryset, approved):
+        reviews = queryset.exclude(is_approved=approved)
+        for review in reviews:
+            review.is_approved = approved
+            review.save(update_fields=['is_approved'])
+        self.message_user(request, f'{len(reviews)} reviews updated.')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('created_at', 'locked_by', 'locked_at', 'last_error')
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected dead jobs')
+    def requeue(self, request, queryset):
+        count = requeue_dead(id__in=queryset.values('id'))
+        self.message_user(request, f'{count} jobs requeued.')
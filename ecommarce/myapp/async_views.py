@@ -0,0 +1,115 @@
+"""
+Async versions of the read-heavy storefront views, routed instead of their
+counterparts in views.py when the site is served through ecommarce/asgi.py
+(settings.ASYNC_VIEWS).
+
+Queries go through the async ORM, and the ones that do not depend on each other
+are started together with asyncio.gather. Templates still render synchronously
+(context processors and {% cache %} blocks use the sync ORM), so every query a
+template needs is evaluated here first.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .chat import alatest_reply_id, parse_cursor, replies_since, serialize_reply
+from .counters import aget_counters
+from .models import Category, ContactMessage, Page, Product, UserProfile, Wishlist
+from .page_cache import anonymous_page_cache
+from .recommendations import arelated_products
+from .views import is_new_arrival, shop_listing
+
+arender = sync_to_async(render)
+
+
+async def _list(queryset):
+    return [obj async for obj in queryset]
+
+
+@anonymous_page_cache
+async def home(request):
+    products, categories, counters = await asyncio.gather(
+        _list(Product.objects.filter(stock__gt=0).select_related('category')[:8]),
+        _list(Category.objects.all()[:6]),
+        aget_counters(),
+    )
+    context = {
+        'products': products,
+        'categories': categories,
+        'total_products': counters['total_products'],
+        'total_orders': counters['total_orders'],
+        'total_users': counters['total_users'],
+        'total_categories': counters['total_categories'],
+    }
+    return await arender(request, 'home.html', context)
+
+
+@anonymous_page_cache
+async def shop(request):
+    paginator, context = shop_listing(request)
+    context['page_obj'], context['categories'] = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        _list(Category.objects.all()),
+    )
+    return await arender(request, 'shop.html', context)
+
+
+@anonymous_page_cache
+async def product_detail(request, product_id):
+    product = await aget_object_or_404(Product.objects.select_related('category'), id=product_id)
+    user = await request.auser()
+    related = arelated_products(product)
+    if user.is_authenticated:
+        related_products, wishlist_item_id = await asyncio.gather(
+            related,
+            Wishlist.objects.filter(user=user, product=product).values_list('id', flat=True).afirst(),
+        )
+    else:
+        related_products, wishlist_item_id = await related, None
+
+    context = {
+        'product': product,
+        'related_products': related_products,
+        'in_wishlist': wishlist_item_id is not None,
+        'wishlist_item_id': wishlist_item_id,
+        'is_new': is_new_arrival(product),
+    }
+    return await arender(request, 'product_detail.html', context)
+
+
+@anonymous_page_cache
+async def page_detail(request, slug):
+    page = await aget_object_or_404(Page, slug=slug, is_active=True)
+    return await arender(request, 'page.html', {'page': page})
+
+
+@login_required
+async def get_chat_messages(request, message_id):
+    """views.get_chat_messages: the access check and the latest reply id are looked up together."""
+    user = await request.auser()
+    role, thread, latest = await asyncio.gather(
+        UserProfile.objects.filter(user=user).values_list('role', flat=True).afirst(),
+        ContactMessage.objects.filter(id=message_id).values_list('id', 'user_id').afirst(),
+        alatest_reply_id(message_id),
+    )
+    # Allow access if user is admin OR if user owns the message
+    if thread is None or (role != 'admin' and thread[1] != user.id):
+        raise Http404('No ContactMessage matches the given query.')
+
+    since = parse_cursor(request.GET.get('since'))
+    etag = f'"chat-{message_id}-{latest}-{since}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        data = []
+        if latest > since:
+            data = [serialize_reply(reply) async for reply in replies_since(message_id, since)]
+        cursor = data[-1]['id'] if data else since
+        response = JsonResponse({'replies': data, 'cursor': cursor})
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,150 @@
+import json
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Cart, CartItem, Product
+from .pricing import price_cart
+
+# The cache may be local to each worker process: a cart changed through another
+# worker shows its old badge for at most this long.
+CART_SUMMARY_TIMEOUT = 30
+
+
+def _summary_key(user_id):
+    return f'cart_summary:{user_id}'
+
+
+def refresh_cart_summary(user):
+    """Recompute the header cart summary for ``user`` with one aggregate query and cache it."""
+    price = price_cart(user)
+    summary = {
+        'count': price['count'],
+        'subtotal': price['subtotal'],
+    }
+    cache.set(_summary_key(user.pk), summary, CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def forget_cart_summaries(user_ids):
+    cache.delete_many([_summary_key(user_id) for user_id in user_ids])
+
+
+def get_cart_summary(user):
+    summary = cache.get(_summary_key(user.pk))
+    if summary is None:
+        summary = refresh_cart_summary(user)
+    return summary
+
+
+GUEST_CART_COOKIE = 'guest_cart'
+GUEST_CART_SALT = 'myapp.cart.guest'
+GUEST_CART_MAX_AGE = 60 * 60 * 24 * 30
+GUEST_CART_MAX_LINES = 50  # keeps the signed cookie well under the 4 KB limit
+
+
+class GuestCartLine:
+    """One guest cart line, shaped like a CartItem from pricing.cart_lines (``id`` is the product id)."""
+
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product = product
+        self.product_id = product.id
+        self.quantity = quantity
+        self.line_total = product.price * quantity
+
+
+class GuestCart:
+    """
+    Cart for anonymous shoppers, held in a signed cookie as {product_id: quantity}.
+
+    Adding, updating and removing lines never touches the database; the cart is
+    written to the Cart tables only when the shopper logs in or registers
+    (see merge_guest_cart). Call save(response) after changing it.
+    """
+
+    def __init__(self, request):
+        raw = request.get_signed_cookie(GUEST_CART_COOKIE, default=None, salt=GUEST_CART_SALT,
+                                        max_age=GUEST_CART_MAX_AGE)
+        try:
+            items = {int(product_id): int(quantity) for product_id, quantity in json.loads(raw).items()} if raw else {}
+        except (ValueError, TypeError, AttributeError):
+            items = {}
+        self.items = {product_id: quantity for product_id, quantity in items.items() if quantity > 0}
+        self.modified = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def quantity(self, product_id):
+        return self.items.get(product_id, 0)
+
+    def is_full(self, product_id):
+        return product_id not in self.items and len(self.items) >= GUEST_CART_MAX_LINES
+
+    def set(self, product_id, quantity):
+        if quantity > 0:
+            self.items[product_id] = quantity
+        else:
+            self.items.pop(product_id, None)
+        self.modified = True
+
+    def remove(self, product_id):
+        self.set(product_id, 0)
+
+    def clear(self):
+        self.items = {}
+        self.modified = True
+
+    def lines(self):
+        """The lines with their products, in the order they were added (one query)."""
+        if not self.items:
+            return []
+        products = Product.objects.select_related('category').in_bulk(list(self.items))
+        return [
+            GuestCartLine(products[product_id], quantity)
+            for product_id, quantity in self.items.items()
+            if product_id in products
+        ]
+
+    def save(self, response):
+        if not self.modified:
+            return
+        if self.items:
+            response.set_signed_cookie(
+                GUEST_CART_COOKIE, json.dumps(self.items, separators=(',', ':')), salt=GUEST_CART_SALT,
+                max_age=GUEST_CART_MAX_AGE, httponly=True, samesite='Lax',
+            )
+        else:
+            response.delete_cookie(GUEST_CART_COOKIE, samesite='Lax')
+
+
+def merge_guest_cart(user, guest_cart):
+    """
+    Move a guest cart into ``user``'s Cart with one bulk insert and one bulk update.
+
+    Quantities for products already in the cart are added together; every line is
+    capped at the current stock and out-of-stock products are dropped.
+    """
+    if not guest_cart.items:
+        return
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        existing = {item.product_id: item for item in cart.cartitem_set.all()}
+        stock = dict(Product.objects.filter(id__in=list(guest_cart.items)).values_list('id', 'stock'))
+
+        new_items, changed_items = [], []
+        for product_id, quantity in guest_cart.items.items():
+            available = stock.get(product_id, 0)
+            if available <= 0:
+                continue
+            item = existing.get(product_id)
+            if item is None:
+                new_items.append(CartItem(cart=cart, product_id=product_id, quantity=min(quantity, available)))
+            else:
+                item.quantity = min(item.quantity + quantity, available)
+                changed_items.append(item)
+        CartItem.objects.bulk_create(new_items)
+        CartItem.objects.bulk_update(changed_items, ['quantity'])
+    guest_cart.clear()
+    refresh_cart_summary(user)
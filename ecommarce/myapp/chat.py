@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+from django.core.cache import cache
+from django.db.models import Max
+
+from .models import MessageReply
+
+CHAT_STREAM_TIMEOUT = 55  # seconds; EventSource reconnects with Last-Event-ID afterwards
+CHAT_STREAM_INTERVAL = 1
+CHAT_STREAM_HEARTBEAT = 15
+# The cache may be local to each worker process, where replies posted through another
+# worker never update it: cached ids are only a hint, trusted for this many seconds.
+LATEST_HINT_SECONDS = 2
+
+
+def _latest_key(message_id):
+    return f'chat_latest:{message_id}'
+
+
+def _latest_query(message_id):
+    # MAX(id) over one thread: a single seek on the message_id index
+    return MessageReply.objects.filter(message_id=message_id).aggregate(latest=Max('id'))['latest'] or 0
+
+
+def set_latest_reply_id(message_id, reply_id):
+    cache.set(_latest_key(message_id), reply_id or 0, LATEST_HINT_SECONDS)
+
+
+def clear_latest_reply_id(message_id):
+    cache.delete(_latest_key(message_id))
+
+
+def latest_reply_id(message_id):
+    """Id of the newest reply in a thread (0 for an empty thread), at most LATEST_HINT_SECONDS old."""
+    latest = cache.get(_latest_key(message_id))
+    if latest is None:
+        latest = _latest_query(message_id)
+        set_latest_reply_id(message_id, latest)
+    return latest
+
+
+async def alatest_reply_id(message_id):
+    """latest_reply_id for async views."""
+    latest = await cache.aget(_latest_key(message_id))
+    if latest is None:
+        latest = (await MessageReply.objects.filter(message_id=message_id).aaggregate(latest=Max('id')))['latest'] or 0
+        await cache.aset(_latest_key(message_id), latest, LATEST_HINT_SECONDS)
+    return latest
+
+
+def replies_since(message_id, since=0):
+    return (
+        MessageReply.objects.filter(message_id=message_id, id__gt=since)
+        .select_related('user')
+        .only('id', 'content', 'is_admin', 'created_at', 'user__first_name', 'user__username')
+        .order_by('id')
+    )
+
+
+def serialize_reply(reply):
+    user_name = "Unknown"
+    if reply.is_admin:
+        user_name = "Support Team"
+    elif reply.user:
+        user_name = reply.user.first_name or reply.user.username
+
+    return {
+        'id': reply.id,
+        'user': user_name,
+        'content': reply.content,
+        'is_admin': reply.is_admin,
+        'created_at': reply.created_at.strftime("%b %d, %Y %I:%M %p"),
+    }
+
+
+def parse_cursor(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+async def stream_replies(message_id, since):
+    """
+    Server-sent events for a chat thread.
+
+    Waits on the latest-reply id and only loads replies when it moves, so while the
+    thread is quiet an open chat tab costs one indexed MAX(id) every LATEST_HINT_SECONDS.
+    """
+    yield 'retry: 3000\n\n'
+    waited = 0
+    idle = 0
+    while waited < CHAT_STREAM_TIMEOUT:
+        latest = await alatest_reply_id(message_id)
+        if latest > since:
+            replies = [serialize_reply(reply) async for reply in replies_since(message_id, since)]
+            if replies:
+                since = replies[-1]['id']
+                yield f'id: {since}\nevent: replies\ndata: {json.dumps({"replies": replies, "cursor": since})}\n\n'
+                idle = 0
+        elif idle >= CHAT_STREAM_HEARTBEAT:
+            yield ': keep-alive\n\n'
+            idle = 0
+        await asyncio.sleep(CHAT_STREAM_INTERVAL)
+        waited += CHAT_STREAM_INTERVAL
+        idle += CHAT_STREAM_INTERVAL
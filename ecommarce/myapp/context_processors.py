@@ -0,0 +1,27 @@
+from functools import partial
+
+from .cart import GuestCart, get_cart_summary
+from .page_cache import catalog_version, normalized_query, page_cache_timeout
+
+
+def cart_summary(request):
+    """
+    Expose the cached cart item count and subtotal to every template as ``cart_summary``.
+
+    Guests get the line count of their cookie cart (no subtotal, so no query).
+    """
+    if not request.user.is_authenticated:
+        return {'cart_summary': {'count': len(GuestCart(request)), 'subtotal': None}}
+    return {'cart_summary': get_cart_summary(request.user)}
+
+
+def catalog_cache(request):
+    """
+    Keys for ``{% cache %}`` fragments of catalog data: they expire when the catalog version moves.
+    The version is a callable, read only by templates that have such fragments.
+    """
+    return {
+        'catalog_version': partial(catalog_version, request),
+        'catalog_query': normalized_query(request),
+        'fragment_cache_timeout': page_cache_timeout(),
+    }
@@ -0,0 +1,170 @@
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
+
+from .models import Category, Order, OrderItem, Product, Review, StoreCounter
+from .page_cache import bump_catalog_version_on_commit
+
+REVENUE_STATUSES = ('shipped', 'delivered')
+
+MODEL_COUNTERS = {
+    Product: 'total_products',
+    Category: 'total_categories',
+    User: 'total_users',
+}
+
+COUNTER_NAMES = ('total_products', 'total_orders', 'total_users', 'total_categories', 'pending_orders', 'total_revenue')
+
+
+def increment(name, delta):
+    if not delta:
+        return
+    with transaction.atomic():
+        updated = StoreCounter.objects.filter(name=name).update(value=F('value') + delta)
+        if not updated:
+            # First write for this counter: seed it with the exact value instead of the delta.
+            StoreCounter.objects.get_or_create(name=name, defaults={'value': compute_counters()[name]})
+
+
+def apply_order_change(old_status, old_total, new_status, new_total, orders=0):
+    """Apply the counter deltas for an order moving from (old_status, old_total) to (new_status, new_total)."""
+    increment('total_orders', orders)
+    increment('pending_orders', (new_status == 'pending') - (old_status == 'pending'))
+    old_revenue = old_total if old_status in REVENUE_STATUSES else 0
+    new_revenue = new_total if new_status in REVENUE_STATUSES else 0
+    increment('total_revenue', Decimal(new_revenue or 0) - Decimal(old_revenue or 0))
+
+
+def apply_review_change(old, new):
+    """
+    Move a review's share of its product's rating from ``old`` to ``new``, each a
+    (product_id, rating) pair or None for an unapproved (or missing) review.
+    """
+    if old == new:
+        return
+    changes = {}
+    for key, sign in ((old, -1), (new, 1)):
+        if key is not None:
+            product_id, rating = key
+            ratings, count = changes.get(product_id, (0, 0))
+            changes[product_id] = (ratings + sign * rating, count + sign)
+    for product_id, (ratings, count) in changes.items():
+        # One UPDATE, so concurrent reviews of the same product add up instead of racing
+        total = F('rating_sum') + ratings
+        n = F('rating_count') + count
+        Product.objects.filter(id=product_id, rating_sum__gte=-ratings, rating_count__gte=-count).update(
+            rating_sum=total, rating_count=n, rating_avg=_rating_avg(total, n),
+        )
+    bump_catalog_version_on_commit()
+
+
+def _rating_avg(total, count):
+    return Case(
+        When(GreaterThan(count, 0), then=Cast(total, FloatField()) / Cast(count, FloatField())),
+        default=Value(0.0),
+    )
+
+
+def compute_counters():
+    """Exact values, straight from the tables. Used to seed and reconcile the counters."""
+    orders = Order.objects.aggregate(
+        total_orders=Count('id'),
+        pending_orders=Count('id', filter=Q(status='pending')),
+        total_revenue=Sum('total_amount', filter=Q(status__in=REVENUE_STATUSES)),
+    )
+    return {
+        'total_products': Product.objects.count(),
+        'total_categories': Category.objects.count(),
+        'total_users': User.objects.count(),
+        'total_orders': orders['total_orders'],
+        'pending_orders': orders['pending_orders'],
+        'total_revenue': orders['total_revenue'] or Decimal('0.00'),
+    }
+
+
+def reconcile_counters():
+    """Overwrite every counter with its exact value; returns {name: (stored, exact)} for the ones that drifted."""
+    with transaction.atomic():
+        exact = compute_counters()
+        stored = dict(StoreCounter.objects.select_for_update().values_list('name', 'value'))
+        drift = {
+            name: (stored.get(name), value)
+            for name, value in exact.items()
+            if stored.get(name) != value
+        }
+        for name, value in exact.items():
+            StoreCounter.objects.update_or_create(name=name, defaults={'value': value})
+    return drift
+
+
+def get_counters():
+    """All storefront counters in one query; counts come back as ints, revenue as a Decimal."""
+    values = dict(StoreCounter.objects.filter(name__in=COUNTER_NAMES).values_list('name', 'value'))
+    if len(values) < len(COUNTER_NAMES):
+        values = {**compute_counters(), **values}
+    return _typed(values)
+
+
+async def aget_counters():
+    """get_counters for async views."""
+    rows = StoreCounter.objects.filter(name__in=COUNTER_NAMES).values_list('name', 'value')
+    values = {name: value async for name, value in rows}
+    if len(values) < len(COUNTER_NAMES):
+        values = {**await sync_to_async(compute_counters)(), **values}
+    return _typed(values)
+
+
+def _typed(values):
+    return {
+        name: (values[name] if name == 'total_revenue' else int(values[name]))
+        for name in COUNTER_NAMES
+    }
+
+
+def _count_of(model, field):
+    """Correlated subquery counting ``model`` rows whose ``field`` points at the outer row."""
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('id')).values('n')
+    return Coalesce(Subquery(rows), 0)
+
+
+def repair_denormalized_counts():
+    """
+    Recompute Category.product_count and Order.item_count in bulk, one UPDATE per table
+    touching only the rows that drifted. Returns (categories_fixed, orders_fixed).
+    """
+    with transaction.atomic():
+        categories = (
+            Category.objects.annotate(exact=_count_of(Product, 'category'))
+            .exclude(product_count=F('exact'))
+            .update(product_count=_count_of(Product, 'category'))
+        )
+        orders = (
+            Order.objects.annotate(exact=_count_of(OrderItem, 'order'))
+            .exclude(item_count=F('exact'))
+            .update(item_count=_count_of(OrderItem, 'order'))
+        )
+    return categories, orders
+
+
+def recompute_ratings():
+    """
+    Recompute Product.rating_sum/rating_count/rating_avg from the approved reviews in
+    bulk, touching only the products that drifted. Returns the number corrected.
+    """
+    approved = Review.objects.filter(product=OuterRef('pk'), is_approved=True).order_by().values('product')
+    total = Coalesce(Subquery(approved.annotate(s=Sum('rating')).values('s')), 0)
+    count = Coalesce(Subquery(approved.annotate(n=Count('id')).values('n')), 0)
+    with transaction.atomic():
+        fixed = (
+            Product.objects.annotate(exact_sum=total, exact_count=count)
+            .exclude(rating_sum=F('exact_sum'), rating_count=F('exact_count'))
+            .update(rating_sum=total, rating_count=count, rating_avg=_rating_avg(total, count))
+        )
+    if fixed:
+        bump_catalog_version_on_commit()
+    return fixed
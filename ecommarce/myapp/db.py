@@ -0,0 +1,67 @@
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Applied to every new SQLite connection; override or extend with settings.SQLITE_PRAGMAS.
+# journal_mode=WAL (readers never wait for the writer) is stored in the database file,
+# so migration 0016_sqlite_wal sets it once instead.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,       # ms a writer waits for the lock before "database is locked"
+    'synchronous': 'NORMAL',    # durable in WAL mode; fsync at checkpoints only
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+LOCK_ERRORS = ('database is locked', 'database table is locked')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created receiver that applies SQLITE_PRAGMAS to SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = {**SQLITE_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_lock_error(exc):
+    return isinstance(exc, OperationalError) and any(message in str(exc) for message in LOCK_ERRORS)
+
+
+def retry_on_lock(func=None, *, attempts=5, base_delay=0.05, max_delay=1.0):
+    """
+    Run a write in a transaction and retry it when SQLite reports a lock.
+
+    busy_timeout and IMMEDIATE transactions absorb ordinary contention; this is the
+    backstop for lock waits that still time out under a burst. The transaction is
+    rolled back and ``func`` re-run after an exponential, jittered backoff, at most
+    ``attempts`` times. Inside an outer transaction ``func`` simply runs once.
+
+    Wrap only the writing part of a view (``retry_on_lock(item.save)()``, or a
+    decorated inner function), never the whole view. IMMEDIATE transactions take
+    the write lock at BEGIN, so a GET would queue behind writers. Add messages
+    after the write returns, or a retried attempt repeats them.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            if connection.in_atomic_block:
+                return func(*args, **kwargs)
+            for attempt in range(attempts):
+                try:
+                    with transaction.atomic():
+                        return func(*args, **kwargs)
+                except OperationalError as e:
+                    if not is_lock_error(e) or attempt == attempts - 1:
+                        raise
+                    delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    logger.warning('%s: %s, retrying in %.0f ms', func.__name__, e, delay * 1000)
+                    time.sleep(delay)
+        return wrapped
+    return decorator(func) if func is not None else decorator
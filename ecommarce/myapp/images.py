@@ -0,0 +1,109 @@
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Width in pixels of each derivative; images are never upscaled
+IMAGE_SIZES = {
+    'thumb': 150,
+    'card': 400,
+    'detail': 800,
+}
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVES_DIR = 'derivatives'
+
+
+def derivative_name(name, size, ext):
+    """products/foo.png -> derivatives/products/foo/card.webp"""
+    root, _ = posixpath.splitext(name)
+    return posixpath.join(DERIVATIVES_DIR, root, f'{size}.{ext}')
+
+
+def has_derivatives(name):
+    # The last file generate_derivatives writes doubles as a completion marker.
+    last_size = list(IMAGE_SIZES)[-1]
+    last_ext = list(IMAGE_FORMATS)[-1]
+    return bool(name) and default_storage.exists(derivative_name(name, last_size, last_ext))
+
+
+def generate_derivatives(name, force=False):
+    """
+    Write every size/format derivative of the image stored at ``name`` and record
+    them on the rows using it. Up-to-date derivatives are skipped unless ``force``. Returns the number of files written.
+    """
+    if not name or not default_storage.exists(name):
+        return 0
+    written = 0 if not force and _up_to_date(name) else _write_derivatives(name)
+    record_derivatives(name)
+    return written
+
+
+def _up_to_date(name):
+    if not has_derivatives(name):
+        return False
+    try:
+        marker = derivative_name(name, list(IMAGE_SIZES)[-1], list(IMAGE_FORMATS)[-1])
+        return default_storage.get_modified_time(marker) >= default_storage.get_modified_time(name)
+    except NotImplementedError:
+        return True
+
+
+def _write_derivatives(name):
+    with default_storage.open(name, 'rb') as f:
+        original = Image.open(f)
+        original.load()
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', original.size, (255, 255, 255))
+        rgba = original.convert('RGBA')
+        background.paste(rgba, mask=rgba.split()[-1])
+        original = background
+
+    written = 0
+    for size, width in IMAGE_SIZES.items():
+        image = original.copy()
+        if image.width > width:
+            image.thumbnail((width, width * 10), Image.LANCZOS)
+        for ext, (fmt, options) in IMAGE_FORMATS.items():
+            buffer = BytesIO()
+            image.convert('RGB').save(buffer, fmt, **options)
+            target = derivative_name(name, size, ext)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+            written += 1
+    return written
+
+
+def record_derivatives(name):
+    """
+    Mark the products and categories showing ``name`` as having derivatives, so
+    responsive_image can use them without asking the storage on every render.
+    """
+    from .models import Category, Product
+    from .page_cache import bump_catalog_version
+    updated = 0
+    for model in (Product, Category):
+        updated += model.objects.filter(image=name).exclude(image_derivatives=name).update(image_derivatives=name)
+    if updated:
+        # Cached pages still hold the plain <img> fallback
+        bump_catalog_version()
+
+
+def schedule_derivatives(name):
+    """Queue derivative generation for ``name`` on the background workers, off the request path."""
+    if name:
+        from .jobs import enqueue
+        enqueue('generate_image_derivatives', {'name': name})
+
+
+def srcset(name, ext):
+    return ', '.join(
+        f'{default_storage.url(derivative_name(name, size, ext))} {width}w'
+        for size, width in IMAGE_SIZES.items()
+    )
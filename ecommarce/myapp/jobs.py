@@ -0,0 +1,150 @@
+"""
+Background jobs stored in the application database, run by ``manage.py run_workers``.
+
+    enqueue('send_mail', {'subject': ..., 'message': ..., 'recipient_list': [...]})
+
+A job enqueued inside a transaction commits or rolls back with it, so a view
+retried by retry_on_lock never leaves a stray job behind. Workers claim a job
+with a conditional UPDATE on (id, status, attempts): of several processes racing
+for the same row exactly one update matches, so a job is delivered once. A
+claimed job holds a lease of JOB_LEASE_SECONDS; if its worker dies the job is
+handed out again after the lease expires, which is the only way it can run
+twice. Finished jobs are deleted. Failures are retried with exponential,
+jittered backoff and kept as dead-letter rows (status 'dead') once
+``max_attempts`` is spent; ``requeue_dead`` puts them back in the queue.
+
+Handlers are plain functions taking the payload as keyword arguments,
+registered with ``@handler``.
+"""
+import datetime
+import logging
+import random
+import traceback
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+# Due jobs a worker tries to claim per query before looking again
+CLAIM_CANDIDATES = 10
+
+
+def lease_seconds():
+    return getattr(settings, 'JOB_LEASE_SECONDS', 300)
+
+
+def retry_delay(attempt):
+    """Seconds before retrying a job that just failed its ``attempt``-th run."""
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 10)
+    limit = getattr(settings, 'JOB_RETRY_MAX_DELAY', 60 * 60)
+    return min(limit, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+
+def handler(func=None, *, name=None):
+    """Register ``func`` as the handler for jobs called ``name`` (default: the function name)."""
+    def register(func):
+        HANDLERS[name or func.__name__] = func
+        return func
+    return register(func) if func else register
+
+
+def enqueue(name, payload=None, *, delay=0, max_attempts=None):
+    """Queue a job; it runs no earlier than ``delay`` seconds from now."""
+    if name not in HANDLERS:
+        raise ValueError(f'Unknown job {name!r}.')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=timezone.now() + datetime.timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def claim(worker):
+    """Claim the next due job for ``worker``, or return None when there is none."""
+    now = timezone.now()
+    expired = now - datetime.timedelta(seconds=lease_seconds())
+    due = Job.objects.filter(Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=expired))
+    while candidates := list(due.order_by('run_at', 'id').values_list('id', 'status', 'attempts')[:CLAIM_CANDIDATES]):
+        for job_id, status, attempts in candidates:
+            claimed = Job.objects.filter(id=job_id, status=status, attempts=attempts).update(
+                status='running', attempts=attempts + 1, locked_by=worker, locked_at=now,
+            )
+            if claimed:
+                return Job.objects.get(id=job_id)
+        # Other workers won every candidate; look again
+    return None
+
+
+def run_job(job):
+    """Run a claimed job, then delete it, schedule a retry or dead-letter it. Returns True on success."""
+    # Every update is conditional on still holding the claim, so a worker whose lease
+    # expired cannot overwrite the outcome of the worker that took the job over.
+    mine = Job.objects.filter(id=job.id, status='running', attempts=job.attempts, locked_by=job.locked_by)
+    try:
+        if job.attempts > job.max_attempts:
+            raise RuntimeError('Lease expired on the last attempt (worker lost).')
+        func = HANDLERS.get(job.name)
+        if func is None:
+            raise LookupError(f'No handler registered for {job.name!r}.')
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s %s failed for good after %d attempts', job.id, job.name, job.attempts)
+            mine.update(status='dead', locked_by='', locked_at=None, last_error=error)
+        else:
+            delay = retry_delay(job.attempts)
+            logger.warning('Job %s %s failed, retrying in %.0f s', job.id, job.name, delay)
+            mine.update(
+                status='queued', locked_by='', locked_at=None, last_error=error,
+                run_at=timezone.now() + datetime.timedelta(seconds=delay),
+            )
+        return False
+    mine.delete()
+    return True
+
+
+def run_pending(worker='inline'):
+    """Run every job that is due now, one after another. Returns the number of jobs run."""
+    count = 0
+    while (job := claim(worker)) is not None:
+        run_job(job)
+        count += 1
+    return count
+
+
+def requeue_dead(**filters):
+    """Give dead-letter jobs (optionally filtered, e.g. ``name=...``) a fresh set of attempts."""
+    return Job.objects.filter(status='dead', **filters).update(
+        status='queued', attempts=0, run_at=timezone.now(), last_error='',
+    )
+
+
+@handler
+def send_mail(subject, message, recipient_list, from_email=None):
+    from django.core.mail import send_mail
+    send_mail(subject, message, from_email or settings.DEFAULT_FROM_EMAIL, recipient_list)
+
+
+@handler
+def generate_image_derivatives(name):
+    from .images import generate_derivatives
+    generate_derivatives(name)
+
+
+@handler
+def reconcile_counters():
+    from .counters import reconcile_counters
+    reconcile_counters()
+
+
+@handler
+def build_related_products(full=False):
+    from .recommendations import RelatedProductsBuilder
+    RelatedProductsBuilder().run(full=full)
@@ -0,0 +1,252 @@
+"""
+Load-test harness behind ``manage.py loadtest``.
+
+The WSGI application is served on a local port (in a forked process where the
+platform allows it, so clients and server do not share a GIL) and many client
+threads replay a weighted mix of storefront requests as logged-in customers.
+Every response carries the number of queries it ran, so the report can show
+throughput, latency percentiles and queries per request for each URL name.
+"""
+import http.client
+import json
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from http.cookies import SimpleCookie
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.contrib.auth.models import User
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .counters import reconcile_counters, repair_denormalized_counts
+from .middleware import QueryRecorder
+from .models import Category, ContactMessage, MessageReply, Product
+from .search import get_search_backend
+
+DEFAULT_MIX = {
+    'shop': 40,
+    'product_detail': 30,
+    'add_to_cart': 12,
+    'checkout': 3,
+    'get_chat_messages': 15,
+}
+QUERY_COUNT_HEADER = 'X-Load-Test-Queries'
+PERCENTILES = (50, 95, 99)
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def counting_application(application):
+    """Wrap a WSGI app so every response reports how many queries it ran."""
+    def app(environ, start_response):
+        recorder = QueryRecorder()
+
+        def counted_start_response(status, headers, exc_info=None):
+            return start_response(status, [*headers, (QUERY_COUNT_HEADER, str(recorder.count))], exc_info)
+
+        with connection.execute_wrapper(recorder):
+            return application(environ, counted_start_response)
+    return app
+
+
+class LocalServer:
+    """The project's WSGI app on 127.0.0.1 and a free port."""
+
+    def __init__(self):
+        self.httpd = make_server(
+            '127.0.0.1', 0, counting_application(get_wsgi_application()),
+            server_class=_ThreadingWSGIServer, handler_class=_QuietHandler,
+        )
+        self.port = self.httpd.server_port
+        self.process = self.thread = None
+
+    def __enter__(self):
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # The child must open its own database connections
+            connections.close_all()
+            self.process = multiprocessing.get_context('fork').Process(target=self.httpd.serve_forever, daemon=True)
+            self.process.start()
+        else:
+            self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.process:
+            self.process.terminate()
+            self.process.join()
+        else:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def seed_data(clients, products=200, categories=10, seed=0):
+    """
+    Deterministic catalog plus one customer per client, each with a session and a
+    chat thread. Returns a list of dicts with each client's cookies and thread id.
+    """
+    rng = random.Random(seed)
+    category_objs = [Category.objects.create(name=f'Category {i}', description='Load test') for i in range(categories)]
+    Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}', description=f'Load test product {i}', price=rng.randint(100, 50000) / 100,
+            stock=10 ** 6, category=rng.choice(category_objs),
+        )
+        for i in range(products)
+    ])
+    sessions = []
+    for i in range(clients):
+        user = User.objects.create_user(f'loadtest{i}', f'loadtest{i}@example.com', 'loadtest')
+        thread = ContactMessage.objects.create(user=user, name=user.username, email=user.email, subject='Load test', message='Hello')
+        MessageReply.objects.bulk_create([
+            MessageReply(message=thread, user=user, content=f'Reply {n}', is_admin=n % 2 == 1) for n in range(5)
+        ])
+        client = Client()
+        client.force_login(user)
+        sessions.append({
+            'cookies': {'sessionid': client.cookies['sessionid'].value, 'csrftoken': get_random_string(32)},
+            'thread_id': thread.id,
+        })
+    # bulk_create skipped the Product signals
+    repair_denormalized_counts()
+    reconcile_counters()
+    get_search_backend().rebuild()
+    return sessions
+
+
+class LoadClient:
+    """One simulated customer: keeps its cookies and picks requests from the mix."""
+
+    def __init__(self, port, session, product_ids, mix, seed):
+        self.port = port
+        self.cookies = dict(session['cookies'])
+        self.thread_id = session['thread_id']
+        self.product_ids = product_ids
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.rng = random.Random(seed)
+        self.since = 0
+
+    def next_request(self):
+        """(url name, method, path, form data) for the next request in the mix."""
+        name = self.rng.choices(self.names, self.weights)[0]
+        if name == 'shop':
+            query = {'sort': self.rng.choice(['newest', 'price_low', 'price_high', 'name'])}
+            return name, 'GET', f"{reverse('shop')}?{urlencode(query)}", None
+        if name == 'product_detail':
+            return name, 'GET', reverse(name, args=[self.rng.choice(self.product_ids)]), None
+        if name == 'add_to_cart':
+            return name, 'POST', reverse(name, args=[self.rng.choice(self.product_ids)]), {'quantity': 1}
+        if name == 'checkout':
+            return name, 'POST', reverse(name), {'payment_method': 'cod', 'shipping_address': 'Load test', 'phone': '0100000000'}
+        if name == 'get_chat_messages':
+            return name, 'GET', f"{reverse(name, args=[self.thread_id])}?since={self.since}", None
+        return name, 'GET', reverse(name), None
+
+    def send(self, method, path, data):
+        """Send one request; returns (status, queries, body)."""
+        headers = {
+            'Host': 'localhost',
+            'Cookie': '; '.join(f'{k}={v}' for k, v in self.cookies.items()),
+        }
+        body = None
+        if method == 'POST':
+            body = urlencode(data or {})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+            headers['Referer'] = f'http://localhost{path}'
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            content = response.read()
+        finally:
+            conn.close()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for key, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0' or not morsel.value:
+                    self.cookies.pop(key, None)
+                else:
+                    self.cookies[key] = morsel.coded_value
+        return response.status, int(response.getheader(QUERY_COUNT_HEADER, -1)), content
+
+    def run(self, deadline, samples):
+        while time.perf_counter() < deadline:
+            name, method, path, data = self.next_request()
+            start = time.perf_counter()
+            try:
+                status, queries, content = self.send(method, path, data)
+            except OSError:
+                status, queries, content = 0, -1, b''
+            samples.append((name, time.perf_counter() - start, status, queries))
+            if name == 'get_chat_messages' and status == 200:
+                # Poll like the chat page does: only ask for replies newer than the last one seen
+                self.since = json.loads(content)['cursor']
+
+
+def run_load(port, sessions, product_ids, mix, duration, warmup=0, seed=0):
+    """Run one client thread per session for ``duration`` seconds; returns (samples, elapsed)."""
+    clients = [LoadClient(port, session, product_ids, mix, f'{seed}-{i}') for i, session in enumerate(sessions)]
+    if warmup:
+        _run_clients(clients, warmup)
+    return _run_clients(clients, duration)
+
+
+def _run_clients(clients, duration):
+    samples = []
+    start = time.perf_counter()
+    deadline = start + duration
+    threads = [threading.Thread(target=client.run, args=(deadline, samples)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def percentile(sorted_values, pct):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method='inclusive')[pct - 1]
+
+
+def summarize(samples, elapsed):
+    """Per URL name and overall: requests, errors, req/s, latency percentiles (ms), queries per request."""
+    groups = {}
+    for name, latency, status, queries in samples:
+        groups.setdefault(name, []).append((latency, status, queries))
+    groups['TOTAL'] = [(latency, status, queries) for _, latency, status, queries in samples]
+
+    report = {}
+    for name, rows in groups.items():
+        if not rows:
+            continue
+        latencies = sorted(latency * 1000 for latency, _, _ in rows)
+        queries = [q for _, _, q in rows if q >= 0]
+        report[name] = {
+            'requests': len(rows),
+            'errors': sum(1 for _, status, _ in rows if status == 0 or status >= 500),
+            'rps': round(len(rows) / elapsed, 2),
+            **{f'p{pct}_ms': round(percentile(latencies, pct), 2) for pct in PERCENTILES},
+            'mean_ms': round(statistics.fmean(latencies), 2),
+            'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+            'statuses': dict(sorted(Counter(str(status) for _, status, _ in rows).items())),
+        }
+    return report
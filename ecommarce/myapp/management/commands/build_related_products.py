@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from myapp.recommendations import RelatedProductsBuilder
+
+
+class Command(BaseCommand):
+    help = (
+        'Add the orders placed since the last run to the co-purchase counts and refresh the '
+        '"frequently bought together" neighbours of the products they touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Forget the counts and rebuild from every order.')
+        parser.add_argument('--top-k', type=int, help='Neighbours kept per product (default RELATED_PRODUCTS_TOP_K, 8).')
+        parser.add_argument(
+            '--wishlist-weight', type=float, default=0,
+            help='Also count products wishlisted by the same customer, at this weight per customer (0 = off).',
+        )
+        parser.add_argument('--batch-size', type=int, default=20000, help='Orders added per transaction.')
+
+    def handle(self, *args, **options):
+        builder = RelatedProductsBuilder(
+            top_k=options['top_k'], wishlist_weight=options['wishlist_weight'], batch_size=options['batch_size'],
+        )
+        orders, ranked = builder.run(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {orders} orders, refreshed the neighbours of {ranked} products.'
+        ))
@@ -0,0 +1,111 @@
+import os
+import posixpath
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.validators import get_available_image_extensions
+from PIL import Image
+
+from myapp.images import DERIVATIVES_DIR
+from myapp.models import Category, Product
+
+QUARANTINE_DIR = '_quarantine'
+
+
+def check_file(name, decode=True):
+    """Return None if the file under MEDIA_ROOT is fine, else a short description of the problem."""
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    if not os.path.isfile(path):
+        return 'MISSING'
+    if decode:
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except Exception as e:
+            return f'CORRUPT ({e})'
+    return None
+
+
+def walk_media(root, skip):
+    """Yield every file under ``root`` as a path relative to it, skipping the top-level dirs in ``skip``."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if directory == root and entry.name in skip:
+                        continue
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield os.path.relpath(entry.path, root).replace(os.sep, '/')
+
+
+class Command(BaseCommand):
+    help = 'Report missing, corrupt and orphaned product/category images under MEDIA_ROOT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--no-decode', action='store_true', help='Only check that files exist, do not decode them.')
+        parser.add_argument('--quarantine', action='store_true',
+                            help=f'Move orphaned images and derivatives into MEDIA_ROOT/{QUARANTINE_DIR}/.')
+
+    def handle(self, *args, **options):
+        media_root = str(settings.MEDIA_ROOT)
+        decode = not options['no_decode']
+
+        # image name -> owning rows; rows are streamed rather than loaded as model instances
+        owners = {}
+        for model in (Product, Category):
+            rows = (
+                model.objects.exclude(image='').exclude(image__isnull=True)
+                .values_list('id', 'image').iterator(chunk_size=5000)
+            )
+            for pk, name in rows:
+                owners.setdefault(name, []).append(f'{model.__name__} #{pk}')
+
+        missing = corrupt = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = pool.map(lambda name: check_file(name, decode), owners)
+            for name, problem in zip(owners, results):
+                if problem is None:
+                    continue
+                if problem == 'MISSING':
+                    missing += 1
+                else:
+                    corrupt += 1
+                self.stdout.write(f'{problem}: {name} ({", ".join(owners[name])})')
+
+        # Only image files can be orphans: .gitkeep and other placeholders are left alone.
+        # A derivative (derivatives/<image name without extension>/<size>.<ext>) is
+        # orphaned once no row references its source image.
+        image_extensions = {f'.{ext}' for ext in get_available_image_extensions()}
+        owned_roots = {posixpath.splitext(name)[0] for name in owners}
+        orphans = []
+        if os.path.isdir(media_root):
+            for name in walk_media(media_root, skip={QUARANTINE_DIR}):
+                if posixpath.splitext(name)[1].lower() not in image_extensions:
+                    continue
+                if name.startswith(f'{DERIVATIVES_DIR}/'):
+                    orphaned = posixpath.dirname(name[len(DERIVATIVES_DIR) + 1:]) not in owned_roots
+                else:
+                    orphaned = name not in owners
+                if orphaned:
+                    orphans.append(name)
+                    self.stdout.write(f'ORPHAN: {name}')
+
+        if options['quarantine']:
+            for name in orphans:
+                target = os.path.join(media_root, QUARANTINE_DIR, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(os.path.join(media_root, name), target)
+            if orphans:
+                self.stdout.write(f'Moved {len(orphans)} orphaned files to {os.path.join(media_root, QUARANTINE_DIR)}')
+
+        summary = f'{len(owners)} images checked: {missing} missing, {corrupt} corrupt, {len(orphans)} orphaned.'
+        if missing or corrupt or orphans:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from myapp.product_io import FORMATS, detect_format, export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = 'Write every product to a CSV or JSONL file in the format import_products reads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file, or '-' (the default) for standard output.")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension (.jsonl/.ndjson, else CSV).')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else detect_format(path))
+        rows = export_rows(chunk_size=options['chunk_size'])
+        if path == '-':
+            write_rows(self.stdout, fmt, rows)
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            count = write_rows(f, fmt, rows)
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} products to {path}.'))
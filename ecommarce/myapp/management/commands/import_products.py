@@ -0,0 +1,43 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.product_io import FORMATS, ProductImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create or update products in bulk from a CSV or JSONL file (rows with an existing id are updated).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, or '-' for standard input.")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension (.jsonl/.ndjson, else CSV).')
+        parser.add_argument('--images', help='Directory the image column is relative to; files are copied into media.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-create-categories', action='store_true', help='Reject rows whose category does not exist.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else detect_format(path))
+        importer = ProductImporter(
+            image_dir=options['images'],
+            batch_size=options['batch_size'],
+            create_categories=not options['no_create_categories'],
+        )
+        try:
+            if path == '-':
+                importer.run(read_rows(sys.stdin, fmt))
+            else:
+                with open(path, newline='', encoding='utf-8') as f:
+                    importer.run(read_rows(f, fmt))
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(e)
+
+        for line_number, error in importer.errors:
+            self.stderr.write(f'line {line_number}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported products: {importer.created} created, {importer.updated} updated, '
+            f'{importer.images} images attached, {len(importer.errors)} rows skipped.'
+        ))
+        if importer.images:
+            self.stdout.write('Run `manage.py generate_image_derivatives` to build the resized images.')
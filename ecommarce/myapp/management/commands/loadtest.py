@@ -0,0 +1,118 @@
+import json
+import os
+import platform
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from myapp.loadtest import DEFAULT_MIX, PERCENTILES, LocalServer, run_load, seed_data, summarize
+from myapp.models import Product
+
+
+def parse_mix(value):
+    """'shop=40,product_detail=30' -> {'shop': 40, 'product_detail': 30}"""
+    try:
+        mix = {name.strip(): int(weight) for name, weight in (part.split('=') for part in value.split(','))}
+    except ValueError:
+        raise CommandError(f'Invalid --mix {value!r}, expected name=weight,name=weight...')
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown:
+        raise CommandError(f'Unknown URL names in --mix: {", ".join(sorted(unknown))}.')
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the app locally against a throwaway seeded database, replay a weighted request mix '
+        'from many concurrent clients and report throughput, latency percentiles and queries per '
+        'request for each URL name.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=20, help='Seconds of measured load.')
+        parser.add_argument('--warmup', type=float, default=3, help='Seconds of unmeasured load first.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument(
+            '--mix', type=parse_mix, default=DEFAULT_MIX,
+            help='Weights per URL name, default: ' + ','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+        )
+        parser.add_argument('--output', help='Where to save the JSON results (default loadtest-<time>.json).')
+        parser.add_argument('--baseline', help='Earlier results to compare against.')
+        parser.add_argument(
+            '--max-regression', type=float, default=0.25,
+            help='Fail when a p95 is this much slower than the baseline (0.25 = 25%%).',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == 'sqlite':
+                # A file, not the in-memory default, so the server process sees the same data
+                connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'loadtest.sqlite3')
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'localhost']):
+                    report = self.run(options)
+            finally:
+                teardown_databases(old_config, verbosity=0)
+
+        results = {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'settings': settings.SETTINGS_MODULE,
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            **{key: options[key] for key in ('clients', 'duration', 'warmup', 'seed', 'products', 'mix')},
+            'urls': report,
+        }
+        output = options['output'] or f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.print_report(report, baseline)
+        self.stdout.write(f'Results saved to {output}')
+        if baseline:
+            self.check_regressions(report, baseline, options['max_regression'])
+
+    def run(self, options):
+        self.stdout.write(f"Seeding {options['products']} products and {options['clients']} customers...")
+        sessions = seed_data(options['clients'], products=options['products'], seed=options['seed'])
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        with LocalServer() as server:
+            self.stdout.write(
+                f"Running {options['clients']} clients for {options['duration']}s "
+                f"(after {options['warmup']}s warm-up) against http://127.0.0.1:{server.port}/"
+            )
+            samples, elapsed = run_load(
+                server.port, sessions, product_ids, options['mix'],
+                options['duration'], options['warmup'], options['seed'],
+            )
+        return summarize(samples, elapsed)
+
+    def print_report(self, report, baseline=None):
+        columns = ['requests', 'errors', 'rps', *(f'p{p}_ms' for p in PERCENTILES), 'queries_per_request']
+        width = max(len(name) for name in report) + 2
+        self.stdout.write('url'.ljust(width) + ''.join(c.replace('_per_request', '/req').rjust(12) for c in columns))
+        for name, row in sorted(report.items(), key=lambda item: item[0] == 'TOTAL'):
+            cells = ''.join(str(row[c] if row[c] is not None else '-').rjust(12) for c in columns)
+            before = (baseline or {}).get('urls', {}).get(name)
+            change = f"   p95 {row['p95_ms'] / before['p95_ms']:.2f}x" if before and before['p95_ms'] else ''
+            self.stdout.write(name.ljust(width) + cells + change)
+
+    def check_regressions(self, report, baseline, threshold):
+        slower = [
+            f"{name}: p95 {before['p95_ms']}ms -> {report[name]['p95_ms']}ms"
+            for name, before in baseline.get('urls', {}).items()
+            if name in report and before['p95_ms'] and report[name]['p95_ms'] > before['p95_ms'] * (1 + threshold)
+        ]
+        if slower:
+            raise CommandError('Latency regressions against the baseline:\n' + '\n'.join(slower))
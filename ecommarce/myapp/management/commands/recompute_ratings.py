@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from myapp.counters import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized Product rating columns from the approved reviews.'
+
+    def handle(self, *args, **options):
+        fixed = recompute_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Ratings recomputed ({fixed} products corrected).'))
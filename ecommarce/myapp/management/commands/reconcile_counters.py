@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from myapp.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the storefront counters from the tables and fix any drift.'
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters()
+        for name, (stored, exact) in sorted(drift.items()):
+            self.stdout.write(f'{name}: {stored} -> {exact}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Counters reconciled ({len(drift)} corrected).'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from myapp.counters import repair_denormalized_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized Category.product_count and Order.item_count columns.'
+
+    def handle(self, *args, **options):
+        categories, orders = repair_denormalized_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Counts repaired ({categories} categories, {orders} orders corrected).'
+        ))
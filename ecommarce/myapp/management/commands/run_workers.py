@@ -0,0 +1,76 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from myapp.jobs import claim, requeue_dead, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs (emails, image derivatives, counter reconciliation) '
+        'with N worker threads. Start it on as many hosts or processes as needed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Worker threads in this process.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of waiting for more.')
+        parser.add_argument('--requeue-dead', action='store_true', help='Put dead-letter jobs back in the queue first.')
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write(f'Requeued {requeue_dead()} dead jobs.')
+
+        self.stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                # Finish the jobs in hand, then exit
+                signal.signal(sig, lambda *_: self.stop.set())
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        self.done = self.failed = 0
+        self.lock = threading.Lock()
+        names = [f'{prefix}:{n}' for n in range(options['concurrency'])]
+        if len(names) == 1:
+            self.work(names[0], options['poll_interval'], options['once'])
+        else:
+            threads = [
+                threading.Thread(target=self.work_in_thread, args=(name, options['poll_interval'], options['once']))
+                for name in names
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS(f'Workers stopped: {self.done} jobs done, {self.failed} failed.'))
+
+    def work_in_thread(self, worker, poll_interval, once):
+        try:
+            self.work(worker, poll_interval, once)
+        finally:
+            connection.close()
+
+    def work(self, worker, poll_interval, once):
+        while not self.stop.is_set():
+            try:
+                job = claim(worker)
+                if job is None:
+                    if once:
+                        return
+                    self.stop.wait(poll_interval)
+                    continue
+                ok = run_job(job)
+            except Exception as e:
+                # Database trouble; the claim (if any) is released when its lease expires
+                self.stderr.write(f'{worker}: {e}')
+                self.stop.wait(poll_interval)
+                continue
+            with self.lock:
+                if ok:
+                    self.done += 1
+                else:
+                    self.failed += 1
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.seeding import PASSWORD, StoreSeeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a deterministic synthetic store (categories, products, customers with carts, orders, '
+        'wishlists, reviews and contact threads). Sizes are totals: running again with larger numbers '
+        'adds only the missing rows. They match a single run with the final sizes as long as the tables '
+        'they point at (categories for products, products for customers) have not grown in between.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--categories', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--customers', type=int, default=10_000)
+        parser.add_argument('--orders', type=float, default=3, help='Average orders per customer.')
+        parser.add_argument('--items', type=int, default=4, help='Most lines per order.')
+        parser.add_argument('--carts', type=float, default=0.3, help='Share of customers with a cart.')
+        parser.add_argument('--wishlist', type=float, default=3, help='Average wishlist entries per customer.')
+        parser.add_argument('--reviews', type=float, default=1, help='Average reviews per customer.')
+        parser.add_argument('--threads', type=float, default=0.2, help='Share of customers with a contact thread.')
+        parser.add_argument('--replies', type=int, default=4, help='Most replies per contact thread.')
+        parser.add_argument('--coupons', type=int, default=50)
+        parser.add_argument('--pages', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-index', action='store_true', help='Skip rebuilding the search index.')
+
+    def handle(self, *args, **options):
+        seeder = StoreSeeder(seed=options['seed'], batch_size=options['batch_size'], log=self.stdout.write)
+        try:
+            seeder.seed_categories(options['categories'])
+            seeder.seed_products(options['products'])
+            seeder.seed_customers(
+                options['customers'],
+                orders=options['orders'], items=options['items'], carts=options['carts'],
+                wishlist=options['wishlist'], reviews=options['reviews'],
+                threads=options['threads'], replies=options['replies'],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        seeder.seed_coupons(options['coupons'])
+        seeder.seed_pages(options['pages'])
+        seeder.finish(index=not options['no_index'])
+
+        created = ', '.join(f'{count} {name}' for name, count in sorted(seeder.created.items())) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(f'Seeded {created}.'))
+        self.stdout.write(f"Seeded customers log in as seed_0000000... with the password '{PASSWORD}'.")
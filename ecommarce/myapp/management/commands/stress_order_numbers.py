@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.order_numbers import next_order_number
+
+
+def _generate(count, threads):
+    """Generate ``count`` numbers on ``threads`` threads and check each thread's are increasing."""
+    def run(n):
+        numbers = [next_order_number() for _ in range(n)]
+        if any(a >= b for a, b in zip(numbers, numbers[1:])):
+            raise AssertionError(f'Order numbers went backwards in process {os.getpid()}')
+        return numbers
+
+    shares = [count // threads + (i < count % threads) for i in range(threads)]
+    with ThreadPoolExecutor(threads) as pool:
+        return [number for numbers in pool.map(run, shares) for number in numbers]
+
+
+class Command(BaseCommand):
+    help = 'Generate order numbers in many processes at once and check that none collide.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 4)
+        parser.add_argument('--threads', type=int, default=2, help='Threads per process.')
+        parser.add_argument('--count', type=int, default=500_000, help='Numbers per process.')
+
+    def handle(self, *args, **options):
+        processes, threads, count = options['processes'], options['threads'], options['count']
+        start = time.perf_counter()
+        seen = set()
+        total = 0
+        # Spawned, not forked: a fork taken while another thread holds a lock (the
+        # logging or DB driver locks, say) can leave the child hung on it for good.
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            for numbers in pool.starmap(_generate, [(count, threads)] * processes):
+                total += len(numbers)
+                seen.update(numbers)
+        elapsed = time.perf_counter() - start
+
+        if len(seen) != total:
+            raise CommandError(f'{total - len(seen)} duplicate order numbers out of {total}.')
+        too_long = [n for n in seen if len(n) > 20]
+        if too_long:
+            raise CommandError(f'{len(too_long)} order numbers longer than 20 characters, e.g. {too_long[0]}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} unique order numbers from {processes} processes x {threads} threads '
+            f'in {elapsed:.1f}s ({total / elapsed:,.0f}/s).'
+        ))
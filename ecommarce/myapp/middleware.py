@@ -0,0 +1,83 @@
+import logging
+import random
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger('myapp.queries')
+
+_IN_LIST = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def sql_template(sql):
+    """Collapse a statement to its shape: parameter lists and inline numbers become placeholders."""
+    return _NUMBER.sub('N', _IN_LIST.sub('IN (...)', sql))
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that records every statement run through it.
+
+    Works without DEBUG (it does not rely on connection.queries), so it is safe to
+    install on sampled production requests:
+
+        with connection.execute_wrapper(recorder):
+            ...
+    """
+
+    def __init__(self):
+        self.templates = Counter()
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.templates[sql_template(sql)] += 1
+
+    def repeated(self, threshold):
+        """Statement shapes run at least ``threshold`` times, most frequent first: likely N+1 loops."""
+        return [(template, count) for template, count in self.templates.most_common() if count >= threshold]
+
+
+class QueryInspectorMiddleware:
+    """
+    Count queries per request and log N+1 patterns together with the view that caused them.
+
+    Settings:
+        QUERY_INSPECTOR_SAMPLE_RATE  fraction of requests inspected (default 1.0 with DEBUG, else 0)
+        QUERY_INSPECTOR_N1_THRESHOLD repeats of one statement shape that count as N+1 (default 5)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_INSPECTOR_SAMPLE_RATE', 1.0 if settings.DEBUG else 0.0)
+        self.threshold = getattr(settings, 'QUERY_INSPECTOR_N1_THRESHOLD', 5)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        for template, count in recorder.repeated(self.threshold):
+            logger.warning('Possible N+1 in %s: %d x %s', view_name, count, template)
+        logger.debug('%s: %d queries in %.1f ms', view_name, recorder.count, recorder.duration * 1000)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+        return response
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def seed_counters(apps, schema_editor):
+    StoreCounter = apps.get_model('myapp', 'StoreCounter')
+    Order = apps.get_model('myapp', 'Order')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    values = {
+        'total_products': apps.get_model('myapp', 'Product').objects.count(),
+        'total_categories': apps.get_model('myapp', 'Category').objects.count(),
+        'total_users': User.objects.count(),
+        'total_orders': Order.objects.count(),
+        'pending_orders': Order.objects.filter(status='pending').count(),
+        'total_revenue': Order.objects.filter(status__in=['shipped', 'delivered']).aggregate(
+            total=Sum('total_amount'))['total'] or 0,
+    }
+    StoreCounter.objects.bulk_create([StoreCounter(name=name, value=value) for name, value in values.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_product_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counts(apps, schema_editor):
+    Category = apps.get_model('myapp', 'Category')
+    Product = apps.get_model('myapp', 'Product')
+    Order = apps.get_model('myapp', 'Order')
+    OrderItem = apps.get_model('myapp', 'OrderItem')
+    products = Product.objects.filter(category=OuterRef('pk')).order_by().values('category').annotate(n=Count('id')).values('n')
+    Category.objects.update(product_count=Coalesce(Subquery(products), 0))
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(n=Count('id')).values('n')
+    Order.objects.update(item_count=Coalesce(Subquery(items), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
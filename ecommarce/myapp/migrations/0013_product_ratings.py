@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:38
+
+from django.db import migrations, models
+from django.db.models import Case, Count, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
+
+
+def populate_ratings(apps, schema_editor):
+    Product = apps.get_model('myapp', 'Product')
+    Review = apps.get_model('myapp', 'Review')
+    approved = Review.objects.filter(product=OuterRef('pk'), is_approved=True).order_by().values('product')
+    total = Coalesce(Subquery(approved.annotate(s=Sum('rating')).values('s')), 0)
+    count = Coalesce(Subquery(approved.annotate(n=Count('id')).values('n')), 0)
+    Product.objects.update(
+        rating_sum=total,
+        rating_count=count,
+        rating_avg=Case(
+            When(GreaterThan(count, 0), then=Cast(total, FloatField()) / Cast(count, FloatField())),
+            default=Value(0.0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_related_products'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['rating_avg', 'rating_count', 'id'], name='product_instock_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['category', 'rating_avg', 'rating_count', 'id'], name='product_cat_rating_idx'),
+        ),
+        migrations.RunPython(populate_ratings, migrations.RunPython.noop),
+    ]
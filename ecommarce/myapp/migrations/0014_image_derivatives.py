@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:09
+
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def has_derivatives(name):
+    # images.has_derivatives as of this migration, copied so later changes there can't break it:
+    # the detail JPEG, written last, marks a complete set.
+    root, _ = posixpath.splitext(name)
+    return default_storage.exists(posixpath.join('derivatives', root, 'detail.jpg'))
+
+
+def record_existing_derivatives(apps, schema_editor):
+    # One storage check per image, here, instead of on every render
+    for model_name in ('Product', 'Category'):
+        model = apps.get_model('myapp', model_name)
+        names = model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True).distinct()
+        for name in list(names):
+            if has_derivatives(name):
+                model.objects.filter(image=name).update(image_derivatives=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_product_ratings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_derivatives',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_derivatives',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(record_existing_derivatives, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:11
+
+from django.db import migrations, models
+
+# Where the cursor used to live
+OLD_CURSOR = 'related_products_last_order'
+
+
+def move_cursor(apps, schema_editor):
+    StoreCounter = apps.get_model('myapp', 'StoreCounter')
+    ProductPairCursor = apps.get_model('myapp', 'ProductPairCursor')
+    old = StoreCounter.objects.filter(name=OLD_CURSOR).first()
+    if old is not None:
+        ProductPairCursor.objects.create(pk=1, last_order_id=int(old.value))
+        old.delete()
+
+
+def restore_cursor(apps, schema_editor):
+    StoreCounter = apps.get_model('myapp', 'StoreCounter')
+    ProductPairCursor = apps.get_model('myapp', 'ProductPairCursor')
+    cursor = ProductPairCursor.objects.filter(pk=1).first()
+    if cursor is not None:
+        StoreCounter.objects.create(name=OLD_CURSOR, value=cursor.last_order_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0014_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPairCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(move_cursor, restore_cursor),
+    ]
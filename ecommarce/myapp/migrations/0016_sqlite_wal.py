@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def set_journal_mode(schema_editor, mode):
+    # Stored in the database file, so it is set once here rather than on every connection
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {mode}')
+
+
+def enable_wal(apps, schema_editor):
+    set_journal_mode(schema_editor, 'WAL')
+
+
+def disable_wal(apps, schema_editor):
+    set_journal_mode(schema_editor, 'DELETE')
+
+
+class Migration(migrations.Migration):
+    # SQLite refuses to change the journal mode inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('myapp', '0015_productpaircursor'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, disable_wal),
+    ]
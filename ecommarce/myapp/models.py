@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Sum
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .order_numbers import next_order_number
+
 # Extend User model with role
 class UserProfile(models.Model):
     ROLE_CHOICES = [
@@ -20,11 +23,22 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Name of the image whose derivatives have been generated, set by images.record_derivatives
+    image_derivatives = models.CharField(max_length=100, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized, maintained by the Product signals below (repair with `manage.py repair_counts`)
+    product_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded name so only a rename reindexes the category's products
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
@@ -32,12 +46,65 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Name of the image whose derivatives have been generated, set by images.record_derivatives
+    image_derivatives = models.CharField(max_length=100, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized over approved reviews, maintained by the Review signals below
+    # (repair with `manage.py recompute_ratings`); rating_avg is 0 without reviews.
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+    RATING_FIELDS = ('rating_sum', 'rating_count', 'rating_avg')
+
+    class Meta:
+        indexes = [
+            # Shop listing: in-stock products in each sort order, with id as the keyset tie-breaker
+            models.Index(fields=['name', 'id'], condition=Q(stock__gt=0), name='product_instock_name_idx'),
+            models.Index(fields=['price', 'id'], condition=Q(stock__gt=0), name='product_instock_price_idx'),
+            models.Index(fields=['created_at', 'id'], condition=Q(stock__gt=0), name='product_instock_created_idx'),
+            models.Index(fields=['rating_avg', 'rating_count', 'id'], condition=Q(stock__gt=0), name='product_instock_rating_idx'),
+            # Same, within one category
+            models.Index(fields=['category', 'name', 'id'], condition=Q(stock__gt=0), name='product_cat_name_idx'),
+            models.Index(fields=['category', 'price', 'id'], condition=Q(stock__gt=0), name='product_cat_price_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], condition=Q(stock__gt=0), name='product_cat_created_idx'),
+            models.Index(fields=['category', 'rating_avg', 'rating_count', 'id'], condition=Q(stock__gt=0), name='product_cat_rating_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded category so a move can be applied to both product counts
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save the product, leaving the rating columns to the Review signals.
+
+        A plain save() of a loaded product (admin, ProductForm, shell) updates every
+        column except RATING_FIELDS and deferred fields, so a product loaded before a
+        review was approved does not write its stale rating back. Inserts, including
+        copies made by clearing pk, and saves that pass update_fields are unchanged.
+        """
+        if not self._state.adding and self.pk is not None and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.attname for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.RATING_FIELDS and f.attname not in deferred
+            ]
+        # The category product_count update runs in post_save; commit it together with the row.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+    def star_icons(self):
+        """Font Awesome classes for five stars showing rating_avg, rounded to the nearest half."""
+        halves = round(self.rating_avg * 2)
+        return ['fas fa-star'] * (halves // 2) + ['fas fa-star-half-alt'] * (halves % 2) + ['far fa-star'] * (5 - (halves + 1) // 2)
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -46,7 +113,8 @@ class Cart(models.Model):
         return f"Cart of {self.user.username}"
 
     def get_total(self):
-        return sum(item.get_total() for item in self.cartitem_set.all())
+        from .pricing import LINE_TOTAL
+        return self.cartitem_set.aggregate(total=Sum(LINE_TOTAL))['total'] or 0
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
@@ -77,16 +145,30 @@ class Order(models.Model):
     phone = models.CharField(max_length=15)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized number of order lines, set by place_order and the OrderItem signals below
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+            models.Index(fields=['status'], name='order_status_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.order_number or self.id} by {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so the counter signals can apply deltas on save
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_total = instance.__dict__.get('total_amount')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Generate order number: ORD + timestamp + random
-            import random
-            import time
-            self.order_number = f"ORD{int(time.time())}{random.randint(100, 999)}"
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
 class OrderItem(models.Model):
@@ -98,6 +180,11 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        # Keep the row and the order item_count update (post_save) in one transaction.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
     def get_total(self):
         return self.price * self.quantity
 
@@ -140,6 +227,55 @@ class Review(models.Model):
     def __str__(self):
         return f"Review by {self.user.username} for {self.product.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so the rating signals can apply deltas on save
+        instance._loaded_rating = instance._rating_key()
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep the row and the product rating update (post_save) in one transaction.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+    def _rating_key(self):
+        """(product_id, rating) this review adds to its product's rating, or None while unapproved."""
+        if not self.__dict__.get('is_approved'):
+            return None
+        return self.__dict__.get('product_id'), self.__dict__.get('rating')
+
+class ProductPair(models.Model):
+    """
+    How many orders contained both products: one entry of the sparse co-purchase
+    matrix (both triangles, and the diagonal for product == other), maintained by
+    ``manage.py build_related_products``.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+
+class ProductPairCursor(models.Model):
+    """The last order added to ProductPair; a single row, locked while a batch of orders is added."""
+    last_order_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"ProductPair up to order {self.last_order_id}"
+
+class RelatedProduct(models.Model):
+    """Top-K "frequently bought together" neighbours of a product, best first."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('product', 'rank')
+
 class Page(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -160,6 +296,12 @@ class ContactMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     replied_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='contactmessage_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='contactmsg_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"Message from {self.name} - {self.subject}"
 
@@ -173,7 +315,44 @@ class MessageReply(models.Model):
     def __str__(self):
         return f"Reply to {self.message.subject}"
 
-from django.db.models.signals import post_save
+class StoreCounter(models.Model):
+    """Precomputed storefront totals (products, orders, revenue...), kept current by signals."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+class Job(models.Model):
+    """A queued background job (see myapp/jobs.py). Finished jobs are deleted; failed ones stay as dead letters."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('dead', 'Dead'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due queued jobs and expired running ones, oldest first
+            models.Index(fields=['status', 'run_at', 'id'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 
 @receiver(post_save, sender=User)
@@ -184,3 +363,164 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.userprofile.save()
+
+# Keep the product search index in sync
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    from .search import get_search_backend
+    get_search_backend().index_products([instance])
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    from .search import get_search_backend
+    get_search_backend().remove_products([instance.id])
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    renamed = not created and getattr(instance, '_loaded_name', None) != instance.name
+    instance._loaded_name = instance.name
+    if renamed:
+        from .search import get_search_backend
+        get_search_backend().index_products(instance.product_set.select_related('category'))
+
+# Storefront counters
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=User)
+def count_created(sender, instance, created, **kwargs):
+    if created:
+        from .counters import increment, MODEL_COUNTERS
+        increment(MODEL_COUNTERS[sender], 1)
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=User)
+def count_deleted(sender, instance, **kwargs):
+    from .counters import increment, MODEL_COUNTERS
+    increment(MODEL_COUNTERS[sender], -1)
+
+@receiver(post_save, sender=Order)
+def count_order_saved(sender, instance, created, **kwargs):
+    from .counters import apply_order_change
+    if created:
+        apply_order_change(None, None, instance.status, instance.total_amount, orders=1)
+    else:
+        apply_order_change(getattr(instance, '_loaded_status', None), getattr(instance, '_loaded_total', None),
+                           instance.status, instance.total_amount)
+    instance._loaded_status = instance.status
+    instance._loaded_total = instance.total_amount
+
+@receiver(post_delete, sender=Order)
+def count_order_deleted(sender, instance, **kwargs):
+    from .counters import apply_order_change
+    apply_order_change(getattr(instance, '_loaded_status', instance.status),
+                       getattr(instance, '_loaded_total', instance.total_amount), None, None, orders=-1)
+
+# Denormalized Category.product_count and Order.item_count. Deletes run inside the
+# deletion collector's transaction; saves are wrapped by Product.save / OrderItem.save.
+@receiver(post_save, sender=Product)
+def count_category_product(sender, instance, created, **kwargs):
+    old_category_id = None if created else getattr(instance, '_loaded_category_id', instance.category_id)
+    if old_category_id != instance.category_id:
+        Category.objects.filter(id=instance.category_id).update(product_count=F('product_count') + 1)
+        if old_category_id is not None:
+            Category.objects.filter(id=old_category_id).update(product_count=F('product_count') - 1)
+    instance._loaded_category_id = instance.category_id
+
+@receiver(post_delete, sender=Product)
+def uncount_category_product(sender, instance, **kwargs):
+    category_id = getattr(instance, '_loaded_category_id', instance.category_id)
+    Category.objects.filter(id=category_id, product_count__gt=0).update(product_count=F('product_count') - 1)
+
+@receiver(post_save, sender=OrderItem)
+def count_order_item(sender, instance, created, **kwargs):
+    if created:
+        Order.objects.filter(id=instance.order_id).update(item_count=F('item_count') + 1)
+
+@receiver(post_delete, sender=OrderItem)
+def uncount_order_item(sender, instance, **kwargs):
+    Order.objects.filter(id=instance.order_id, item_count__gt=0).update(item_count=F('item_count') - 1)
+
+# Denormalized Product.rating_sum/rating_count/rating_avg over approved reviews
+@receiver(post_save, sender=Review)
+def rate_product(sender, instance, created, **kwargs):
+    from .counters import apply_review_change
+    apply_review_change(None if created else getattr(instance, '_loaded_rating', None), instance._rating_key())
+    instance._loaded_rating = instance._rating_key()
+
+@receiver(post_delete, sender=Review)
+def unrate_product(sender, instance, **kwargs):
+    from .counters import apply_review_change
+    apply_review_change(getattr(instance, '_loaded_rating', instance._rating_key()), None)
+
+# Page and fragment caches: any catalog edit retires every cached page
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def bump_catalog(sender, **kwargs):
+    from .page_cache import bump_catalog_version_on_commit
+    bump_catalog_version_on_commit()
+
+# Cached cart badges: lines removed by a product or user delete cascade skip the cart views
+@receiver(pre_delete, sender=Product)
+def forget_product_cart_summaries(sender, instance, origin=None, **kwargs):
+    # A category or queryset delete sends this for every product: look the carts up once per delete()
+    if getattr(origin, '_cart_summaries_forgotten', False):
+        return
+    if isinstance(origin, Category):
+        carts = Cart.objects.filter(cartitem__product__category=origin)
+    elif isinstance(origin, models.QuerySet) and origin.model in (Product, Category):
+        lookup = 'cartitem__product__in' if origin.model is Product else 'cartitem__product__category__in'
+        carts = Cart.objects.filter(**{lookup: origin.values('pk')})
+    else:
+        carts = Cart.objects.filter(cartitem__product=instance)
+        origin = None
+    user_ids = list(carts.values_list('user_id', flat=True).distinct())
+    if origin is not None:
+        origin._cart_summaries_forgotten = True
+
+    def forget():
+        if origin is not None:
+            origin._cart_summaries_forgotten = False
+        if user_ids:
+            from .cart import forget_cart_summaries
+            forget_cart_summaries(user_ids)
+    transaction.on_commit(forget)
+
+@receiver(post_delete, sender=User)
+def forget_user_cart_summary(sender, instance, **kwargs):
+    from .cart import forget_cart_summaries
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_cart_summaries([user_id]))
+
+# Cached coupon lookups
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def forget_cached_coupon(sender, instance, **kwargs):
+    from .pricing import forget_coupon
+    transaction.on_commit(lambda: forget_coupon(instance.code))
+
+# Chat threads: track the newest reply id so pollers and push streams can skip the database
+@receiver(post_save, sender=MessageReply)
+def track_latest_reply(sender, instance, created, **kwargs):
+    if created:
+        from .chat import set_latest_reply_id
+        transaction.on_commit(lambda: set_latest_reply_id(instance.message_id, instance.id))
+
+@receiver(post_delete, sender=MessageReply)
+def forget_latest_reply(sender, instance, **kwargs):
+    from .chat import clear_latest_reply_id
+    transaction.on_commit(lambda: clear_latest_reply_id(instance.message_id))
+
+# Image derivatives (thumbnail/card/detail in WebP and JPEG), generated by the job workers.
+# The job row commits or rolls back with the save.
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def schedule_image_derivatives(sender, instance, **kwargs):
+    # Stock and price edits keep the image, whose derivatives are already recorded
+    if instance.image and instance.image_derivatives != instance.image.name:
+        from .images import schedule_derivatives
+        schedule_derivatives(instance.image.name)
@@ -0,0 +1,103 @@
+"""
+Streamed order exports for the admin panel.
+
+Orders are read with values().iterator() a chunk at a time and their items fetched
+with one query per chunk, so neither the worker nor the database cursor holds more
+than ``chunk_size`` orders, however many match.
+"""
+import csv
+import datetime
+import json
+from itertools import islice
+
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+ORDER_FIELDS = (
+    'id', 'order_number', 'created_at', 'status', 'payment_method', 'payment_status',
+    'total_amount', 'item_count', 'user__username', 'user__email', 'phone', 'shipping_address',
+)
+ITEM_FIELDS = ('order_id', 'product_id', 'product__name', 'quantity', 'price')
+# One CSV row per order item; an order without items gets a single row with blank item columns
+CSV_HEADER = [
+    'order_id', 'order_number', 'created_at', 'status', 'payment_method', 'payment_status',
+    'total_amount', 'item_count', 'username', 'email', 'phone', 'shipping_address',
+    'product_id', 'product_name', 'quantity', 'price',
+]
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def filter_orders(date_from=None, date_to=None, statuses=()):
+    """Orders created on or between the two dates (inclusive) with one of ``statuses``."""
+    orders = Order.objects.all()
+    tz = timezone.get_current_timezone()
+    if date_from:
+        orders = orders.filter(created_at__gte=datetime.datetime.combine(date_from, datetime.time.min, tz))
+    if date_to:
+        next_day = date_to + datetime.timedelta(days=1)
+        orders = orders.filter(created_at__lt=datetime.datetime.combine(next_day, datetime.time.min, tz))
+    if statuses:
+        orders = orders.filter(status__in=statuses)
+    return orders
+
+
+def iter_orders(orders, chunk_size=2000):
+    """Yield (order, items) pairs of plain dicts in creation order."""
+    rows = orders.order_by('created_at', 'id').values(*ORDER_FIELDS).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        items = {}
+        for item in (
+            OrderItem.objects.filter(order_id__in=[order['id'] for order in chunk])
+            .order_by('order_id', 'id').values(*ITEM_FIELDS)
+        ):
+            items.setdefault(item['order_id'], []).append(item)
+        for order in chunk:
+            yield order, items.get(order['id'], [])
+
+
+class _Echo:
+    """File-like object whose write() returns the line instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(orders, chunk_size=2000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order, items in iter_orders(orders, chunk_size):
+        head = [
+            order['id'], order['order_number'], order['created_at'].isoformat(), order['status'],
+            order['payment_method'], order['payment_status'], order['total_amount'], order['item_count'],
+            order['user__username'], order['user__email'], order['phone'], order['shipping_address'],
+        ]
+        for item in items or [None]:
+            tail = [item['product_id'], item['product__name'], item['quantity'], item['price']] if item else [''] * 4
+            yield writer.writerow(head + tail)
+
+
+def jsonl_lines(orders, chunk_size=2000):
+    for order, items in iter_orders(orders, chunk_size):
+        order['username'] = order.pop('user__username')
+        order['email'] = order.pop('user__email')
+        order['items'] = [
+            {'product_id': item['product_id'], 'product_name': item['product__name'],
+             'quantity': item['quantity'], 'price': item['price']}
+            for item in items
+        ]
+        yield json.dumps(order, default=str) + '\n'
+
+
+def export_lines(fmt, orders, chunk_size=2000):
+    return (csv_lines if fmt == 'csv' else jsonl_lines)(orders, chunk_size)
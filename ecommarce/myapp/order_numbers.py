@@ -0,0 +1,92 @@
+"""
+Order numbers: ``ORD`` plus 17 base-36 digits, 20 characters in all.
+
+The digits encode, most significant first, a millisecond timestamp, a node id
+(``settings.ORDER_NUMBER_NODE``, one per host), the process id and a
+per-millisecond sequence. Two live processes on one host never share a pid and
+two hosts never share a node id, so numbers are unique without touching the
+database or retrying; the fixed width keeps them sorted by time.
+
+A pid is only reused after its process has exited, so uniqueness across
+restarts assumes the clock does not step back past numbers already issued.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+PREFIX = 'ORD'
+WIDTH = 17
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# 2025-01-01T00:00:00Z; 42 bits of milliseconds from here last until 2164
+EPOCH_MS = 1735689600000
+NODE_BITS = 8
+PID_BITS = 22  # Linux PID_MAX_LIMIT is 2 ** 22
+SEQUENCE_BITS = 12
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+_lock = threading.Lock()
+_pid = os.getpid()
+_last_ms = -1
+_sequence = 0
+
+
+def _reset_after_fork():
+    global _lock, _pid, _last_ms, _sequence
+    _lock = threading.Lock()
+    _pid = os.getpid()
+    _last_ms = -1
+    _sequence = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000 - EPOCH_MS
+
+
+def _node():
+    node = getattr(settings, 'ORDER_NUMBER_NODE', 0)
+    if not 0 <= node < 1 << NODE_BITS:
+        raise ImproperlyConfigured(f'ORDER_NUMBER_NODE must be between 0 and {(1 << NODE_BITS) - 1}.')
+    return node
+
+
+def encode(value):
+    digits = []
+    while value:
+        value, digit = divmod(value, 36)
+        digits.append(ALPHABET[digit])
+    if len(digits) > WIDTH:
+        raise OverflowError('Order number does not fit in 20 characters')
+    return PREFIX + ''.join(reversed(digits)).rjust(WIDTH, '0')
+
+
+def next_order_number():
+    """A new unique order number, greater than any this process issued before."""
+    global _last_ms, _sequence
+    node, pid = _node(), _pid
+    if pid >> PID_BITS:
+        raise RuntimeError(f'Process id {pid} does not fit in {PID_BITS} bits')
+    with _lock:
+        now = _now_ms()
+        if now > _last_ms:
+            _last_ms, _sequence = now, 0
+        elif _sequence < MAX_SEQUENCE:
+            # Same millisecond, or the clock went back: keep counting from the last one
+            _sequence += 1
+        else:
+            # 4096 numbers in one millisecond: move on to the next
+            _last_ms, _sequence = _last_ms + 1, 0
+        value = (
+            (_last_ms << (NODE_BITS + PID_BITS + SEQUENCE_BITS))
+            | (node << (PID_BITS + SEQUENCE_BITS))
+            | (pid << SEQUENCE_BITS)
+            | _sequence
+        )
+    return encode(value)
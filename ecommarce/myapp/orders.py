@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from .models import CartItem, Order, OrderItem, Product
+from .page_cache import bump_catalog_version_on_commit
+from .pricing import apply_coupon
+
+
+class InsufficientStock(Exception):
+    """Raised when one or more cart lines ask for more units than are in stock.
+
+    ``shortages`` is a list of ``(cart_item, available)`` pairs, one per short line.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(', '.join(
+            f"{item.product.name} ({item.quantity} requested, {available} available)"
+            for item, available in shortages
+        ))
+
+
+def _find_shortages(cart_items):
+    stock = dict(
+        Product.objects.filter(id__in=[item.product_id for item in cart_items])
+        .values_list('id', 'stock')
+    )
+    return [
+        (item, stock.get(item.product_id, 0))
+        for item in cart_items
+        if stock.get(item.product_id, 0) < item.quantity
+    ]
+
+
+def place_order(user, cart_items, coupon=None, **order_fields):
+    """
+    Turn a cart into an order as one atomic unit.
+
+    The order lines are bulk-inserted (the order's item_count is written with
+    it), stock is decremented by a single guarded UPDATE (``stock >= quantity``
+    per product) and the cart is cleared, so the number of queries does not
+    grow with the number of cart lines. If any line is short, nothing is
+    written and InsufficientStock reports the short lines.
+
+    ``coupon`` (a valid Coupon, see pricing.get_coupon) is applied to the total.
+    """
+    cart_items = list(cart_items)
+    if not cart_items:
+        raise ValueError('Cannot place an order for an empty cart.')
+    quantities = {}
+    for item in cart_items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    short = False
+    with transaction.atomic():
+        # Lock the product rows up front on backends that support it (no-op on SQLite,
+        # where the guarded UPDATE below is what keeps two buyers from overselling).
+        prices = dict(
+            Product.objects.select_for_update()
+            .filter(id__in=quantities)
+            .values_list('id', 'price')
+        )
+
+        in_stock = Q()
+        for product_id, quantity in quantities.items():
+            in_stock |= Q(id=product_id, stock__gte=quantity)
+        updated = Product.objects.filter(in_stock).update(
+            stock=Case(
+                *[When(id=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+                default=F('stock'),
+                output_field=Product._meta.get_field('stock'),
+            )
+        )
+        if updated != len(quantities):
+            # Roll back the partial decrement; the shortages are read once it is undone.
+            short = True
+            transaction.set_rollback(True)
+        else:
+            subtotal = sum(prices[item.product_id] * item.quantity for item in cart_items)
+            _, total = apply_coupon(subtotal, coupon)
+            order = Order.objects.create(user=user, total_amount=total, item_count=len(cart_items), **order_fields)
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product_id=item.product_id,
+                    quantity=item.quantity,
+                    price=prices[item.product_id],
+                )
+                for item in cart_items
+            ])
+            CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
+            # The stock UPDATE bypasses signals; retire cached catalog pages if something sold out
+            if Product.objects.filter(id__in=quantities, stock=0).exists():
+                bump_catalog_version_on_commit()
+
+    if short:
+        raise InsufficientStock(_find_shortages(cart_items))
+    return order
@@ -0,0 +1,187 @@
+import hashlib
+import re
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_vary_headers
+
+from .cart import GUEST_CART_COOKIE
+from .models import StoreCounter
+
+# StoreCounter row holding the catalog version. The cache may be local to each worker
+# process, so the version lives in the database where every worker sees a bump.
+CATALOG_VERSION_KEY = 'catalog_version'
+# Tracking parameters that do not change the page
+IGNORED_PARAMS = ('utm_', 'fbclid', 'gclid')
+
+_CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+_CSRF_PLACEHOLDER = b'__csrf_token__'
+
+
+def page_cache_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 10)
+
+
+def catalog_version(request=None):
+    """
+    Current catalog version. Every cached page and fragment key includes it, so
+    bumping it retires all of them at once. Read once per ``request``.
+    """
+    version = getattr(request, '_catalog_version', None)
+    if version is None:
+        version = StoreCounter.objects.filter(name=CATALOG_VERSION_KEY).values_list('value', flat=True).first()
+        version = int(version or 0)
+        if request is not None:
+            request._catalog_version = version
+    return version
+
+
+async def acatalog_version(request=None):
+    """catalog_version for async views."""
+    version = getattr(request, '_catalog_version', None)
+    if version is None:
+        version = await StoreCounter.objects.filter(name=CATALOG_VERSION_KEY).values_list('value', flat=True).afirst()
+        version = int(version or 0)
+        if request is not None:
+            request._catalog_version = version
+    return version
+
+
+def bump_catalog_version():
+    if not StoreCounter.objects.filter(name=CATALOG_VERSION_KEY).update(value=F('value') + 1):
+        _, created = StoreCounter.objects.get_or_create(name=CATALOG_VERSION_KEY, defaults={'value': 1})
+        if not created:
+            StoreCounter.objects.filter(name=CATALOG_VERSION_KEY).update(value=F('value') + 1)
+
+
+def bump_catalog_version_on_commit():
+    """
+    Bump the catalog version when the current transaction commits, once however many
+    rows it touched: a category delete sends a signal for every product in it.
+    """
+    pending = getattr(connection, '_pending_catalog_bump', None)
+    # Still queued unless it has run or a rollback discarded it
+    if pending is not None and any(func is pending for _, func, _ in connection.run_on_commit):
+        return
+
+    def bump():
+        connection._pending_catalog_bump = None
+        bump_catalog_version()
+
+    connection._pending_catalog_bump = bump
+    transaction.on_commit(bump)
+
+
+def normalized_query(request):
+    """The query string with blank values and tracking parameters dropped, keys sorted."""
+    return urlencode(sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        if not key.startswith(IGNORED_PARAMS)
+        for value in values
+        if value
+    ))
+
+
+def page_cache_key(request, version=None):
+    url = f'{request.get_host()}{request.path}?{normalized_query(request)}'
+    if version is None:
+        version = catalog_version(request)
+    return f'page:{version}:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def _is_cacheable_request(request):
+    # Guests with a cart or a pending flash message see a personalised header
+    return (
+        request.method in ('GET', 'HEAD')
+        and GUEST_CART_COOKIE not in request.COOKIES
+        and 'messages' not in request.COOKIES
+        and not request.user.is_authenticated
+    )
+
+
+def _is_cacheable_response(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'private' not in response.get('Cache-Control', '')
+    )
+
+
+def _cached_response(request, cached):
+    content, content_type = cached
+    if _CSRF_PLACEHOLDER in content:
+        content = content.replace(_CSRF_PLACEHOLDER, get_token(request).encode())
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _cache_entry(response):
+    """What to store for ``response``, or None when it must not be cached."""
+    if not _is_cacheable_response(response):
+        return None
+    response['X-Page-Cache'] = 'miss'
+    return _CSRF_INPUT.sub(rb'\1' + _CSRF_PLACEHOLDER + rb'\2', response.content), response['Content-Type']
+
+
+def anonymous_page_cache(view):
+    """
+    Serve ``view`` to anonymous visitors from a full-page cache.
+
+    Keys are the URL plus normalized query string under the current catalog
+    version, so an edit to a product, category or page retires every cached page.
+    CSRF tokens are punched out of the stored HTML and filled in per visitor.
+    Works on sync and async views.
+    """
+    if iscoroutinefunction(view):
+        return _async_anonymous_page_cache(view)
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not _is_cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            response = _cached_response(request, cached)
+        else:
+            response = view(request, *args, **kwargs)
+            entry = _cache_entry(response)
+            if entry is not None:
+                cache.set(key, entry, page_cache_timeout())
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return wrapped
+
+
+def _async_anonymous_page_cache(view):
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        # Resolve the user here; request.user would hit the database synchronously
+        request.user = await request.auser()
+        if not _is_cacheable_request(request):
+            return await view(request, *args, **kwargs)
+
+        key = page_cache_key(request, await acatalog_version(request))
+        cached = await cache.aget(key)
+        if cached is not None:
+            response = _cached_response(request, cached)
+        else:
+            response = await view(request, *args, **kwargs)
+            entry = _cache_entry(response)
+            if entry is not None:
+                await cache.aset(key, entry, page_cache_timeout())
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return wrapped
@@ -0,0 +1,234 @@
+import asyncio
+import base64
+import binascii
+import datetime
+import json
+import math
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def _encode_value(value):
+    # Full precision, unlike DjangoJSONEncoder which truncates datetimes to milliseconds.
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) paginator.
+
+    Instead of ``COUNT(*)`` plus ``OFFSET n`` it filters on the sort key of the last
+    row seen, so every page costs one indexed range scan no matter how deep it is.
+    ``ordering`` takes the same strings as ``order_by()`` (``'-price'``, ``'name'``);
+    the primary key is appended as a tie-breaker. Ordering fields must be non-null.
+
+    Pass ``count=False`` to skip the exact total; ``paginator.count`` is then None.
+    """
+
+    def __init__(self, queryset, per_page, ordering, count=True):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = []
+        for key in ordering:
+            self.ordering.append((key.lstrip('-'), key.startswith('-')))
+        if not any(field in ('pk', 'id') for field, _ in self.ordering):
+            self.ordering.append(('pk', self.ordering[-1][1] if self.ordering else False))
+        self.exact_count = count
+
+    @cached_property
+    def count(self):
+        if not self.exact_count:
+            return None
+        return self.queryset.count()
+
+    @cached_property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, -(-self.count // self.per_page))
+
+    def _order_by(self, reverse=False):
+        return [('-' if desc != reverse else '') + field for field, desc in self.ordering]
+
+    def _seek(self, values, reverse=False):
+        # (a, b, pk) > (x, y, z) spelled out as a disjunction so mixed directions work.
+        condition = Q()
+        for i, (field, desc) in enumerate(self.ordering):
+            lookup = 'lt' if desc != reverse else 'gt'
+            clause = Q(**{f'{field}__{lookup}': values[i]})
+            for prev_field, _ in self.ordering[:i]:
+                clause &= Q(**{prev_field: values[self._index(prev_field)]})
+            condition |= clause
+        # Redundant bound on the leading key lets the database use it as an index range.
+        field, desc = self.ordering[0]
+        lead = 'lte' if desc != reverse else 'gte'
+        return Q(**{f'{field}__{lead}': values[0]}) & condition
+
+    def _index(self, field):
+        return [f for f, _ in self.ordering].index(field)
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field, _ in self.ordering]
+
+    def encode_cursor(self, values, offset, reverse=False):
+        payload = json.dumps({'k': values, 'o': offset, 'r': reverse}, default=_encode_value)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = payload['k']
+            if len(values) != len(self.ordering):
+                return None
+            for i, (field, _) in enumerate(self.ordering):
+                model_field = self._field(field)
+                values[i] = model_field.to_python(values[i])
+                # Ordering fields are non-null, and NaN/infinity never come from a real row
+                if values[i] is None or isinstance(values[i], float) and not math.isfinite(values[i]):
+                    return None
+                # Range and length checks, so a tampered key can't reach the query
+                model_field.run_validators(values[i])
+            return values, max(0, int(payload['o'])), bool(payload['r'])
+        except (ValueError, KeyError, TypeError, OverflowError, binascii.Error, ValidationError, FieldError):
+            return None
+
+    def _field(self, name):
+        """The model field, or for an annotation such as search_rank its output field."""
+        opts = self.queryset.model._meta
+        if name == 'pk':
+            return opts.pk
+        try:
+            return opts.get_field(name)
+        except FieldDoesNotExist:
+            return self.queryset.query.annotations[name].output_field
+
+    def get_page(self, cursor=None):
+        """
+        Return the page after (or, for a previous-link cursor, before) ``cursor``; bad cursors give page one.
+
+        Rows are fetched on first use, so a page rendered inside a cached template
+        fragment costs no query on a cache hit.
+        """
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            return KeysetPage(self, None, 0, False)
+        return KeysetPage(self, *decoded)
+
+    async def aget_page(self, cursor=None):
+        """get_page for async views: the rows, and the count unless ``count=False``, are fetched here."""
+        page = self.get_page(cursor)
+        if self.exact_count:
+            page._page, self.count = await asyncio.gather(self._afetch(*page._cursor), self.queryset.acount())
+        else:
+            page._page = await self._afetch(*page._cursor)
+        return page
+
+    def _page_query(self, values, reverse):
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, reverse))
+        return queryset.order_by(*self._order_by(reverse))[:self.per_page + 1]
+
+    def _fetch(self, values, offset, reverse):
+        return self._split(list(self._page_query(values, reverse)), values, offset, reverse)
+
+    async def _afetch(self, values, offset, reverse):
+        return self._split([row async for row in self._page_query(values, reverse)], values, offset, reverse)
+
+    def _split(self, rows, values, offset, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            has_previous, has_next = has_more, True
+            if not has_previous:
+                offset = 0
+        else:
+            has_previous, has_next = values is not None, has_more
+        return rows, offset, has_previous, has_next
+
+
+class KeysetPage:
+    """A page of a KeysetPaginator, shaped like django.core.paginator.Page where it can be."""
+
+    def __init__(self, paginator, values, offset, reverse):
+        self.paginator = paginator
+        self._cursor = (values, offset, reverse)
+
+    @cached_property
+    def _page(self):
+        return self.paginator._fetch(*self._cursor)
+
+    @property
+    def object_list(self):
+        return self._page[0]
+
+    @property
+    def offset(self):
+        return self._page[1]
+
+    @property
+    def _has_previous(self):
+        return self._page[2]
+
+    @property
+    def _has_next(self):
+        return self._page[3]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def __repr__(self):
+        return f'<KeysetPage {self.number}>'
+
+    @property
+    def number(self):
+        return self.offset // self.paginator.per_page + 1
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def start_index(self):
+        return self.offset + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.offset + len(self.object_list)
+
+    @cached_property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(
+            self.paginator._key(self.object_list[-1]), self.offset + len(self.object_list)
+        )
+
+    @cached_property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(
+            self.paginator._key(self.object_list[0]),
+            max(0, self.offset - self.paginator.per_page),
+            reverse=True,
+        )
@@ -0,0 +1,118 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from .models import CartItem, Coupon
+
+COUPON_SESSION_KEY = 'coupon_code'
+# Unknown or expired codes are remembered briefly so retyping one does not hit the database
+COUPON_MISS_TIMEOUT = 60
+# The cache may be local to each worker process, where forget_coupon() never reaches:
+# bound how long another worker can keep honouring a coupon deactivated in the admin.
+COUPON_CACHE_TIMEOUT = 60
+
+LINE_TOTAL = ExpressionWrapper(
+    F('quantity') * F('product__price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+CENT = Decimal('0.01')
+
+
+def _coupon_key(code):
+    return f'coupon:{code.strip().upper()}'
+
+
+def get_coupon(code):
+    """
+    The currently valid Coupon for ``code`` (case-insensitive), or None.
+
+    Valid coupons are cached for COUPON_CACHE_TIMEOUT, or until their ``valid_to``
+    if that comes first. Saving or deleting a coupon drops its entry in this process.
+    """
+    if not code or not code.strip():
+        return None
+    key = _coupon_key(code)
+    coupon = cache.get(key)
+    if coupon is None:
+        now = timezone.now()
+        coupon = Coupon.objects.filter(
+            code__iexact=code.strip(), active=True, valid_from__lte=now, valid_to__gte=now,
+        ).first()
+        if coupon is None:
+            cache.set(key, False, COUPON_MISS_TIMEOUT)
+            return None
+        cache.set(key, coupon, max(1, min(COUPON_CACHE_TIMEOUT, int((coupon.valid_to - now).total_seconds()))))
+    return coupon if coupon and coupon.is_valid() else None
+
+
+def forget_coupon(code):
+    cache.delete(_coupon_key(code))
+
+
+def apply_coupon(subtotal, coupon):
+    """(discount, total) for ``subtotal`` with ``coupon`` applied, both rounded to cents."""
+    subtotal = Decimal(subtotal or 0)
+    discount = Decimal('0.00')
+    if coupon is not None:
+        discount = min(subtotal, (subtotal * coupon.discount_percentage / 100).quantize(CENT))
+    return discount, (subtotal - discount).quantize(CENT)
+
+
+def price_cart(user, coupon=None):
+    """
+    Price ``user``'s cart with one aggregate query, whatever the number of lines.
+
+    Returns a dict with ``count`` (lines), ``quantity`` (units), ``subtotal``,
+    ``coupon``, ``discount`` and ``total``.
+    """
+    totals = CartItem.objects.filter(cart__user=user).aggregate(
+        count=Count('id'),
+        units=Sum('quantity'),
+        subtotal=Sum(LINE_TOTAL),
+    )
+    subtotal = (totals['subtotal'] or Decimal('0')).quantize(CENT)
+    discount, total = apply_coupon(subtotal, coupon)
+    return {
+        'count': totals['count'],
+        'quantity': totals['units'] or 0,
+        'subtotal': subtotal,
+        'coupon': coupon,
+        'discount': discount,
+        'total': total,
+    }
+
+
+def price_lines(lines, coupon=None):
+    """Same result as price_cart for lines that are already loaded (e.g. a guest cart)."""
+    subtotal = sum((line.line_total for line in lines), Decimal('0')).quantize(CENT)
+    discount, total = apply_coupon(subtotal, coupon)
+    return {
+        'count': len(lines),
+        'quantity': sum(line.quantity for line in lines),
+        'subtotal': subtotal,
+        'coupon': coupon,
+        'discount': discount,
+        'total': total,
+    }
+
+
+def cart_lines(user):
+    """The cart lines with their products, each annotated with ``line_total``."""
+    return (
+        CartItem.objects.filter(cart__user=user)
+        .select_related('product__category')
+        .annotate(line_total=LINE_TOTAL)
+        .order_by('id')
+    )
+
+
+def session_coupon(request):
+    """The valid coupon stored in the session, dropping the code once it has expired."""
+    code = request.session.get(COUPON_SESSION_KEY)
+    coupon = get_coupon(code)
+    if code and coupon is None:
+        del request.session[COUPON_SESSION_KEY]
+    return coupon
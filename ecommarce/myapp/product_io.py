@@ -0,0 +1,232 @@
+"""
+Bulk product import and export, streamed so memory stays flat whatever the file size.
+
+Both directions use the same columns: ``id``, ``name``, ``description``, ``price``,
+``stock``, ``category`` (by name) and ``image`` (a media name such as
+``products/foo.jpg``, or a file name under the import's image directory).
+"""
+import csv
+import json
+import os
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .counters import reconcile_counters, repair_denormalized_counts
+from .models import Category, Product
+from .page_cache import bump_catalog_version_on_commit
+from .search import get_search_backend
+
+FIELDS = ('id', 'name', 'description', 'price', 'stock', 'category', 'image')
+UPDATE_FIELDS = ['name', 'description', 'price', 'stock', 'category', 'updated_at']
+FORMATS = ('csv', 'jsonl')
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path):
+    """'jsonl' for .jsonl/.ndjson files, otherwise 'csv'."""
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line_number, dict) for each record in ``stream``, or (line_number, RowError)
+    for a CSV record the parser rejects or a JSONL line that isn't a JSON object, so
+    one bad line doesn't stop the import.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # line_num doesn't count the line the parser gave up on
+                yield reader.line_num + 1, RowError(f'invalid CSV: {e}')
+                continue
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    row = RowError(f'invalid JSON: {e}')
+                if not isinstance(row, (dict, RowError)):
+                    row = RowError('expected a JSON object')
+                yield line_number, row
+
+
+def write_rows(stream, fmt, rows):
+    """Write dicts with FIELDS as keys to ``stream``; returns the number written."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, FIELDS)
+        writer.writeheader()
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+    else:
+        for count, row in enumerate(rows, 1):
+            stream.write(json.dumps(row, default=str) + '\n')
+    return count
+
+
+def export_rows(chunk_size=2000):
+    """Every product as an export row, streamed from the database in id order."""
+    products = (
+        Product.objects.order_by('id')
+        .values_list('id', 'name', 'description', 'price', 'stock', 'category__name', 'image')
+        .iterator(chunk_size=chunk_size)
+    )
+    for row in products:
+        row = dict(zip(FIELDS, row))
+        row['price'] = str(row['price'])
+        row['image'] = row['image'] or ''
+        yield row
+
+
+class ProductImporter:
+    """
+    Upsert rows into Product in batches: rows whose ``id`` exists are updated with
+    one bulk_update, the rest are created with one bulk_create.
+
+    bulk_create/bulk_update skip the Product signals, so ``finish`` repairs what they
+    maintain (category product counts, storefront counters, the page cache) once at
+    the end, and each batch is added to the search index as it is written.
+    """
+
+    def __init__(self, image_dir=None, batch_size=1000, create_categories=True):
+        self.image_dir = image_dir
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.categories = {category.name: category for category in Category.objects.all()}
+        self.created = self.updated = self.images = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = iter(rows)
+        try:
+            while batch := list(islice(rows, self.batch_size)):
+                products = []
+                for line_number, row in batch:
+                    try:
+                        if isinstance(row, RowError):
+                            raise row
+                        products.append(self.build(row))
+                    except (ValueError, InvalidOperation) as e:
+                        self.errors.append((line_number, str(e)))
+                self.write(products)
+        finally:
+            # Batches already written still need their counts repaired if the input breaks off
+            self.finish()
+
+    def build(self, row):
+        name = (row.get('name') or '').strip()
+        if not name:
+            raise RowError('name is required')
+        price = Decimal(str(row.get('price') or '').strip())
+        if price < 0:
+            raise RowError('price must not be negative')
+        self.validate('price', price)
+        stock = int(row.get('stock') or 0)
+        if stock < 0:
+            raise RowError('stock must not be negative')
+        self.validate('stock', stock)
+        product_id = str(row.get('id') or '').strip()
+        product = Product(
+            id=int(product_id) if product_id else None,
+            name=name[:200],
+            description=row.get('description') or '',
+            price=price,
+            stock=stock,
+            category=self.category(row.get('category')),
+        )
+        image = (row.get('image') or '').strip()
+        if image:
+            product.image = self.attach_image(image)
+        return product
+
+    def validate(self, name, value):
+        """Run the field's validators (max_digits, decimal_places, range): left to the database, a bad value fails the whole batch."""
+        try:
+            Product._meta.get_field(name).run_validators(value)
+        except ValidationError as e:
+            raise RowError(f'{name}: {" ".join(e.messages)}')
+
+    def category(self, name):
+        name = (name or '').strip()
+        if not name:
+            raise RowError('category is required')
+        if name not in self.categories:
+            if not self.create_categories:
+                raise RowError(f'unknown category {name!r}')
+            self.categories[name] = Category.objects.create(name=name[:100])
+        return self.categories[name]
+
+    def attach_image(self, image):
+        """The media name for ``image``, copying it in from the image directory if needed."""
+        if not self.image_dir:
+            if not default_storage.exists(image):
+                raise RowError(f'image {image!r} is not in media storage')
+            return image
+        source = os.path.join(self.image_dir, image)
+        if not os.path.isfile(source):
+            raise RowError(f'image {image!r} not found in {self.image_dir}')
+        name = f'products/{os.path.basename(image)}'
+        if not default_storage.exists(name) or default_storage.size(name) != os.path.getsize(source):
+            with open(source, 'rb') as f:
+                name = default_storage.save(name, File(f))
+        self.images += 1
+        return name
+
+    @transaction.atomic
+    def write(self, products):
+        # A repeated id within one batch: the last row wins
+        products = list({p.id if p.id is not None else -i: p for i, p in enumerate(products, 1)}.values())
+        ids = [p.id for p in products if p.id is not None]
+        existing = set(Product.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+        now = timezone.now()
+        updates = []
+        for product in products:
+            if product.id in existing:
+                product.updated_at = now
+                updates.append(product)
+        if updates and not connection.features.supports_update_conflicts_with_target:
+            Product.objects.bulk_update(updates, UPDATE_FIELDS)
+            Product.objects.bulk_update([p for p in updates if p.image], ['image'])
+            inserts, upsert = [p for p in products if p.id not in existing], False
+        else:
+            # INSERT ... ON CONFLICT (id) DO UPDATE: one statement per chunk, where
+            # bulk_update's CASE per column gets slower the bigger the batch
+            inserts, upsert = products, bool(updates)
+        # Rows without an image keep the one they have
+        for fields, rows in (
+            (UPDATE_FIELDS + ['image'], [p for p in inserts if p.image]),
+            (UPDATE_FIELDS, [p for p in inserts if not p.image]),
+        ):
+            if rows and upsert:
+                Product.objects.bulk_create(rows, update_conflicts=True, unique_fields=['id'], update_fields=fields)
+            elif rows:
+                Product.objects.bulk_create(rows)
+        get_search_backend().index_products(products)
+        self.created += len(products) - len(updates)
+        self.updated += len(updates)
+
+    def finish(self):
+        # Rows created with explicit ids leave sequence-based backends behind
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+                cursor.execute(sql)
+        repair_denormalized_counts()
+        reconcile_counters()
+        bump_catalog_version_on_commit()
@@ -0,0 +1,252 @@
+"""
+"Frequently bought together" neighbours for product pages.
+
+Let B be the basket matrix, one row per order and one column per product (1 when
+the order contains the product). Its Gram matrix C = BᵀB holds the number of
+orders containing both i and j at C[i, j], and the number of orders containing i
+at C[i, i]. C is sparse, and ProductPair stores its non-zero entries (both
+triangles plus the diagonal). Because C is a sum over orders, each run only adds
+BᵀB for the orders placed since the previous one.
+
+Neighbours are scored by cosine similarity, C[i, j] / sqrt(C[i, i] * C[j, j]), so
+that best sellers do not become everyone's neighbour. The top K per product go to
+RelatedProduct, which product_detail reads with one indexed lookup. Only the rows
+a run touched are re-ranked: the products in the new orders and their neighbours,
+whose similarity to them moved with the diagonal.
+
+Wishlists can be blended in with ``wishlist_weight``: the same product with the
+user × product matrix, recomputed in full each run (wishlist rows come and go, so
+there is nothing to add up) and every product re-ranked.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import Order, OrderItem, Product, ProductPair, ProductPairCursor, RelatedProduct, Wishlist
+from .page_cache import bump_catalog_version
+from .utils import batched
+
+# Orders this recent may still have lines being written (or lower ids not yet committed)
+SETTLE_SECONDS = 60
+# Bulk orders pair every product with every other; they say little about what goes together
+MAX_BASKET = 50
+ROW_CHUNK = 500
+
+
+def default_top_k():
+    return getattr(settings, 'RELATED_PRODUCTS_TOP_K', 8)
+
+
+def gram(baskets):
+    """BᵀB for an iterable of baskets (collections of product ids), as a sparse {(i, j): count}."""
+    counts = Counter()
+    for basket in baskets:
+        items = sorted(set(basket))
+        if len(items) > MAX_BASKET:
+            continue
+        for i in items:
+            for j in items:
+                counts[i, j] += 1
+    return counts
+
+
+def order_baskets(after, upto):
+    """Product ids of each order with after < id <= upto, cancelled orders left out."""
+    lines = (
+        OrderItem.objects.filter(order_id__gt=after, order_id__lte=upto)
+        .exclude(order__status='cancelled')
+        .order_by('order_id')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=5000)
+    )
+    for _, rows in groupby(lines, key=lambda row: row[0]):
+        yield [product_id for _, product_id in rows]
+
+
+def add_to_pairs(delta):
+    """Add a sparse {(i, j): count} delta into ProductPair."""
+    if connection.features.supports_update_conflicts_with_target:
+        # Let the database do the addition: INSERT ... ON CONFLICT DO UPDATE SET orders = orders + new
+        qn = connection.ops.quote_name
+        table = qn(ProductPair._meta.db_table)
+        sql = (
+            f'INSERT INTO {table} (product_id, other_id, orders) VALUES (%s, %s, %s) '
+            f'ON CONFLICT (product_id, other_id) DO UPDATE SET orders = {table}.orders + excluded.orders'
+        )
+        with connection.cursor() as cursor:
+            for rows in batched(((i, j, count) for (i, j), count in delta.items()), 5000):
+                cursor.executemany(sql, rows)
+        return
+
+    rows = defaultdict(dict)
+    for (i, j), count in delta.items():
+        rows[i][j] = count
+    for chunk in batched(sorted(rows), ROW_CHUNK):
+        existing = {
+            (i, j): (pk, orders)
+            for pk, i, j, orders in
+            ProductPair.objects.filter(product_id__in=chunk).values_list('id', 'product_id', 'other_id', 'orders')
+        }
+        inserts, updates = [], []
+        for i in chunk:
+            for j, count in rows[i].items():
+                if (i, j) in existing:
+                    pk, orders = existing[i, j]
+                    updates.append(ProductPair(id=pk, orders=orders + count))
+                else:
+                    inserts.append(ProductPair(product_id=i, other_id=j, orders=count))
+        ProductPair.objects.bulk_create(inserts, batch_size=2000)
+        ProductPair.objects.bulk_update(updates, ['orders'], batch_size=2000)
+
+
+class RelatedProductsBuilder:
+    """
+    Adds new orders to ProductPair and re-ranks the affected RelatedProduct rows.
+
+    Each batch of orders is added in its own transaction together with the cursor,
+    under a lock on the cursor row, so concurrent runs never count an order twice.
+    """
+
+    def __init__(self, top_k=None, wishlist_weight=0, batch_size=20000):
+        self.top_k = top_k or default_top_k()
+        self.wishlist_weight = wishlist_weight
+        self.batch_size = batch_size
+        self.orders = 0
+        self.ranked = 0
+
+    def run(self, full=False):
+        """Returns (orders added, products re-ranked)."""
+        if full:
+            self.reset()
+        affected = self.add_new_orders()
+        affected |= self.neighbours(affected)
+        wishlist = None
+        if self.wishlist_weight:
+            wishlist = self.wishlist_rows()
+            affected = set(ProductPair.objects.filter(other=F('product')).values_list('product_id', flat=True))
+            affected.update(wishlist)
+        if full:
+            affected.update(RelatedProduct.objects.values_list('product_id', flat=True).distinct())
+        self.rank(affected, wishlist)
+        return self.orders, self.ranked
+
+    def reset(self):
+        with transaction.atomic():
+            ProductPair.objects.all().delete()
+            ProductPairCursor.objects.all().delete()
+
+    def add_new_orders(self):
+        """Add BᵀB of every settled order past the cursor; returns the products whose rows changed."""
+        settled = Order.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=SETTLE_SECONDS))
+        upto = settled.aggregate(last=Max('id'))['last'] or 0
+        affected = set()
+        while True:
+            with transaction.atomic():
+                cursor, _ = ProductPairCursor.objects.select_for_update().get_or_create(pk=1)
+                after = cursor.last_order_id
+                end = min(upto, after + self.batch_size)
+                if end <= after:
+                    return affected
+                baskets = list(order_baskets(after, end))
+                delta = gram(baskets)
+                add_to_pairs(delta)
+                cursor.last_order_id = end
+                cursor.save(update_fields=['last_order_id', 'updated_at'])
+            self.orders += len(baskets)
+            affected.update(i for i, _ in delta)
+
+    def wishlist_rows(self):
+        """The user × product Gram matrix of the wishlists, as {product: {other: count}}."""
+        lines = Wishlist.objects.order_by('user_id').values_list('user_id', 'product_id').iterator(chunk_size=5000)
+        rows = defaultdict(dict)
+        for (i, j), count in gram([p for _, p in group] for _, group in groupby(lines, key=lambda row: row[0])).items():
+            rows[i][j] = count
+        return rows
+
+    def rank(self, product_ids, wishlist=None):
+        """Rewrite the top-K neighbours of ``product_ids``."""
+        diagonal = {}
+        for chunk in batched(sorted(product_ids), ROW_CHUNK):
+            rows = self.rows(chunk, wishlist)
+            diagonal.update(self.diagonal({j for row in rows.values() for j in row} - diagonal.keys(), wishlist))
+            neighbours = []
+            for i in chunk:
+                scores = (
+                    (count / math.sqrt(diagonal[i] * diagonal[j]), j)
+                    for j, count in rows[i].items()
+                    if j != i and diagonal[i] and diagonal[j]
+                )
+                for rank, (score, j) in enumerate(heapq.nlargest(self.top_k, scores), 1):
+                    neighbours.append(RelatedProduct(product_id=i, related_id=j, rank=rank, score=round(score, 6)))
+            with transaction.atomic():
+                RelatedProduct.objects.filter(product_id__in=chunk).delete()
+                RelatedProduct.objects.bulk_create(neighbours, batch_size=2000)
+            self.ranked += len(chunk)
+        if self.ranked:
+            # Product pages cache their related products fragment under the catalog version
+            bump_catalog_version()
+
+    def rows(self, product_ids, wishlist=None):
+        """Rows of C (plus the weighted wishlist matrix) for ``product_ids``, as {product: {other: count}}."""
+        rows = {i: Counter() for i in product_ids}
+        for i, j, orders in ProductPair.objects.filter(product_id__in=product_ids).values_list('product_id', 'other_id', 'orders'):
+            rows[i][j] += orders
+        if wishlist:
+            for i in product_ids:
+                for j, count in wishlist.get(i, {}).items():
+                    rows[i][j] += self.wishlist_weight * count
+        return rows
+
+    def diagonal(self, product_ids, wishlist=None):
+        values = dict.fromkeys(product_ids, 0)
+        for ids in batched(sorted(product_ids), ROW_CHUNK):
+            values.update(
+                ProductPair.objects.filter(product_id__in=ids, other=F('product')).values_list('product_id', 'orders')
+            )
+        if wishlist:
+            for j in product_ids:
+                values[j] += self.wishlist_weight * wishlist.get(j, {}).get(j, 0)
+        return values
+
+    def neighbours(self, product_ids):
+        """Products sharing at least one order with one of ``product_ids``."""
+        others = set()
+        for ids in batched(sorted(product_ids), ROW_CHUNK):
+            others.update(ProductPair.objects.filter(product_id__in=ids).values_list('other_id', flat=True))
+        return others
+
+
+def related_products(product, limit=4):
+    """
+    Frequently bought together with ``product``, best first. Until the index has
+    neighbours for it (new products, or no orders yet), products from its category.
+    """
+    related = [
+        row.related for row in
+        RelatedProduct.objects.filter(product_id=product.id).select_related('related__category').order_by('rank')[:limit]
+    ]
+    if not related:
+        related = list(_same_category(product)[:limit])
+    return related
+
+
+async def arelated_products(product, limit=4):
+    """related_products for async views."""
+    related = [
+        row.related async for row in
+        RelatedProduct.objects.filter(product_id=product.id).select_related('related__category').order_by('rank')[:limit]
+    ]
+    if not related:
+        related = [p async for p in _same_category(product)[:limit]]
+    return related
+
+
+def _same_category(product):
+    return Product.objects.filter(category_id=product.category_id).exclude(id=product.id).select_related('category')
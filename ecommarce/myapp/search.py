@@ -0,0 +1,122 @@
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+
+class BaseSearchBackend:
+    """
+    Interface for product search backends.
+
+    ``search`` narrows a Product queryset to the matches for ``query`` and annotates
+    each row with ``search_rank`` (lower is better). The index methods are called by
+    the Product/Category signals and by the ``rebuild_search_index`` command.
+    """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def rebuild(self, batch_size=2000):
+        count = 0
+        with transaction.atomic():
+            self.clear()
+            batch = []
+            for product in Product.objects.select_related('category').iterator(chunk_size=batch_size):
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    self.index_products(batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self.index_products(batch)
+                count += len(batch)
+        return count
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Unranked substring search straight against the product table, for backends without an index."""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(category__name__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 index over product name, description and category name.
+
+    The FTS rowid is the product id, so matches join back to myapp_product by
+    primary key. Results are ranked with bm25, weighting name over category
+    over description.
+    """
+
+    table = 'myapp_product_fts'
+
+    @staticmethod
+    def to_match_expression(query):
+        # Quote every term so user input can't inject FTS5 syntax; prefix-match each term.
+        terms = re.findall(r'\w+', query)
+        return ' '.join('"%s"*' % term for term in terms)
+
+    def search(self, queryset, query):
+        match = self.to_match_expression(query)
+        if not match:
+            # Nothing searchable (e.g. only punctuation); keep search_rank so callers can still order by it
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        table = self.table
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', (match,))
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT bm25({table}, 10.0, 1.0, 5.0) FROM {table} '
+                f'WHERE {table} MATCH %s AND rowid = "myapp_product"."id"',
+                (match,),
+                output_field=FloatField(),
+            )
+        )
+
+    def index_products(self, products):
+        rows = [(p.id, p.name, p.description, p.category.name) for p in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table}(rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+
+def get_search_backend():
+    """Return the backend named by settings.SEARCH_BACKEND, or the best one for the default database."""
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return DatabaseSearchBackend()
@@ -0,0 +1,329 @@
+"""
+Deterministic synthetic store data for ``manage.py seed_store``.
+
+Every seeded row is generated from ``(seed, kind, index)`` and the number of
+seeded rows it can point at (categories for a product, products for a
+customer's orders). Rows are drawn in chunks of CHUNK consecutive indexes, each
+chunk from its own generator, so seeding customers 0..N and then N..M gives the
+same rows as seeding 0..M in one go. Runs only ever add rows past the ones
+already seeded, which lets a dataset be grown step by step.
+
+Rows are written with bulk_create, which skips the model signals; ``finish``
+recomputes what those signals maintain in a few set-based queries.
+"""
+import datetime
+import random
+from array import array
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .counters import recompute_ratings, reconcile_counters, repair_denormalized_counts
+from .models import (
+    Cart, CartItem, Category, ContactMessage, Coupon, MessageReply, Order, OrderItem, Page, Product,
+    Review, UserProfile, Wishlist,
+)
+from .page_cache import bump_catalog_version_on_commit
+from .search import get_search_backend
+from .utils import batched
+
+CHUNK = 1000
+EPOCH = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+SPAN_SECONDS = 365 * 24 * 3600
+# Seeded rows are recognised by these, so a run knows where the previous one stopped
+CATEGORY_PREFIX = 'Seed '
+PRODUCT_PREFIX = 'Seed '
+USERNAME_PREFIX = 'seed_'
+COUPON_PREFIX = 'SEED'
+PAGE_PREFIX = 'seed-page-'
+# Every seeded customer can log in with this password
+PASSWORD = 'seed-password'
+
+ADJECTIVES = [
+    'Classic', 'Modern', 'Vintage', 'Compact', 'Deluxe', 'Eco', 'Smart', 'Rustic', 'Premium', 'Portable',
+    'Ergonomic', 'Wireless', 'Handmade', 'Organic', 'Sleek', 'Rugged', 'Minimal', 'Cozy', 'Bold', 'Golden',
+]
+NOUNS = [
+    'Lamp', 'Chair', 'Backpack', 'Headphones', 'Mug', 'Watch', 'Jacket', 'Speaker', 'Notebook', 'Kettle',
+    'Sneakers', 'Blanket', 'Camera', 'Bottle', 'Desk', 'Wallet', 'Sunglasses', 'Keyboard', 'Candle', 'Rug',
+]
+ORDER_STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+ORDER_STATUS_WEIGHTS = [10, 10, 15, 60, 5]
+PAYMENT_STATUS = {'delivered': 'completed', 'cancelled': 'failed'}
+CENT = Decimal('0.01')
+
+
+def generate(seed, kind, start, stop, make):
+    """
+    Yield ``make(index, rng)`` for ``start <= index < stop``. Indexes before ``start``
+    in the first chunk are generated and dropped so the generator is in the same
+    state it would have been in a run that started from the chunk boundary.
+    """
+    for chunk in range(start // CHUNK, (stop + CHUNK - 1) // CHUNK):
+        rng = random.Random(f'{seed}:{kind}:{chunk}')
+        for index in range(chunk * CHUNK, min(stop, (chunk + 1) * CHUNK)):
+            row = make(index, rng)
+            if index >= start:
+                yield row
+
+
+def moment(rng):
+    return EPOCH + datetime.timedelta(seconds=rng.randrange(SPAN_SECONDS))
+
+
+def money(rng, low, high):
+    return (Decimal(rng.randrange(low * 100, high * 100)) / 100).quantize(CENT)
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values given instead of stamping now()."""
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class StoreSeeder:
+    """
+    Grow the seeded part of the store to the requested sizes.
+
+    Each ``seed_*`` method takes a target total, counts the seeded rows already
+    there and generates only the missing indexes. Customers are generated with
+    their profile, cart, orders, wishlist, reviews and contact threads.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, log=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.created = {}
+
+    def _count(self, model, rows):
+        self.created[model.__name__] = self.created.get(model.__name__, 0) + rows
+
+    def _bulk_create(self, model, objs):
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self._count(model, len(objs))
+        return objs
+
+    def category_ids(self):
+        return array('q', Category.objects.filter(name__startswith=CATEGORY_PREFIX).order_by('id').values_list('id', flat=True))
+
+    def product_ids(self):
+        return array('q', (
+            Product.objects.filter(name__startswith=PRODUCT_PREFIX).order_by('id')
+            .values_list('id', flat=True).iterator(chunk_size=10000)
+        ))
+
+    def seed_categories(self, target):
+        start = len(self.category_ids())
+
+        def make(i, rng):
+            return Category(
+                name=f'{CATEGORY_PREFIX}{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}s {i}',
+                description=f'Seeded category {i}.',
+                created_at=moment(rng),
+            )
+
+        with explicit_timestamps(Category):
+            for batch in batched(generate(self.seed, 'category', start, target, make), self.batch_size):
+                self._bulk_create(Category, batch)
+        self.log(f'Categories: {max(start, target)} seeded ({max(0, target - start)} new).')
+
+    def seed_products(self, target):
+        category_ids = self.category_ids()
+        if not category_ids:
+            raise ValueError('Seed some categories before products.')
+        start = len(self.product_ids())
+
+        def make(i, rng):
+            adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+            created = moment(rng)
+            return Product(
+                name=f'{PRODUCT_PREFIX}{adjective} {noun} {i}',
+                description=f'A {adjective.lower()} {noun.lower()}, seeded product number {i}.',
+                price=money(rng, 2, 500),
+                # One product in ten is sold out
+                stock=0 if rng.random() < 0.1 else rng.randrange(1, 500),
+                category_id=category_ids[rng.randrange(len(category_ids))],
+                created_at=created,
+                updated_at=created,
+            )
+
+        with explicit_timestamps(Product):
+            for n, batch in enumerate(batched(generate(self.seed, 'product', start, target, make), self.batch_size), 1):
+                with transaction.atomic():
+                    self._bulk_create(Product, batch)
+                if n % 20 == 0:
+                    self.log(f'  {start + n * self.batch_size} products...')
+        self.log(f'Products: {max(start, target)} seeded ({max(0, target - start)} new).')
+
+    def seed_customers(self, target, orders=3, items=4, carts=0.3, wishlist=3, reviews=1, threads=0.2, replies=4):
+        """
+        Customers with their activity. ``orders``, ``wishlist`` and ``reviews`` are
+        averages per customer, ``items`` the most lines per order, ``carts`` and
+        ``threads`` the share of customers with a cart or a contact thread.
+        """
+        product_ids = self.product_ids()
+        if not product_ids:
+            raise ValueError('Seed some products before customers.')
+        start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        n = len(product_ids)
+
+        def product(rng):
+            # Skewed towards a minority of popular products
+            return int(n * rng.random() ** 2)
+
+        def make(i, rng):
+            joined = moment(rng)
+            spec = {
+                'index': i,
+                'joined': joined,
+                'phone': f'01{rng.randrange(10 ** 9):09d}',
+                'cart': [(p, rng.randint(1, 3)) for p in {product(rng) for _ in range(rng.randint(1, 5))}]
+                if rng.random() < carts else [],
+                'orders': [],
+                'wishlist': sorted({product(rng) for _ in range(rng.randint(0, round(2 * wishlist)))}),
+                'reviews': sorted({product(rng) for _ in range(rng.randint(0, round(2 * reviews)))}),
+                'threads': [],
+            }
+            spec['reviews'] = [(p, rng.choices(range(1, 6), [5, 5, 15, 35, 40])[0], rng.random() < 0.8) for p in spec['reviews']]
+            for _ in range(rng.randint(0, round(2 * orders))):
+                status = rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0]
+                lines = {product(rng): (rng.randint(1, 3), money(rng, 2, 500)) for _ in range(rng.randint(1, items))}
+                spec['orders'].append((status, max(joined, moment(rng)), lines))
+            if rng.random() < threads:
+                spec['threads'].append((max(joined, moment(rng)), rng.randint(0, replies)))
+            return spec
+
+        password = make_password(PASSWORD)
+        with explicit_timestamps(Cart, Order, Wishlist, Review, ContactMessage, MessageReply):
+            batches = batched(generate(self.seed, 'customer', start, target, make), max(1, self.batch_size // 10))
+            for batch in batches:
+                with transaction.atomic():
+                    self._write_customers(batch, product_ids, password)
+        self.log(f'Customers: {max(start, target)} seeded ({max(0, target - start)} new).')
+
+    def _write_customers(self, specs, product_ids, password):
+        users = self._bulk_create(User, [
+            User(
+                username=f'{USERNAME_PREFIX}{spec["index"]:07d}', email=f'{USERNAME_PREFIX}{spec["index"]}@example.com',
+                password=password, date_joined=spec['joined'],
+            )
+            for spec in specs
+        ])
+        self._bulk_create(UserProfile, [
+            UserProfile(user=user, phone=spec['phone'], address=f'{spec["index"]} Seed Street')
+            for user, spec in zip(users, specs)
+        ])
+
+        with_cart = [(user, spec) for user, spec in zip(users, specs) if spec['cart']]
+        carts = self._bulk_create(Cart, [Cart(user=user, created_at=spec['joined']) for user, spec in with_cart])
+        self._bulk_create(CartItem, [
+            CartItem(cart=cart, product_id=product_ids[p], quantity=quantity)
+            for cart, (_, spec) in zip(carts, with_cart) for p, quantity in spec['cart']
+        ])
+
+        order_specs = [
+            (user, spec, n, order) for user, spec in zip(users, specs) for n, order in enumerate(spec['orders'])
+        ]
+        orders = self._bulk_create(Order, [
+            Order(
+                user=user,
+                order_number=f'SEED{spec["index"]:09d}{n:03d}',
+                total_amount=sum((price * quantity for quantity, price in lines.values()), Decimal('0')),
+                status=status,
+                payment_method='cod',
+                payment_status=PAYMENT_STATUS.get(status, 'pending'),
+                shipping_address=f'{spec["index"]} Seed Street',
+                phone=spec['phone'],
+                created_at=created,
+                updated_at=created,
+                item_count=len(lines),
+            )
+            for user, spec, n, (status, created, lines) in order_specs
+        ])
+        self._bulk_create(OrderItem, [
+            OrderItem(order=order, product_id=product_ids[p], quantity=quantity, price=price)
+            for order, (_, _, _, (_, _, lines)) in zip(orders, order_specs)
+            for p, (quantity, price) in lines.items()
+        ])
+
+        self._bulk_create(Wishlist, [
+            Wishlist(user=user, product_id=product_ids[p], added_at=spec['joined'])
+            for user, spec in zip(users, specs) for p in spec['wishlist']
+        ])
+        self._bulk_create(Review, [
+            Review(
+                user=user, product_id=product_ids[p], rating=rating, is_approved=approved,
+                comment=f'{rating} stars from seeded customer {spec["index"]}.', created_at=spec['joined'],
+            )
+            for user, spec in zip(users, specs) for p, rating, approved in spec['reviews']
+        ])
+
+        thread_specs = [(user, spec, thread) for user, spec in zip(users, specs) for thread in spec['threads']]
+        messages = self._bulk_create(ContactMessage, [
+            ContactMessage(
+                user=user, name=user.username, email=user.email, subject=f'Question {spec["index"]}',
+                message='Where is my order?', is_replied=count > 0, created_at=created,
+                replied_at=created + datetime.timedelta(hours=1) if count else None,
+            )
+            for user, spec, (created, count) in thread_specs
+        ])
+        self._bulk_create(MessageReply, [
+            MessageReply(
+                message=message, user=None if r % 2 == 0 else user, is_admin=r % 2 == 0,
+                content=f'Reply {r}', created_at=created + datetime.timedelta(hours=r + 1),
+            )
+            for message, (user, _, (created, count)) in zip(messages, thread_specs) for r in range(count)
+        ])
+
+    def seed_coupons(self, target):
+        start = Coupon.objects.filter(code__startswith=COUPON_PREFIX).count()
+
+        def make(i, rng):
+            valid_from = moment(rng)
+            return Coupon(
+                code=f'{COUPON_PREFIX}{i:06d}', discount_percentage=rng.choice([5, 10, 15, 20, 25]),
+                valid_from=valid_from, valid_to=valid_from + datetime.timedelta(days=rng.randint(7, 730)),
+                active=rng.random() < 0.9,
+            )
+
+        for batch in batched(generate(self.seed, 'coupon', start, target, make), self.batch_size):
+            self._bulk_create(Coupon, batch)
+
+    def seed_pages(self, target):
+        start = Page.objects.filter(slug__startswith=PAGE_PREFIX).count()
+
+        def make(i, rng):
+            return Page(
+                title=f'Seeded page {i}', slug=f'{PAGE_PREFIX}{i}',
+                content=' '.join(rng.choice(NOUNS).lower() for _ in range(200)), created_at=moment(rng),
+            )
+
+        with explicit_timestamps(Page):
+            for batch in batched(generate(self.seed, 'page', start, target, make), self.batch_size):
+                self._bulk_create(Page, batch)
+
+    def finish(self, index=True):
+        """Recompute what the skipped signals maintain."""
+        self.log('Repairing denormalized counts, ratings and storefront counters...')
+        repair_denormalized_counts()
+        recompute_ratings()
+        reconcile_counters()
+        if index:
+            self.log('Rebuilding the search index...')
+            get_search_backend().rebuild()
+        bump_catalog_version_on_commit()
@@ -0,0 +1,41 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from myapp.images import IMAGE_SIZES, derivative_name, srcset
+
+register = template.Library()
+
+# How wide each rendition is laid out, for the browser to pick from the srcset
+SIZES_ATTR = {
+    'thumb': '150px',
+    'card': '(max-width: 768px) 50vw, 300px',
+    'detail': '(max-width: 992px) 100vw, 600px',
+}
+
+
+@register.simple_tag
+def responsive_image(image, size='card', alt='', css_class='', style=''):
+    """
+    Render ``image`` as a <picture> with WebP and JPEG srcsets of its derivatives.
+
+    Falls back to the original upload until the derivatives have been generated,
+    which images.record_derivatives notes on the row: rendering never touches storage.
+    """
+    if not image:
+        return ''
+    if getattr(image.instance, 'image_derivatives', '') != image.name:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">',
+            image.url, alt, css_class, style,
+        )
+    fallback = default_storage.url(derivative_name(image.name, size if size in IMAGE_SIZES else 'card', 'jpg'))
+    sizes = SIZES_ATTR.get(size, SIZES_ATTR['card'])
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy">'
+        '</picture>',
+        srcset(image.name, 'webp'), sizes,
+        fallback, srcset(image.name, 'jpg'), sizes, alt, css_class, style,
+    )
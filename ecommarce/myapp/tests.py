@@ -1,3 +1,1924 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import importlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import closing
+from decimal import Decimal
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.template import Context, Template
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import async_views, cart, chat, jobs, order_numbers, pricing, seeding, views
+from .admin import ProductAdmin
+from .cart import get_cart_summary
+from .counters import compute_counters, get_counters, recompute_ratings, repair_denormalized_counts
+from .db import configure_sqlite, retry_on_lock
+from .images import IMAGE_SIZES, derivative_name, generate_derivatives
+from .loadtest import DEFAULT_MIX, LoadClient, summarize
+from .management.commands.check_media import walk_media
+from .middleware import QueryRecorder
+from .models import (
+    Cart, CartItem, Category, ContactMessage, Coupon, Job, MessageReply, Order, OrderItem, Page, Product, ProductPair,
+    ProductPairCursor, RelatedProduct, Review, StoreCounter, Wishlist,
+)
+from .orders import InsufficientStock, place_order
+from .page_cache import CATALOG_VERSION_KEY, catalog_version
+from .pagination import KeysetPaginator
+from .pricing import get_coupon, price_cart
+from .product_io import ProductImporter
+from .recommendations import RelatedProductsBuilder
+from .search import SQLiteFTSBackend
+from .seeding import StoreSeeder
+from .templatetags.image_tags import SIZES_ATTR
+from .urls import urlpatterns
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN checks are SQLite specific')
+class QueryPlanTests(TestCase):
+    """
+    Run the hot views, EXPLAIN every SELECT they issue and fail on plans that
+    would degrade with table size: a full table scan or a temp B-tree sort.
+
+    A bare ``SCAN table`` is allowed when the query has a LIMIT (SQLite is walking
+    the table in rowid order and stops early) and for the small lookup tables below.
+    """
+
+    # Tables that are read in full by design (the category sidebar)
+    FULL_SCAN_ALLOWED = {'myapp_category'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', password='pw')
+        cls.admin = User.objects.create_user('admin', password='pw')
+        cls.admin.userprofile.role = 'admin'
+        cls.admin.userprofile.save()
+
+        cls.categories = [Category.objects.create(name=f'Category {i}') for i in range(3)]
+        for i in range(40):
+            Product.objects.create(
+                name=f'Product {i}', description='Test product', price=i + 1,
+                stock=i % 4, category=cls.categories[i % 3],
+            )
+        for i in range(25):
+            Order.objects.create(
+                user=cls.customer, order_number=f'T{i}', total_amount=10, payment_method='cod',
+                shipping_address='Somewhere', phone='123', status=['pending', 'shipped'][i % 2],
+            )
+        cls.thread = ContactMessage.objects.create(
+            user=cls.customer, name='C', email='c@example.com', subject='Hello', message='Hi',
+        )
+        for i in range(12):
+            ContactMessage.objects.create(
+                user=cls.customer, name='C', email='c@example.com', subject=f'Subject {i}', message='Hi',
+            )
+        for i in range(5):
+            MessageReply.objects.create(message=cls.thread, user=cls.customer, content=f'Reply {i}')
+
+    def setUp(self):
+        # Cached pages and fragments would hide the queries under test
+        cache.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedPlans(self, user, url_name, follow_cursor=False, **params):
+        self.client.force_login(user)
+        url = reverse(url_name, kwargs=params.pop('kwargs', None))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'django_session' in sql:
+                continue
+            for step in self.explain(sql):
+                with self.subTest(view=url_name, params=params, step=step):
+                    self.assertNotIn('USE TEMP B-TREE', step, f'{url_name} sorts without an index:\n{sql}')
+                    scan = re.fullmatch(r'SCAN (\w+)', step)
+                    if scan and scan.group(1) not in self.FULL_SCAN_ALLOWED:
+                        self.assertIn(' LIMIT ', sql, f'{url_name} scans {scan.group(1)} in full:\n{sql}')
+
+        page_obj = response.context.get('page_obj') if response.context else None
+        if follow_cursor and page_obj is not None and page_obj.next_cursor:
+            self.assertIndexedPlans(user, url_name, cursor=page_obj.next_cursor, **params)
+
+    def test_shop(self):
+        for sort in ('name', 'price_low', 'price_high', 'newest', 'top_rated'):
+            self.assertIndexedPlans(self.customer, 'shop', follow_cursor=True, sort=sort)
+            self.assertIndexedPlans(self.customer, 'shop', follow_cursor=True, sort=sort, category=self.categories[1].id)
+        self.assertIndexedPlans(self.customer, 'shop', follow_cursor=True, sort='top_rated', min_rating=3)
+
+    def test_home(self):
+        self.assertIndexedPlans(self.customer, 'home')
+
+    def test_customer_orders(self):
+        self.assertIndexedPlans(self.customer, 'order_history', follow_cursor=True)
+        self.assertIndexedPlans(self.customer, 'customer_dashboard')
+
+    def test_customer_messages(self):
+        self.assertIndexedPlans(self.customer, 'customer_messages')
+        self.assertIndexedPlans(self.customer, 'get_chat_messages', kwargs={'message_id': self.thread.id})
+        self.assertIndexedPlans(self.customer, 'get_chat_messages', kwargs={'message_id': self.thread.id}, since=2)
+
+    def test_admin_lists(self):
+        self.assertIndexedPlans(self.admin, 'admin_dashboard')
+        for url_name in ('admin_orders', 'admin_users', 'admin_messages', 'admin_products'):
+            self.assertIndexedPlans(self.admin, url_name, follow_cursor=True)
+
+
+class QueryBudgetMixin:
+    """
+    Test helper that fails when a request runs more queries than its declared budget.
+
+    Subclasses declare ``query_budgets = {url_name: max_queries}``. The failure
+    message lists repeated statement shapes, which is usually the N+1 responsible.
+    """
+
+    query_budgets = {}
+
+    def assertQueryBudget(self, url_name, method='get', kwargs=None, data=None):
+        budget = self.query_budgets[url_name]
+        url = reverse(url_name, kwargs=kwargs)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = getattr(self.client, method)(url, data or {})
+        repeated = ''.join(f'\n  {count} x {template}' for template, count in recorder.repeated(2))
+        self.assertLessEqual(
+            recorder.count, budget,
+            f'{url_name} ran {recorder.count} queries, budget is {budget}.{repeated}',
+        )
+        return response
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every URL name in myapp/urls.py has a query budget, independent of how many rows it shows."""
+
+    query_budgets = {
+        'home': 9,
+        'shop': 8,
+        'product_detail': 8,
+        'contact': 4,
+        'about': 4,
+        'register': 4,
+        'login': 4,
+        'logout': 4,
+        'view_cart': 7,
+        'add_to_cart': 10,
+        'remove_from_cart': 7,
+        'update_cart_quantity': 8,
+        'checkout': 7,
+        'apply_coupon': 6,
+        'remove_coupon': 4,
+        'order_confirmation': 4,
+        'order_detail': 6,
+        'order_history': 5,
+        'admin_dashboard': 6,
+        'admin_products': 5,
+        'add_product': 5,
+        'edit_product': 6,
+        'delete_product': 17,
+        'admin_orders': 5,
+        'export_orders': 5,
+        'update_order_status': 12,
+        'admin_users': 5,
+        'delete_user': 5,
+        'admin_categories': 4,
+        'add_category': 4,
+        'edit_category': 5,
+        'delete_category': 5,
+        'admin_messages': 5,
+        'reply_message': 6,
+        'customer_dashboard': 7,
+        'update_profile': 4,
+        'customer_messages': 5,
+        'customer_message_detail': 6,
+        'get_chat_messages': 6,
+        'chat_stream': 2,
+        'view_wishlist': 5,
+        'add_to_wishlist': 7,
+        'remove_from_wishlist': 6,
+        'page_detail': 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', password='pw')
+        cls.admin = User.objects.create_user('admin', password='pw')
+        cls.admin.userprofile.role = 'admin'
+        cls.admin.userprofile.save()
+        cls.category = Category.objects.create(name='Category')
+        cls.products = [
+            Product.objects.create(name=f'Product {i}', description='Test', price=5, stock=50, category=cls.category)
+            for i in range(10)
+        ]
+        cls.empty_category = Category.objects.create(name='Empty')
+
+        cls.cart = Cart.objects.create(user=cls.customer)
+        cls.cart_items = [CartItem.objects.create(cart=cls.cart, product=p, quantity=1) for p in cls.products[:6]]
+        cls.order = Order.objects.create(
+            user=cls.customer, order_number='T-main', total_amount=25, payment_method='cod', shipping_address='Somewhere', phone='123',
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.order, product=p, quantity=1, price=p.price) for p in cls.products[:5]
+        ])
+        for i in range(5):
+            Order.objects.create(
+                user=cls.customer, order_number=f'T{i}', total_amount=5, payment_method='cod', shipping_address='Somewhere', phone='123',
+            )
+        cls.wishlist = [Wishlist.objects.create(user=cls.customer, product=p) for p in cls.products[:5]]
+        cls.thread = ContactMessage.objects.create(
+            user=cls.customer, name='C', email='c@example.com', subject='Hello', message='Hi',
+        )
+        for i in range(6):
+            MessageReply.objects.create(message=cls.thread, user=cls.customer, content=f'Reply {i}', is_admin=i % 2 == 0)
+        cls.other_user = User.objects.create_user('other', password='pw')
+
+    def setUp(self):
+        cache.clear()
+
+    def as_customer(self):
+        self.client.force_login(self.customer)
+
+    def as_admin(self):
+        self.client.force_login(self.admin)
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names - set(self.query_budgets), set())
+
+    def test_public_pages(self):
+        for name in ('home', 'shop', 'contact', 'about', 'register', 'login'):
+            self.assertQueryBudget(name)
+        self.assertQueryBudget('product_detail', kwargs={'product_id': self.products[0].id})
+        self.assertQueryBudget('page_detail', kwargs={'slug': 'missing'})
+
+    def test_customer_pages(self):
+        self.as_customer()
+        for name in ('home', 'shop', 'view_cart', 'checkout', 'order_history', 'customer_dashboard',
+                     'update_profile', 'customer_messages', 'view_wishlist'):
+            self.assertQueryBudget(name)
+        self.assertQueryBudget('product_detail', kwargs={'product_id': self.products[0].id})
+        self.assertQueryBudget('order_detail', kwargs={'order_id': self.order.id})
+        self.assertQueryBudget('order_confirmation', kwargs={'order_id': 0})
+        self.assertQueryBudget('customer_message_detail', kwargs={'message_id': self.thread.id})
+        self.assertQueryBudget('get_chat_messages', kwargs={'message_id': self.thread.id})
+        self.assertQueryBudget('chat_stream', kwargs={'message_id': self.thread.id})
+
+    def test_customer_actions(self):
+        self.as_customer()
+        self.assertQueryBudget('add_to_cart', 'post', kwargs={'product_id': self.products[7].id}, data={'quantity': 1})
+        self.assertQueryBudget('update_cart_quantity', 'post', kwargs={'item_id': self.cart_items[0].id}, data={'quantity': 2})
+        self.assertQueryBudget('remove_from_cart', kwargs={'item_id': self.cart_items[1].id})
+        self.assertQueryBudget('add_to_wishlist', kwargs={'product_id': self.products[8].id})
+        self.assertQueryBudget('remove_from_wishlist', kwargs={'item_id': self.wishlist[0].id})
+        self.assertQueryBudget('apply_coupon', 'post', data={'code': 'NOPE'})
+        self.assertQueryBudget('remove_coupon')
+        self.assertQueryBudget('logout')
+
+    def test_admin_pages(self):
+        self.as_admin()
+        for name in ('admin_dashboard', 'admin_products', 'add_product', 'admin_orders', 'admin_users',
+                     'admin_categories', 'add_category', 'admin_messages'):
+            self.assertQueryBudget(name)
+        self.assertQueryBudget('edit_product', kwargs={'product_id': self.products[0].id})
+        self.assertQueryBudget('edit_category', kwargs={'category_id': self.category.id})
+        self.assertQueryBudget('delete_category', kwargs={'category_id': self.category.id})
+        self.assertQueryBudget('delete_user', kwargs={'user_id': self.other_user.id})
+        self.assertQueryBudget('reply_message', kwargs={'message_id': self.thread.id})
+        self.assertQueryBudget('order_detail', kwargs={'order_id': self.order.id})
+
+    def test_admin_actions(self):
+        self.as_admin()
+        self.assertQueryBudget('update_order_status', 'post', kwargs={'order_id': self.order.id}, data={'status': 'shipped'})
+        self.assertQueryBudget('delete_product', 'post', kwargs={'product_id': self.products[9].id})
+
+
+@override_settings(TIME_ZONE='Asia/Dhaka')
+class OrderExportTests(TestCase):
+    # Same budget as QueryBudgetTests, counted over the whole streamed body
+    budget = QueryBudgetTests.query_budgets['export_orders']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', email='c@example.com', password='pw')
+        cls.admin = User.objects.create_user('admin', password='pw')
+        cls.admin.userprofile.role = 'admin'
+        cls.admin.userprofile.save()
+        category = Category.objects.create(name='Category')
+        lamp, desk = (
+            Product.objects.create(name=name, description='', price=price, stock=5, category=category)
+            for name, price in (('Lamp', 5), ('Desk', 40))
+        )
+        cls.orders = {}
+        # Day boundaries are local (Asia/Dhaka, UTC+6)
+        for number, created, status, items in (
+            ('A', datetime.datetime(2026, 3, 1, 12), 'pending', [(lamp, 2), (desk, 1)]),
+            ('B', datetime.datetime(2026, 3, 15, 0, 0), 'shipped', [(desk, 1)]),
+            ('C', datetime.datetime(2026, 3, 31, 23, 30), 'cancelled', []),
+            ('D', datetime.datetime(2026, 4, 1, 0, 0), 'delivered', [(lamp, 1)]),
+        ):
+            order = Order.objects.create(
+                user=cls.customer, order_number=number, status=status, total_amount=sum(p.price * q for p, q in items),
+                payment_method='cod', shipping_address='Somewhere', phone='123',
+            )
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(created))
+            for product, quantity in items:
+                OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+            cls.orders[number] = order
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def export(self, **params):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            # Queries run while the body streams, so count them over the whole download
+            response = self.client.get(reverse('export_orders'), params)
+            body = b''.join(response.streaming_content).decode()
+        self.assertLessEqual(recorder.count, self.budget)
+        return response, body
+
+    def numbers(self, **params):
+        _, body = self.export(format='jsonl', **params)
+        return [json.loads(line)['order_number'] for line in body.splitlines()]
+
+    def test_csv(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.csv"')
+        rows = list(csv.DictReader(StringIO(body)))
+        # One row per item, and one with blank item columns for an order without any
+        self.assertEqual([(row['order_number'], row['product_name']) for row in rows], [
+            ('A', 'Lamp'), ('A', 'Desk'), ('B', 'Desk'), ('C', ''), ('D', 'Lamp'),
+        ])
+        self.assertEqual(rows[0]['quantity'], '2')
+        self.assertEqual(rows[0]['price'], '5.00')
+        self.assertEqual(rows[0]['total_amount'], '50.00')
+        self.assertEqual(rows[0]['item_count'], '2')
+        self.assertEqual((rows[0]['username'], rows[0]['email']), ('customer', 'c@example.com'))
+        self.assertEqual(rows[0]['created_at'], '2026-03-01T06:00:00+00:00')
+
+    def test_jsonl(self):
+        response, body = self.export(format='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.jsonl"')
+        orders = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([order['order_number'] for order in orders], ['A', 'B', 'C', 'D'])
+        first = orders[0]
+        self.assertEqual((first['id'], first['status'], first['total_amount']), (self.orders['A'].id, 'pending', '50.00'))
+        self.assertEqual((first['username'], first['email']), ('customer', 'c@example.com'))
+        self.assertNotIn('user__username', first)
+        self.assertEqual(first['items'], [
+            {'product_id': Product.objects.get(name='Lamp').id, 'product_name': 'Lamp', 'quantity': 2, 'price': '5.00'},
+            {'product_id': Product.objects.get(name='Desk').id, 'product_name': 'Desk', 'quantity': 1, 'price': '40.00'},
+        ])
+        self.assertEqual(orders[2]['items'], [])
+
+    def test_date_filters(self):
+        self.assertEqual(self.numbers(date_from='2026-03-15', date_to='2026-03-31'), ['B', 'C'])
+        self.assertEqual(self.numbers(date_from='2026-04-01'), ['D'])
+        self.assertEqual(self.numbers(date_to='2026-03-14'), ['A'])
+        self.assertEqual(self.numbers(date_from='2026-05-01'), [])
+        # Unparseable dates are ignored
+        self.assertEqual(self.numbers(date_from='yesterday', date_to='2026-13-01'), ['A', 'B', 'C', 'D'])
+
+        response, _ = self.export(date_from='2026-03-15', date_to='2026-03-31')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders-2026-03-15-2026-03-31.csv"')
+
+    def test_status_filter(self):
+        self.assertEqual(self.numbers(status=['shipped', 'delivered']), ['B', 'D'])
+        self.assertEqual(self.numbers(status=['cancelled', 'bogus'], date_to='2026-03-31'), ['C'])
+        # Only unknown statuses: no status filter at all
+        self.assertEqual(self.numbers(status='bogus'), ['A', 'B', 'C', 'D'])
+
+    def test_admins_only(self):
+        self.client.logout()
+        response = self.client.get(reverse('export_orders'))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('export_orders'), {'format': 'jsonl'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertNotIn(b'Somewhere', response.content)
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Category')
+        self.products = [
+            Product.objects.create(name=f'P{i}', description='Test', price=i + 1, stock=5, category=category)
+            for i in range(12)
+        ]
+        self.customer = User.objects.create_user('customer')
+        self.cart = Cart.objects.create(user=self.customer)
+
+    def fill_cart(self, quantities):
+        CartItem.objects.filter(cart=self.cart).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=self.products[i], quantity=quantity) for i, quantity in quantities.items()
+        ])
+        return list(CartItem.objects.filter(cart=self.cart).select_related('product').order_by('id'))
+
+    def place(self, cart_items):
+        return place_order(self.customer, cart_items, payment_method='cod', shipping_address='x', phone='1')
+
+    def stock(self):
+        return list(Product.objects.order_by('id').values_list('stock', flat=True))
+
+    def test_order_is_placed(self):
+        order = self.place(self.fill_cart({0: 2, 1: 5}))
+        self.assertEqual(order.total_amount, Decimal('12.00'))
+        self.assertEqual(order.item_count, 2)
+        self.assertEqual(
+            list(order.orderitem_set.order_by('product_id').values_list('product_id', 'quantity', 'price')),
+            [(self.products[0].id, 2, Decimal('1.00')), (self.products[1].id, 5, Decimal('2.00'))],
+        )
+        self.assertEqual(self.stock()[:3], [3, 0, 5])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_query_count_is_flat(self):
+        counts = []
+        for lines in (1, 12):
+            cart_items = self.fill_cart({i: 1 for i in range(lines)})
+            with CaptureQueriesContext(connection) as queries:
+                self.place(cart_items)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_insufficient_stock_writes_nothing(self):
+        cart_items = self.fill_cart({0: 6, 1: 1, 2: 9})
+        with self.assertRaises(InsufficientStock) as raised:
+            self.place(cart_items)
+        self.assertEqual(
+            [(item.product_id, available) for item, available in raised.exception.shortages],
+            [(self.products[0].id, 5), (self.products[2].id, 5)],
+        )
+        self.assertEqual(self.stock(), [5] * 12)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 3)
+
+    def test_checkout_reports_every_short_line(self):
+        self.fill_cart({0: 6, 1: 1, 2: 9})
+        self.client.force_login(self.customer)
+        response = self.client.post(reverse('checkout'), {
+            'shipping_address': 'Somewhere', 'phone': '123', 'payment_method': 'cod',
+        }, follow=True)
+        self.assertRedirects(response, reverse('view_cart'))
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['Only 5 x P0 left in stock, you have 6 in your cart.', 'Only 5 x P2 left in stock, you have 9 in your cart.'],
+        )
+        self.assertEqual(self.stock(), [5] * 12)
+
+
+class PlaceOrderConcurrencyTests(TransactionTestCase):
+    def test_no_oversell(self):
+        product = Product.objects.create(
+            name='Last units', description='Test', price=1, stock=3, category=Category.objects.create(name='Category'),
+        )
+        buyers = []
+        for i in range(6):
+            user = User.objects.create_user(f'buyer{i}')
+            item = CartItem.objects.create(cart=Cart.objects.create(user=user), product=product, quantity=1)
+            buyers.append((user, CartItem.objects.select_related('product').get(id=item.id)))
+
+        barrier = threading.Barrier(len(buyers))
+        outcomes = []
+
+        def buy(user, item):
+            try:
+                barrier.wait()
+                place = retry_on_lock(place_order, attempts=50, base_delay=0.01)
+                place(user, [item], payment_method='cod', shipping_address='x', phone='1')
+                outcomes.append('ok')
+            except InsufficientStock:
+                outcomes.append('short')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=buyer) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['ok'] * 3 + ['short'] * 3)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(OrderItem.objects.count(), 3)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'FTS5 index')
+class SearchTests(TestCase):
+    def setUp(self):
+        self.lighting = Category.objects.create(name='Lighting')
+        furniture = Category.objects.create(name='Furniture')
+        for name, description, category in (
+            ('Oak Desk', 'Solid oak, fits a lamp in the corner', furniture),
+            ('Desk Lamp', 'Adjustable arm', self.lighting),
+            ('Floor Light', 'Tall and warm', self.lighting),
+            ('Armchair', 'Soft', furniture),
+        ):
+            Product.objects.create(name=name, description=description, price=1, stock=1, category=category)
+        self.backend = SQLiteFTSBackend()
+
+    def search(self, query):
+        return list(self.backend.search(Product.objects.all(), query).order_by('search_rank', 'id').values_list('name', flat=True))
+
+    def test_match_and_rank(self):
+        # Name matches outrank description matches; terms are prefix-matched
+        self.assertEqual(self.search('lamp'), ['Desk Lamp', 'Oak Desk'])
+        self.assertEqual(self.search('desk lam'), ['Desk Lamp', 'Oak Desk'])
+        self.assertEqual(self.search('lighting'), ['Desk Lamp', 'Floor Light'])
+        self.assertEqual(self.search('sofa'), [])
+
+    def test_index_follows_signals(self):
+        product = Product.objects.get(name='Armchair')
+        product.name = 'Reading Chair'
+        product.save()
+        self.assertEqual(self.search('armchair'), [])
+        self.assertEqual(self.search('reading'), ['Reading Chair'])
+
+        # Only a rename touches the index
+        lighting = Category.objects.get(pk=self.lighting.pk)
+        lighting.description = 'Bulbs and shades'
+        with CaptureQueriesContext(connection) as queries:
+            lighting.save()
+        self.assertFalse([q for q in queries if 'myapp_product_fts' in q['sql']])
+        lighting.name = 'Lamps'
+        lighting.save()
+        self.assertEqual(self.search('lamps'), ['Desk Lamp', 'Floor Light'])
+        with CaptureQueriesContext(connection) as queries:
+            lighting.save()
+        self.assertFalse([q for q in queries if 'myapp_product_fts' in q['sql']])
+
+        Product.objects.get(name='Desk Lamp').delete()
+        self.assertEqual(self.search('lamp'), ['Floor Light', 'Oak Desk'])
+
+    def test_fts_syntax_is_quoted(self):
+        for query in ('"', '"desk', 'lamp*', '-lamp', 'desk NEAR lamp', 'NEAR(desk lamp)', 'AND OR NOT', '^desk', ':', ''):
+            with self.subTest(query=query):
+                self.search(query)
+                self.assertEqual(self.client.get(reverse('shop'), {'search': query}).status_code, 200)
+        self.assertEqual(self.search('-lamp*'), ['Desk Lamp', 'Oak Desk'])
+
+    def test_rebuild(self):
+        self.backend.clear()
+        self.assertEqual(self.search('desk'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', batch_size=3, stdout=out)
+        self.assertIn('Indexed 4 products', out.getvalue())
+        self.assertEqual(self.search('desk'), ['Desk Lamp', 'Oak Desk'])
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Things')
+        now = timezone.now()
+        # Few distinct values per sort key, so every page boundary falls inside a run of ties
+        for i in range(11):
+            product = Product.objects.create(
+                name=f'Item {i % 3}', description='x', price=Decimal(i % 4), stock=1, category=category
+            )
+            Product.objects.filter(pk=product.pk).update(
+                created_at=now - datetime.timedelta(days=i % 2),
+                rating_count=i % 3, rating_avg=(i % 2) * 4.5,
+            )
+
+    def expected(self, ordering):
+        rows = list(Product.objects.all())
+        # The pk tie-breaker runs in the direction of the last key
+        keys = ordering + ['-id' if ordering[-1].startswith('-') else 'id']
+        for key in reversed(keys):
+            rows.sort(key=lambda row: getattr(row, key.lstrip('-')), reverse=key.startswith('-'))
+        return [row.pk for row in rows]
+
+    def test_walks_every_shop_ordering(self):
+        for ordering in (['price'], ['-price'], ['-created_at'], ['-rating_avg', '-rating_count'], ['name']):
+            with self.subTest(ordering=ordering):
+                paginator = KeysetPaginator(Product.objects.all(), 3, ordering)
+                pages, page = [], paginator.get_page()
+                while True:
+                    pages.append([row.pk for row in page])
+                    if not page.has_next():
+                        break
+                    page = paginator.get_page(page.next_cursor)
+                self.assertEqual([pk for rows in pages for pk in rows], self.expected(ordering))
+                self.assertEqual([len(rows) for rows in pages], [3, 3, 3, 2])
+                self.assertEqual(page.number, 4)
+
+                # And back again from the last page
+                for rows in reversed(pages[:-1]):
+                    page = paginator.get_page(page.previous_cursor)
+                    self.assertEqual([row.pk for row in page], rows)
+                self.assertEqual(page.number, 1)
+                self.assertFalse(page.has_previous())
+                self.assertIsNone(page.previous_cursor)
+
+    def test_bad_cursor_gives_page_one(self):
+        paginator = KeysetPaginator(Product.objects.all(), 3, ['price'])
+        first = [row.pk for row in paginator.get_page()]
+        encode = self.encode
+        for cursor in (
+            'not a cursor', '!!!!', encode('not json'), encode('[]'), encode('"k"'), encode('{}'),
+            encode('{"k": [1], "o": 0, "r": false}'),
+            encode('{"k": ["cheap", 1], "o": 0, "r": false}'),
+            encode('{"k": [1, "one"], "o": 0, "r": false}'),
+            encode('{"k": [1, 1], "o": "three", "r": false}'),
+            encode('{"k": [1, 1], "o": Infinity, "r": false}'),
+            encode('{"k": [1, 1e400], "o": 0, "r": false}'),
+            encode('{"k": [1, 100000000000000000000000000000], "o": 0, "r": false}'),
+            encode('{"k": [null, 1], "o": 0, "r": false}'),
+        ):
+            with self.subTest(cursor=cursor):
+                page = paginator.get_page(cursor)
+                self.assertEqual([row.pk for row in page], first)
+                self.assertEqual(page.number, 1)
+                self.assertEqual(self.client.get(reverse('shop'), {'cursor': cursor}).status_code, 200)
+
+    def test_bad_search_cursor_gives_page_one(self):
+        # search_rank is an annotation, not a model field; its cursor value is checked all the same
+        category = Category.objects.get()
+        for i in range(5):
+            Product.objects.create(name=f'Item extra {i}', description='x', price=1, stock=1, category=category)
+        first = self.client.get(reverse('shop'), {'search': 'item'}).context['page_obj']
+        self.assertTrue(first.has_next())
+        second = self.client.get(reverse('shop'), {'search': 'item', 'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(second.number, 2)
+
+        pk = Product.objects.first().pk
+        for key in ('"abc"', 'null', 'Infinity', 'NaN', '[1]'):
+            cursor = self.encode(f'{{"k": [{key}, {pk}], "o": 12, "r": false}}')
+            with self.subTest(key=key):
+                response = self.client.get(reverse('shop'), {'search': 'item', 'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['page_obj'].number, 1)
+
+    @staticmethod
+    def encode(payload):
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+class DenormalizedCountTests(TestCase):
+    def setUp(self):
+        self.first = Category.objects.create(name='First')
+        self.second = Category.objects.create(name='Second')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='Test', price=2, stock=10, category=self.first)
+            for i in range(3)
+        ]
+
+    def counts(self):
+        return list(Category.objects.order_by('id').values_list('product_count', flat=True))
+
+    def test_product_count_follows_products(self):
+        self.assertEqual(self.counts(), [3, 0])
+        product = Product.objects.get(id=self.products[0].id)
+        product.category = self.second
+        product.save()
+        self.assertEqual(self.counts(), [2, 1])
+        product.save()
+        self.assertEqual(self.counts(), [2, 1])
+        self.products[1].delete()
+        self.assertEqual(self.counts(), [1, 1])
+
+    def test_item_count_follows_order_lines(self):
+        customer = User.objects.create_user('customer')
+        cart = Cart.objects.create(user=customer)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        order = place_order(customer, cart.cartitem_set.all(), payment_method='cod', shipping_address='x', phone='1')
+        order.refresh_from_db()
+        self.assertEqual(order.item_count, 3)
+
+        order.orderitem_set.first().delete()
+        order.refresh_from_db()
+        self.assertEqual(order.item_count, 2)
+
+    def test_repair(self):
+        order = Order.objects.create(
+            user=User.objects.create_user('customer'), order_number='T1', total_amount=2,
+            payment_method='cod', shipping_address='x', phone='1',
+        )
+        OrderItem.objects.create(order=order, product=self.products[0], quantity=1, price=2)
+        Category.objects.update(product_count=7)
+        Order.objects.update(item_count=0)
+
+        self.assertEqual(repair_denormalized_counts(), (2, 1))
+        self.assertEqual(self.counts(), [3, 0])
+        order.refresh_from_db()
+        self.assertEqual(order.item_count, 1)
+        self.assertEqual(repair_denormalized_counts(), (0, 0))
+
+
+class StoreCounterTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pw')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        self.category = Category.objects.create(name='Things')
+        Product.objects.create(name='Lamp', description='x', price=1, stock=1, category=self.category)
+
+    def order(self, total, status='pending'):
+        return Order.objects.create(
+            user=self.admin, total_amount=total, status=status, payment_method='cod', shipping_address='Somewhere', phone='123',
+        )
+
+    def assertCountersExact(self):
+        self.assertEqual(get_counters(), compute_counters())
+
+    def test_first_write_seeds_exact_value(self):
+        StoreCounter.objects.all().delete()
+        Product.objects.create(name='Desk', description='x', price=1, stock=1, category=self.category)
+        # Seeded from the table (which already holds the new row), not from the +1 delta
+        self.assertEqual(StoreCounter.objects.get(name='total_products').value, 2)
+        self.assertFalse(StoreCounter.objects.filter(name='total_orders').exists())
+        self.assertEqual(get_counters()['total_products'], 2)
+
+        self.order(10, status='shipped')
+        self.assertEqual(StoreCounter.objects.get(name='total_orders').value, 1)
+        self.assertEqual(StoreCounter.objects.get(name='total_revenue').value, 10)
+        self.assertCountersExact()
+
+    def test_order_status_transitions(self):
+        order = self.order(Decimal('12.50'))
+        self.assertEqual(get_counters()['pending_orders'], 1)
+        for status, pending, revenue in (
+            ('cancelled', 0, 0),
+            ('pending', 1, 0),
+            ('shipped', 0, Decimal('12.50')),
+            ('delivered', 0, Decimal('12.50')),
+            ('cancelled', 0, 0),
+            ('delivered', 0, Decimal('12.50')),
+            ('pending', 1, 0),
+        ):
+            with self.subTest(status=status):
+                # Through the admin view, which reloads the order each time
+                self.client.force_login(self.admin)
+                self.client.post(reverse('update_order_status', args=[order.id]), {'status': status})
+                counters = get_counters()
+                self.assertEqual((counters['pending_orders'], counters['total_revenue']), (pending, revenue))
+                self.assertCountersExact()
+
+        # Saving the same instance twice applies each change once
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'shipped'
+        order.save()
+        order.total_amount = Decimal('20.00')
+        order.save()
+        self.assertEqual(get_counters()['total_revenue'], Decimal('20.00'))
+        order.status = 'cancelled'
+        order.save()
+        order.delete()
+        self.assertEqual(get_counters()['total_orders'], 0)
+        self.assertCountersExact()
+
+    def test_deleting_a_shipped_order(self):
+        shipped = self.order(5, status='shipped')
+        self.order(7, status='cancelled')
+        Order.objects.get(pk=shipped.pk).delete()
+        counters = get_counters()
+        self.assertEqual((counters['total_orders'], counters['total_revenue']), (1, 0))
+        self.assertCountersExact()
+
+    def test_reconcile_fixes_drift(self):
+        self.order(5, status='shipped')
+        # Bulk updates skip the signals
+        Order.objects.update(status='pending')
+        StoreCounter.objects.filter(name='total_products').update(value=99)
+        StoreCounter.objects.filter(name='total_users').delete()
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'pending_orders: 0.00 -> 1',
+            'total_products: 99.00 -> 1',
+            'total_revenue: 5.00 -> 0.00',
+            'total_users: None -> 1',
+            'Counters reconciled (4 corrected).',
+        ])
+        self.assertCountersExact()
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Counters reconciled (0 corrected).')
+
+
+class RatingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Lights')
+        self.lamp, self.chair = [
+            Product.objects.create(name=name, description='Test', price=2, stock=10, category=category)
+            for name in ('Lamp', 'Chair')
+        ]
+        self.users = [User.objects.create_user(f'user{i}') for i in range(3)]
+
+    def rating(self, product):
+        product.refresh_from_db()
+        return product.rating_count, product.rating_sum, product.rating_avg
+
+    def review(self, user, rating, product=None, approved=True):
+        return Review.objects.create(user=user, product=product or self.lamp, rating=rating, comment='x', is_approved=approved)
+
+    def test_rating_follows_reviews(self):
+        first = self.review(self.users[0], 5)
+        pending = self.review(self.users[1], 1, approved=False)
+        self.assertEqual(self.rating(self.lamp), (1, 5, 5.0))
+
+        pending.is_approved = True
+        pending.save()
+        self.assertEqual(self.rating(self.lamp), (2, 6, 3.0))
+
+        # Edits through a freshly loaded row
+        first = Review.objects.get(id=first.id)
+        first.rating = 4
+        first.save()
+        self.assertEqual(self.rating(self.lamp), (2, 5, 2.5))
+        first.product = self.chair
+        first.save()
+        self.assertEqual(self.rating(self.lamp), (1, 1, 1.0))
+        self.assertEqual(self.rating(self.chair), (1, 4, 4.0))
+
+        pending.is_approved = False
+        pending.save()
+        self.assertEqual(self.rating(self.lamp), (0, 0, 0.0))
+        Review.objects.get(id=first.id).delete()
+        self.assertEqual(self.rating(self.chair), (0, 0, 0.0))
+
+    def test_stale_product_save_keeps_rating(self):
+        stale = Product.objects.get(id=self.lamp.id)
+        self.review(self.users[0], 4)
+        stale.stock = 3
+        stale.save()
+        self.assertEqual(self.rating(self.lamp), (1, 4, 4.0))
+        self.assertEqual(self.lamp.stock, 3)
+
+    def test_admin_save_keeps_rating(self):
+        admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin)
+        url = reverse('admin:myapp_product_change', args=[self.lamp.id])
+        data = {'name': 'Desk lamp', 'description': 'Test', 'price': '2.00', 'stock': '7', 'category': self.lamp.category_id}
+        save_model = ProductAdmin.save_model
+
+        def approve_then_save(model_admin, request, obj, form, change):
+            # A review approved after the admin loaded the product
+            self.review(self.users[0], 4)
+            save_model(model_admin, request, obj, form, change)
+
+        with mock.patch.object(ProductAdmin, 'save_model', approve_then_save):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.rating(self.lamp), (1, 4, 4.0))
+        self.assertEqual((self.lamp.name, self.lamp.stock), ('Desk lamp', 7))
+
+    def test_inserts_write_every_column(self):
+        product = Product.objects.create(name='Rug', description='Test', price=3, stock=1, category=self.lamp.category, rating_count=2, rating_sum=7, rating_avg=3.5)
+        self.assertEqual(self.rating(product), (2, 7, 3.5))
+        product.pk = None
+        product.save()
+        self.assertNotEqual(product.pk, self.lamp.pk)
+        self.assertEqual(self.rating(product), (2, 7, 3.5))
+        self.assertEqual(Product.objects.filter(name='Rug').count(), 2)
+
+    def test_recompute(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        Review.objects.update(is_approved=False)
+        Review.objects.filter(user=self.users[1]).update(is_approved=True)
+
+        self.assertEqual(recompute_ratings(), 1)
+        self.assertEqual(self.rating(self.lamp), (1, 2, 2.0))
+        self.assertEqual(recompute_ratings(), 0)
+
+    def test_shop_sort_and_filter(self):
+        self.review(self.users[0], 3)
+        self.review(self.users[0], 5, product=self.chair)
+        self.review(self.users[1], 4, product=self.chair)
+
+        response = self.client.get(reverse('shop'), {'sort': 'top_rated'})
+        self.assertEqual([p.name for p in response.context['page_obj']], ['Chair', 'Lamp'])
+        response = self.client.get(reverse('shop'), {'min_rating': '4'})
+        self.assertEqual([p.name for p in response.context['page_obj']], ['Chair'])
+        self.assertEqual(self.client.get(reverse('shop'), {'min_rating': 'x'}).status_code, 200)
+
+        response = self.client.get(reverse('product_detail', args=[self.chair.id]))
+        self.assertContains(response, '4.5 (2 reviews)')
+        self.chair.refresh_from_db()
+        self.assertEqual(self.chair.star_icons(), ['fas fa-star'] * 4 + ['fas fa-star-half-alt'])
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user('customer', password='pw')
+        category = Category.objects.create(name='Category')
+        cart = Cart.objects.create(user=self.customer)
+        for i in range(12):
+            product = Product.objects.create(name=f'P{i}', description='Test', price='2.50', stock=10, category=category)
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code='SAVE10', discount_percentage=10,
+            valid_from=now - datetime.timedelta(days=1), valid_to=now + datetime.timedelta(hours=1),
+        )
+
+    def test_price_is_one_query(self):
+        with self.assertNumQueries(1):
+            price = price_cart(self.customer, self.coupon)
+        self.assertEqual((price['count'], price['quantity']), (12, 24))
+        self.assertEqual(price['subtotal'], Decimal('60.00'))
+        self.assertEqual(price['discount'], Decimal('6.00'))
+        self.assertEqual(price['total'], Decimal('54.00'))
+
+    def test_coupon_is_cached(self):
+        self.assertEqual(get_coupon('save10'), self.coupon)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_coupon('SAVE10'), self.coupon)
+            self.assertIsNone(get_coupon(''))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coupon.active = False
+            self.coupon.save()
+        self.assertIsNone(get_coupon('SAVE10'))
+
+    def test_coupon_deactivated_through_another_worker(self):
+        self.assertEqual(get_coupon('SAVE10'), self.coupon)
+        # Another process, with its own local cache, saves the change
+        with mock.patch('myapp.pricing.cache', LocMemCache('other-worker', {})), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.coupon.active = False
+            self.coupon.save()
+
+        later = time.time() + pricing.COUPON_CACHE_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertIsNone(get_coupon('SAVE10'))
+
+    def test_checkout_applies_session_coupon(self):
+        self.client.force_login(self.customer)
+        self.client.post(reverse('apply_coupon'), {'code': 'save10'})
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['price']['total'], Decimal('54.00'))
+
+        self.client.post(reverse('checkout'), {
+            'shipping_address': 'Somewhere', 'phone': '123', 'payment_method': 'cod',
+        })
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(order.total_amount, Decimal('54.00'))
+        self.assertEqual(order.item_count, 12)
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Category')
+        self.product = Product.objects.create(name='Lamp', description='Test', price=3, stock=5, category=category)
+        self.customer = User.objects.create_user('customer')
+        CartItem.objects.create(cart=Cart.objects.create(user=self.customer), product=self.product, quantity=2)
+
+    def test_summary_is_cached(self):
+        self.assertEqual(get_cart_summary(self.customer), {'count': 1, 'subtotal': Decimal('6.00')})
+        with self.assertNumQueries(0):
+            get_cart_summary(self.customer)
+
+    def test_product_delete_clears_summaries(self):
+        get_cart_summary(self.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(get_cart_summary(self.customer)['count'], 0)
+
+    def assertCartsLookedUpOnce(self, delete):
+        category = self.product.category
+        products = [
+            Product.objects.create(name=f'Extra {i}', description='Test', price=1, stock=5, category=category)
+            for i in range(20)
+        ]
+        other = User.objects.create_user('other')
+        CartItem.objects.create(cart=Cart.objects.create(user=other), product=products[5], quantity=1)
+        bystander = User.objects.create_user('bystander')
+        chair = Product.objects.create(name='Chair', description='', price=1, stock=1, category=Category.objects.create(name='Other'))
+        CartItem.objects.create(cart=Cart.objects.create(user=bystander), product=chair, quantity=1)
+        for user in (self.customer, other, bystander):
+            get_cart_summary(user)
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            delete(category)
+        self.assertEqual(len([q for q in queries if 'FROM "myapp_cart" INNER JOIN' in q['sql']]), 1)
+        self.assertEqual(get_cart_summary(self.customer)['count'], 0)
+        self.assertEqual(get_cart_summary(other)['count'], 0)
+        with self.assertNumQueries(0):
+            get_cart_summary(bystander)
+
+    def test_category_delete_looks_carts_up_once(self):
+        self.assertCartsLookedUpOnce(lambda category: category.delete())
+
+    def test_queryset_delete_looks_carts_up_once(self):
+        self.assertCartsLookedUpOnce(lambda category: Product.objects.filter(category=category).delete())
+
+    def test_summary_expires(self):
+        get_cart_summary(self.customer)
+        CartItem.objects.all().delete()  # e.g. through another worker
+        later = time.time() + cart.CART_SUMMARY_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(get_cart_summary(self.customer)['count'], 0)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Category')
+        self.products = [
+            Product.objects.create(name=f'P{i}', description='Test', price=3, stock=5, category=category)
+            for i in range(3)
+        ]
+
+    def add(self, product, quantity=1):
+        return self.client.post(reverse('add_to_cart', args=[product.id]), {'quantity': quantity})
+
+    def test_guest_cart_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.add(self.products[0], 2)
+            self.add(self.products[1])
+            self.client.post(reverse('update_cart_quantity', args=[self.products[0].id]), {'quantity': 3})
+            self.client.get(reverse('remove_from_cart', args=[self.products[1].id]))
+        self.assertFalse([q for q in queries.captured_queries if not q['sql'].startswith('SELECT')])
+
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual([(line.product, line.quantity) for line in response.context['cart_items']],
+                         [(self.products[0], 3)])
+        self.assertEqual(response.context['price']['total'], Decimal('9.00'))
+        self.assertEqual(response.context['cart_summary']['count'], 1)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_guest_stock_checks(self):
+        self.add(self.products[0], 9)
+        self.add(self.products[0], 1)
+        response = self.client.post(reverse('update_cart_quantity', args=[self.products[0].id]), {'quantity': 6})
+        self.assertEqual(response.status_code, 302)
+        lines = self.client.get(reverse('view_cart')).context['cart_items']
+        self.assertEqual([line.quantity for line in lines], [5])
+
+    def test_merge_on_login(self):
+        customer = User.objects.create_user('customer', password='pw')
+        cart = Cart.objects.create(user=customer)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=4)
+        self.add(self.products[0], 3)
+        self.add(self.products[1], 2)
+
+        response = self.client.post(reverse('login'), {'username': 'customer', 'password': 'pw'})
+        self.assertEqual(response.cookies['guest_cart'].value, '')
+        self.assertEqual(
+            sorted(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')),
+            [(self.products[0].id, 5), (self.products[1].id, 2)],
+        )
+
+    def test_merge_on_register(self):
+        self.add(self.products[2], 2)
+        self.client.post(reverse('register'), {
+            'username': 'newcomer', 'email': 'n@example.com', 'first_name': 'N', 'last_name': 'C',
+            'password1': 'a-Long-passw0rd', 'password2': 'a-Long-passw0rd',
+        })
+        self.assertEqual(
+            list(CartItem.objects.filter(cart__user__username='newcomer').values_list('product_id', 'quantity')),
+            [(self.products[2].id, 2)],
+        )
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Committed, so the catalog bump this queues isn't still pending when a test edits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name='Category')
+            self.product = Product.objects.create(
+                name='Lamp', description='Test', price=10, stock=5, category=self.category,
+            )
+            for i in range(4):
+                Product.objects.create(name=f'Other {i}', description='Test', price=3, stock=5, category=self.category)
+
+    def test_anonymous_pages_are_cached(self):
+        for url in (reverse('home'), reverse('shop') + '?sort=price_low&search=&utm_source=mail', reverse('about')):
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+            with self.assertNumQueries(1):  # the catalog version
+                response = self.client.get(url)
+            self.assertEqual(response['X-Page-Cache'], 'hit')
+        # Same page, different parameter order and tracking parameters
+        response = self.client.get(reverse('shop') + '?utm_campaign=x&sort=price_low')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+    def test_edit_retires_cached_pages(self):
+        url = reverse('product_detail', args=[self.product.id])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Desk Lamp'
+            self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Desk Lamp')
+
+    def test_cascade_bumps_the_version_once(self):
+        before = catalog_version()
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.category.delete()
+        self.assertEqual(catalog_version(), before + 1)
+        bumps = [q for q in queries if 'myapp_storecounter' in q['sql'] and CATALOG_VERSION_KEY in str(q['sql'])]
+        self.assertEqual(len(bumps), 1)
+
+    def test_bump_survives_a_rolled_back_savepoint(self):
+        before = catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.product.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            Product.objects.get(name='Other 0').save()
+        self.assertEqual(catalog_version(), before + 1)
+
+    def test_edit_through_another_worker_retires_cached_pages(self):
+        url = reverse('product_detail', args=[self.product.id])
+        self.client.get(url)
+        # Another process, with its own local cache, saves the edit
+        with mock.patch('myapp.page_cache.cache', LocMemCache('other-worker', {})), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Desk Lamp'
+            self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Desk Lamp')
+
+    def test_csrf_token_is_per_visitor(self):
+        url = reverse('product_detail', args=[self.product.id])
+        self.client.get(url)
+        visitor = Client(enforce_csrf_checks=True)
+        response = visitor.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+        response = visitor.post(reverse('add_to_cart', args=[self.product.id]), {
+            'quantity': 1, 'csrfmiddlewaretoken': token,
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def test_personalised_requests_bypass_cache(self):
+        self.client.post(reverse('add_to_cart', args=[self.product.id]))
+        self.client.get(reverse('view_cart'))  # consume the flash message
+        self.assertNotIn('X-Page-Cache', self.client.get(reverse('home')))
+        self.assertContains(self.client.get(reverse('home')), 'cart-count')
+
+    def test_fragments_for_logged_in_users(self):
+        self.client.force_login(User.objects.create_user('customer'))
+        url = reverse('shop') + '?sort=newest'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Lamp')
+        self.assertFalse([q for q in queries.captured_queries if 'myapp_product' in q['sql']])
+
+
+class ChatSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user('customer')
+        self.thread = ContactMessage.objects.create(
+            user=self.customer, name='Customer', email='customer@example.com', subject='Help', message='Hi',
+        )
+        self.client.force_login(self.customer)
+
+    def poll(self, since=0, **headers):
+        return self.client.get(reverse('get_chat_messages', args=[self.thread.id]), {'since': since}, headers=headers)
+
+    def test_cursor_and_etag(self):
+        first = MessageReply.objects.create(message=self.thread, user=self.customer, content='One')
+        response = self.poll()
+        self.assertEqual([reply['id'] for reply in response.json()['replies']], [first.id])
+        self.assertEqual(self.poll(since=first.id, if_none_match=self.poll(since=first.id)['ETag']).status_code, 304)
+
+    def test_reply_posted_through_another_worker(self):
+        self.assertEqual(self.poll().json()['replies'], [])
+        # Another process, with its own local cache, saves the reply
+        with mock.patch.object(chat, 'cache', LocMemCache('other-worker', {})), self.captureOnCommitCallbacks(execute=True):
+            reply = MessageReply.objects.create(message=self.thread, content='Hello', is_admin=True)
+
+        later = time.time() + chat.LATEST_HINT_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            response = self.poll()
+        self.assertEqual([reply['id'] for reply in response.json()['replies']], [reply.id])
+
+
+class AsyncUrls:
+    """ROOT_URLCONF routing the async views, as ecommarce/asgi.py does."""
+    urlpatterns = [path('', include([
+        path(str(pattern.pattern), getattr(async_views, pattern.name), name=pattern.name)
+        if pattern.callback is getattr(views, pattern.name, None) and hasattr(async_views, pattern.name)
+        else pattern
+        for pattern in urlpatterns
+    ]))]
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Category')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='Test', price=i + 1, stock=5, category=self.category)
+            for i in range(5)
+        ]
+        self.customer = User.objects.create_user('customer')
+        self.thread = ContactMessage.objects.create(
+            user=self.customer, name='customer', email='c@example.com', subject='Hi', message='Hello',
+        )
+        MessageReply.objects.create(message=self.thread, user=self.customer, content='First')
+        Wishlist.objects.create(user=self.customer, product=self.products[0])
+        self.page = Page.objects.create(title='Shipping', slug='shipping', content='We ship everywhere.')
+
+    async def fetch(self, url):
+        """(sync response, async response) for ``url``, each rendered from an empty cache."""
+        await cache.aclear()
+        response = await sync_to_async(self.client.get)(url)
+        await cache.aclear()
+        with override_settings(ROOT_URLCONF=AsyncUrls):
+            return response, await self.async_client.get(url)
+
+    def assertSameContent(self, sync_response, async_response):
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        token = re.compile(rb'name="csrfmiddlewaretoken" value="[^"]*"')
+        self.assertEqual(token.sub(b'', async_response.content), token.sub(b'', sync_response.content))
+
+    async def test_pages_match_sync_views(self):
+        urls = [
+            reverse('home'),
+            reverse('shop') + '?sort=price_high',
+            reverse('shop') + '?category=' + str(self.category.id),
+            reverse('product_detail', args=[self.products[0].id]),
+            reverse('product_detail', args=[0]),
+            reverse('page_detail', args=[self.page.slug]),
+            reverse('page_detail', args=['missing']),
+        ]
+        for user in (None, self.customer):
+            if user:
+                await self.client.aforce_login(user)
+                await self.async_client.aforce_login(user)
+            for url in urls:
+                with self.subTest(url=url, user=user):
+                    self.assertSameContent(*await self.fetch(url))
+
+    async def test_anonymous_pages_are_cached(self):
+        with override_settings(ROOT_URLCONF=AsyncUrls):
+            for url in (reverse('shop') + '?sort=name', reverse('page_detail', args=[self.page.slug])):
+                with self.subTest(url=url):
+                    self.assertEqual((await self.async_client.get(url))['X-Page-Cache'], 'miss')
+                    self.assertEqual((await self.async_client.get(url))['X-Page-Cache'], 'hit')
+
+    async def test_chat_messages(self):
+        url = reverse('get_chat_messages', args=[self.thread.id])
+        await self.client.aforce_login(self.customer)
+        await self.async_client.aforce_login(self.customer)
+        sync_response, async_response = await self.fetch(url)
+        self.assertEqual(async_response.json(), sync_response.json())
+        self.assertEqual(async_response['ETag'], sync_response['ETag'])
+        with override_settings(ROOT_URLCONF=AsyncUrls):
+            response = await self.async_client.get(url, headers={'If-None-Match': async_response['ETag']})
+            self.assertEqual(response.status_code, 304)
+            await self.async_client.aforce_login(await User.objects.acreate(username='stranger'))
+            self.assertEqual((await self.async_client.get(url)).status_code, 404)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite connection settings')
+class SQLiteConcurrencyTests(TransactionTestCase):
+    def test_connection_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        # journal_mode is stored in the file; setting it on every connection rewrote the header
+        with CaptureQueriesContext(connection) as queries:
+            configure_sqlite(None, connection)
+        self.assertFalse([q for q in queries if 'journal_mode' in q['sql']])
+
+    def test_migration_enables_wal(self):
+        wal = importlib.import_module('myapp.migrations.0016_sqlite_wal')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'db.sqlite3')
+            other = DatabaseWrapper({**connections.settings[DEFAULT_DB_ALIAS], 'NAME': path}, alias='wal-test')
+            try:
+                wal.enable_wal(None, SimpleNamespace(connection=other))
+            finally:
+                other.close()
+            with closing(sqlite3.connect(path)) as db:
+                self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_retry_on_lock(self):
+        calls = []
+
+        @retry_on_lock(base_delay=0)
+        def view(request):
+            calls.append(Category.objects.create(name=f'Attempt {len(calls)}'))
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        self.assertEqual(view(None), 'done')
+        self.assertEqual(len(calls), 3)
+        # The failed attempts were rolled back
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Attempt 2'])
+
+    def test_retry_gives_up(self):
+        @retry_on_lock(attempts=2, base_delay=0)
+        def view(request):
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            view(None)
+
+    def begins(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data)
+        return [q['sql'] for q in queries.captured_queries if q['sql'].startswith('BEGIN')]
+
+    def test_reads_take_no_write_lock(self):
+        customer = User.objects.create_user('customer')
+        product = Product.objects.create(
+            name='Lamp', description='Test', price=2, stock=5, category=Category.objects.create(name='Lights'),
+        )
+        CartItem.objects.create(cart=Cart.objects.create(user=customer), product=product, quantity=1)
+        thread = ContactMessage.objects.create(user=customer, name='c', email='c@example.com', subject='s', message='m')
+        self.client.force_login(customer)
+        for url in (reverse('contact'), reverse('checkout'), reverse('customer_message_detail', args=[thread.id])):
+            with self.subTest(url=url):
+                self.assertEqual(self.begins('get', url), [])
+        self.assertEqual(self.begins('post', reverse('customer_message_detail', args=[thread.id]), {'content': 'Hi'}),
+                         ['BEGIN IMMEDIATE'])
+
+    def test_retried_write_adds_one_message(self):
+        save = ContactMessage.save
+        calls = []
+
+        def locked_once(instance, *args, **kwargs):
+            calls.append(instance)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return save(instance, *args, **kwargs)
+
+        with mock.patch.object(ContactMessage, 'save', locked_once), mock.patch('myapp.db.time.sleep'):
+            response = self.client.post(reverse('contact'), {
+                'name': 'Customer', 'email': 'c@example.com', 'subject': 'Hello', 'message': 'Hi',
+            }, follow=True)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(ContactMessage.objects.count(), 1)
+        self.assertEqual(len(list(response.context['messages'])), 1)
+
+
+class OrderNumberTests(TestCase):
+    def test_unique_sorted_and_20_characters(self):
+        numbers = [order_numbers.next_order_number() for _ in range(10000)]
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertTrue(all(len(n) == 20 and n.startswith('ORD') for n in numbers))
+
+    def test_sequence_overflow_and_clock_going_back(self):
+        with mock.patch.object(order_numbers, '_now_ms', return_value=order_numbers._last_ms + 1000):
+            numbers = [order_numbers.next_order_number() for _ in range(order_numbers.MAX_SEQUENCE + 10)]
+        with mock.patch.object(order_numbers, '_now_ms', return_value=0):
+            numbers.append(order_numbers.next_order_number())
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(numbers, sorted(numbers))
+
+    def test_last_timestamp_fits(self):
+        value = (1 << 84) - 1
+        self.assertEqual(len(order_numbers.encode(value)), 20)
+
+    def test_orders_get_a_number(self):
+        user = User.objects.create_user('buyer', password='pw')
+        orders = [
+            Order.objects.create(user=user, total_amount=1, payment_method='cod', shipping_address='x', phone='1')
+            for _ in range(50)
+        ]
+        self.assertEqual(len({order.order_number for order in orders}), 50)
+
+    def test_no_collisions_across_processes(self):
+        out = StringIO()
+        call_command('stress_order_numbers', processes=3, threads=2, count=5000, stdout=out)
+        self.assertIn('15000 unique order numbers', out.getvalue())
+
+
+class CheckMediaTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media = tmp.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        for name in ('products/lamp.png', 'categories/lights.png', 'products/stray.png',
+                     'products/old/stray.png', 'derivatives/products/lamp/card.webp',
+                     'derivatives/products/gone/card.webp', '_quarantine/earlier.png'):
+            self.write_image(name)
+        self.write('products/broken.png', b'not an image')
+        for name in ('products/.gitkeep', 'derivatives/.gitkeep', 'products/README.txt'):
+            self.write(name, b'')
+
+        category = Category.objects.create(name='Lights', image='categories/lights.png')
+        for name, image in (('Lamp', 'products/lamp.png'), ('Spare lamp', 'products/lamp.png'),
+                            ('Chair', 'products/chair.png'), ('Desk', 'products/broken.png'), ('Plain', '')):
+            Product.objects.create(name=name, description='', price=1, stock=1, category=category, image=image)
+
+    def write(self, name, content):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def write_image(self, name):
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4)).save(buffer, 'PNG')
+        self.write(name, buffer.getvalue())
+
+    def check_media(self, *args):
+        out = StringIO()
+        call_command('check_media', *args, workers=2, stdout=out)
+        return out.getvalue().splitlines()
+
+    def test_report(self):
+        chair = Product.objects.get(name='Chair').pk
+        desk = Product.objects.get(name='Desk').pk
+        *problems, summary = self.check_media()
+        problems.sort()
+        self.assertRegex(problems.pop(0), rf'^CORRUPT \(.+\): products/broken\.png \(Product #{desk}\)$')
+        self.assertEqual(problems, [
+            f'MISSING: products/chair.png (Product #{chair})',
+            'ORPHAN: derivatives/products/gone/card.webp',
+            'ORPHAN: products/old/stray.png',
+            'ORPHAN: products/stray.png',
+        ])
+        self.assertEqual(summary, '4 images checked: 1 missing, 1 corrupt, 3 orphaned.')
+
+        lines = self.check_media('--no-decode')
+        self.assertFalse(any(line.startswith('CORRUPT') for line in lines))
+        self.assertEqual(lines[-1], '4 images checked: 1 missing, 0 corrupt, 3 orphaned.')
+        # A report alone moves nothing
+        self.assertTrue(os.path.isfile(os.path.join(self.media, 'products/stray.png')))
+
+    def test_quarantine_moves_only_orphans(self):
+        before = set(walk_media(self.media, skip=()))
+        lines = self.check_media('--quarantine')
+        self.assertIn(f'Moved 3 orphaned files to {os.path.join(self.media, "_quarantine")}', lines)
+
+        # Placeholders and the derivatives of referenced images stay put
+        after = set(walk_media(self.media, skip=()))
+        moved = {'products/stray.png', 'products/old/stray.png', 'derivatives/products/gone/card.webp'}
+        self.assertEqual(after, before - moved | {f'_quarantine/{name}' for name in moved})
+
+        # Nothing is orphaned any more, and the quarantine isn't rescanned
+        self.assertEqual(self.check_media('--quarantine')[-1], '4 images checked: 1 missing, 1 corrupt, 0 orphaned.')
+        self.assertEqual(set(walk_media(self.media, skip=())), after)
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=tmp.name, MEDIA_URL='/media/'))
+        os.makedirs(os.path.join(tmp.name, 'products'))
+        Image.new('RGBA', (1000, 500), (255, 0, 0, 128)).save(os.path.join(tmp.name, 'products/lamp.png'))
+        Image.new('RGB', (300, 300)).save(os.path.join(tmp.name, 'products/small.png'))
+        category = Category.objects.create(name='Lights')
+        self.product = Product.objects.create(
+            name='Lamp', description='', price=1, stock=1, category=category, image='products/lamp.png',
+        )
+
+    def render(self, product):
+        return Template('{% load image_tags %}{% responsive_image product.image "detail" alt="Lamp" %}').render(
+            Context({'product': product})
+        )
+
+    def test_generate_derivatives(self):
+        self.assertEqual(generate_derivatives('products/lamp.png'), 6)
+        for size, width in IMAGE_SIZES.items():
+            for ext, fmt in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+                with Image.open(os.path.join(settings.MEDIA_ROOT, derivative_name('products/lamp.png', size, ext))) as image:
+                    self.assertEqual((image.format, image.size), (fmt, (width, width // 2)))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_derivatives, 'products/lamp.png')
+
+        # Up to date: nothing rewritten unless forced
+        self.assertEqual(generate_derivatives('products/lamp.png'), 0)
+        self.assertEqual(generate_derivatives('products/lamp.png', force=True), 6)
+
+        # Never upscaled
+        generate_derivatives('products/small.png')
+        with Image.open(os.path.join(settings.MEDIA_ROOT, derivative_name('products/small.png', 'detail', 'jpg'))) as image:
+            self.assertEqual(image.size, (300, 300))
+
+        self.assertEqual(generate_derivatives('products/missing.png'), 0)
+        self.assertEqual(generate_derivatives(''), 0)
+
+    def test_job_records_derivatives(self):
+        self.assertEqual(jobs.run_pending(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_derivatives, 'products/lamp.png')
+
+        # Edits that keep the image queue nothing; a new image does
+        self.product.stock = 7
+        self.product.save()
+        self.assertFalse(Job.objects.exists())
+        self.product.image = 'products/small.png'
+        self.product.save()
+        self.assertEqual(list(Job.objects.values_list('name', 'payload')),
+                         [('generate_image_derivatives', {'name': 'products/small.png'})])
+
+    def test_tag_renders_without_storage_checks(self):
+        with mock.patch.object(default_storage, 'exists', side_effect=AssertionError('storage checked')):
+            self.assertHTMLEqual(self.render(self.product), (
+                '<img src="/media/products/lamp.png" alt="Lamp" class="" style="" loading="lazy">'
+            ))
+            self.assertEqual(self.render(Product(name='Plain')), '')
+
+        generate_derivatives('products/lamp.png')
+        self.product.refresh_from_db()
+        with mock.patch.object(default_storage, 'exists', side_effect=AssertionError('storage checked')):
+            html = self.render(self.product)
+        sizes = SIZES_ATTR['detail']
+        self.assertHTMLEqual(html, (
+            '<picture>'
+            f'<source type="image/webp" srcset="/media/derivatives/products/lamp/thumb.webp 150w, '
+            f'/media/derivatives/products/lamp/card.webp 400w, /media/derivatives/products/lamp/detail.webp 800w" sizes="{sizes}">'
+            f'<img src="/media/derivatives/products/lamp/detail.jpg" srcset="/media/derivatives/products/lamp/thumb.jpg 150w, '
+            f'/media/derivatives/products/lamp/card.jpg 400w, /media/derivatives/products/lamp/detail.jpg 800w" sizes="{sizes}" '
+            'alt="Lamp" class="" style="" loading="lazy">'
+            '</picture>'
+        ))
+
+        # A new image shows the original until its own derivatives exist
+        self.product.image = 'products/small.png'
+        self.assertIn('<img src="/media/products/small.png"', self.render(self.product))
+
+
+class ProductImportExportTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media = os.path.join(self.tmp.name, 'media')
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.images = os.path.join(self.tmp.name, 'images')
+        os.makedirs(self.images)
+        with open(os.path.join(self.images, 'lamp.jpg'), 'wb') as f:
+            f.write(b'not really a jpeg')
+        self.existing = Product.objects.create(
+            name='Old', description='', price=1, stock=1, category=Category.objects.create(name='Lights'),
+        )
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', newline='') as f:
+            f.write(content)
+        return path
+
+    def test_import_then_export_round_trip(self):
+        path = self.write('products.csv', (
+            'id,name,description,price,stock,category,image\n'
+            f'{self.existing.id},Lamp,Bright,19.99,4,Lights,lamp.jpg\n'
+            ',Chair,Oak,45.00,2,Furniture,\n'
+            ',,No name,1.00,1,Furniture,\n'
+            ',Table,Pine,abc,1,Furniture,\n'
+        ))
+        err = StringIO()
+        call_command('import_products', path, images=self.images, batch_size=2, stdout=StringIO(), stderr=err)
+        self.assertIn('line 4: name is required', err.getvalue())
+        self.assertIn('line 5:', err.getvalue())
+
+        lamp = Product.objects.get(id=self.existing.id)
+        self.assertEqual((lamp.name, lamp.price, lamp.stock, lamp.image.name), ('Lamp', Decimal('19.99'), 4, 'products/lamp.jpg'))
+        self.assertTrue(os.path.isfile(os.path.join(settings.MEDIA_ROOT, 'products/lamp.jpg')))
+        furniture = Category.objects.get(name='Furniture')
+        self.assertEqual(furniture.product_count, 1)
+        self.assertEqual(Category.objects.get(name='Lights').product_count, 1)
+
+        out = StringIO()
+        call_command('export_products', format='jsonl', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Lamp', 'Chair'])
+        self.assertEqual(rows[0]['image'], 'products/lamp.jpg')
+
+        # Re-importing the export changes nothing and creates no duplicates
+        rows[1]['stock'] = 9
+        path = self.write('products.jsonl', ''.join(json.dumps(row) + '\n' for row in rows))
+        call_command('import_products', path, stdout=out)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Product.objects.get(name='Chair').stock, 9)
+        self.assertEqual(Product.objects.get(name='Lamp').image.name, 'products/lamp.jpg')
+
+    def test_import_batches_queries(self):
+        lines = ''.join(f',Item {i},,1.00,1,Lights,\n' for i in range(200))
+        path = self.write('many.csv', 'id,name,description,price,stock,category,image\n' + lines)
+        with CaptureQueriesContext(connection) as queries:
+            # 50 rows stay under SQLite's 999 parameters per statement, so each batch is one INSERT
+            call_command('import_products', path, batch_size=50, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 201)
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "myapp_product"')]
+        self.assertEqual(len(inserts), 4)
+
+    def test_malformed_jsonl_lines_are_skipped(self):
+        path = self.write('products.jsonl', (
+            '{"name": "Lamp", "price": "2.00", "stock": 1, "category": "Lights"}\n'
+            '{"name": "Broken", "price": \n'
+            '["not", "an", "object"]\n'
+            '\n'
+            '{"name": "Desk", "price": "9.00", "stock": 1, "category": "Furniture"}\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_products', path, stdout=out, stderr=err)
+        errors = err.getvalue().splitlines()
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(errors[0].startswith('line 2: invalid JSON:'))
+        self.assertEqual(errors[1], 'line 3: expected a JSON object')
+        self.assertIn('2 created, 0 updated, 0 images attached, 2 rows skipped', out.getvalue())
+        self.assertEqual(Category.objects.get(name='Lights').product_count, 2)
+        self.assertEqual(get_counters()['total_products'], 3)
+
+    def test_bad_csv_rows_are_skipped(self):
+        path = self.write('products.csv', (
+            'id,name,description,price,stock,category,image\n'
+            ',Lamp,,2.00,1,Lights,\n'
+            ',Chandelier,,123456789.00,1,Lights,\n'
+            ',Bulb,,1.234,1,Lights,\n'
+            ',Poster,' + 'x' * (csv.field_size_limit() + 1) + ',1.00,1,Lights,\n'
+            ',Shade,,Infinity,1,Lights,\n'
+            ',Desk,,9.00,1,Furniture,\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_products', path, stdout=out, stderr=err)
+        errors = err.getvalue().splitlines()
+        self.assertEqual([line.split(':')[0] for line in errors], ['line 3', 'line 4', 'line 5', 'line 6'])
+        self.assertIn('price: Ensure that there are no more than 10 digits in total.', errors[0])
+        self.assertIn('price: Ensure that there are no more than 2 decimal places.', errors[1])
+        self.assertIn('invalid CSV: field larger than field limit', errors[2])
+        self.assertIn('2 created, 0 updated, 0 images attached, 4 rows skipped', out.getvalue())
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Desk', 'Lamp', 'Old'])
+
+    def test_interrupted_import_still_repairs_counts(self):
+        def rows():
+            yield 1, {'name': 'Lamp', 'price': '2.00', 'category': 'Lights'}
+            raise OSError('connection reset')
+
+        importer = ProductImporter(batch_size=1)
+        with self.assertRaises(OSError):
+            importer.run(rows())
+        self.assertEqual(importer.created, 1)
+        self.assertEqual(Category.objects.get(name='Lights').product_count, 2)
+        self.assertEqual(get_counters()['total_products'], 2)
+
+
+class LoadTestHarnessTests(TestCase):
+    def test_summary_percentiles(self):
+        samples = [('shop', ms / 1000, 200, 7) for ms in range(1, 101)] + [('checkout', 0.5, 500, -1)]
+        report = summarize(samples, elapsed=10)
+        self.assertEqual(report['shop']['requests'], 100)
+        self.assertEqual(report['shop']['rps'], 10)
+        self.assertAlmostEqual(report['shop']['p50_ms'], 50.5)
+        self.assertAlmostEqual(report['shop']['p99_ms'], 99.01)
+        self.assertEqual(report['shop']['queries_per_request'], 7)
+        self.assertEqual(report['checkout']['errors'], 1)
+        self.assertIsNone(report['checkout']['queries_per_request'])
+        self.assertEqual(report['TOTAL']['statuses'], {'200': 100, '500': 1})
+
+    def test_request_mix_is_reproducible(self):
+        session = {'cookies': {'csrftoken': 'x'}, 'thread_id': 1}
+
+        def requests(seed):
+            client = LoadClient(0, session, [1, 2, 3], DEFAULT_MIX, seed)
+            return [client.next_request() for _ in range(200)]
+
+        self.assertEqual(requests('0-1'), requests('0-1'))
+        self.assertNotEqual(requests('0-1'), requests('0-2'))
+        self.assertEqual({name for name, *_ in requests('0-1')}, set(DEFAULT_MIX))
+
+
+class SeedStoreTests(TestCase):
+    def snapshot(self):
+        return (
+            list(Product.objects.order_by('id').values_list('name', 'price', 'stock', 'category__name', 'created_at')),
+            list(Order.objects.order_by('order_number').values_list('order_number', 'user__username', 'total_amount', 'status', 'item_count')),
+            list(OrderItem.objects.order_by('order__order_number', 'product__name').values_list('order__order_number', 'product__name', 'quantity')),
+            list(Wishlist.objects.order_by('user__username', 'product__name').values_list('user__username', 'product__name')),
+        )
+
+    def seed(self, customers):
+        seeder = StoreSeeder(seed=7, batch_size=50)
+        seeder.seed_categories(5)
+        seeder.seed_products(120)
+        seeder.seed_customers(customers)
+        seeder.finish(index=False)
+        return seeder
+
+    @mock.patch.object(seeding, 'CHUNK', 10)
+    def test_growing_matches_a_single_run(self):
+        self.seed(35)
+        single = self.snapshot()
+        Order.objects.all().delete()
+        User.objects.all().delete()
+
+        # Stop partway through a chunk
+        self.seed(13)
+        self.seed(35)
+        self.assertEqual(self.snapshot(), single)
+
+    def test_counts_and_signals_repaired(self):
+        seeder = self.seed(30)
+        self.assertEqual(seeder.created['Product'], 120)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(User.objects.filter(userprofile__isnull=True).count(), 0)
+        self.assertEqual(sum(Category.objects.values_list('product_count', flat=True)), 120)
+        order = Order.objects.order_by('id').first()
+        self.assertEqual(order.item_count, order.orderitem_set.count())
+        reviewed = Product.objects.filter(review__is_approved=True).distinct().first()
+        self.assertEqual(reviewed.rating_count, reviewed.review_set.filter(is_approved=True).count())
+        self.assertLess(order.created_at.year, timezone.now().year + 1)
+        self.assertTrue(self.client.login(username='seed_0000000', password='seed-password'))
+        # A second run with the same sizes adds nothing
+        self.assertEqual(self.seed(30).created, {})
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        self.thread = ContactMessage.objects.create(name='Ann', email='ann@example.com', subject='Hi', message='Hello')
+
+    def test_reply_email_is_queued(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('reply_message', args=[self.thread.id]), {'reply_content': 'Thanks!'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ann@example.com'])
+        self.assertEqual(mail.outbox[0].body, 'Thanks!')
+        self.assertFalse(Job.objects.exists())
+
+    def test_claimed_once(self):
+        job = jobs.enqueue('reconcile_counters')
+        first = jobs.claim('a')
+        self.assertEqual(first.id, job.id)
+        self.assertIsNone(jobs.claim('b'))
+        # Once the lease expires another worker takes over, and the first one can no longer finish the job
+        Job.objects.filter(id=job.id).update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        second = jobs.claim('b')
+        self.assertEqual((second.locked_by, second.attempts), ('b', 2))
+        jobs.run_job(first)
+        self.assertTrue(Job.objects.filter(id=job.id, locked_by='b').exists())
+        self.assertTrue(jobs.run_job(second))
+        self.assertFalse(Job.objects.exists())
+
+    @mock.patch('myapp.jobs.random.uniform', return_value=1)
+    def test_retries_then_dead_letter(self, uniform):
+        failing = mock.Mock(side_effect=ValueError('boom'))
+        with mock.patch.dict(jobs.HANDLERS, {'flaky': failing}), self.assertLogs('myapp.jobs'):
+            job = jobs.enqueue('flaky', {'n': 1}, max_attempts=3)
+            delays = []
+            for _ in range(3):
+                self.assertEqual(jobs.run_pending(), 1)
+                job.refresh_from_db()
+                delays.append((job.run_at - timezone.now()).total_seconds())
+                Job.objects.filter(id=job.id).update(run_at=timezone.now())
+            failing.assert_called_with(n=1)
+            self.assertEqual(failing.call_count, 3)
+            self.assertEqual(job.status, 'dead')
+            self.assertIn('ValueError: boom', job.last_error)
+            self.assertAlmostEqual(delays[0], 10, delta=1)
+            self.assertAlmostEqual(delays[1], 20, delta=1)
+            self.assertEqual(jobs.run_pending(), 0)
+
+            failing.side_effect = None
+            self.assertEqual(jobs.requeue_dead(name='flaky'), 1)
+            self.assertEqual(jobs.run_pending(), 1)
+            self.assertFalse(Job.objects.exists())
+
+    def test_run_workers(self):
+        calls = []
+        with mock.patch.dict(jobs.HANDLERS, {'record': lambda n: calls.append(n)}):
+            for n in range(20):
+                jobs.enqueue('record', {'n': n})
+            out = StringIO()
+            call_command('run_workers', concurrency=1, once=True, stdout=out)
+        self.assertEqual(sorted(calls), list(range(20)))
+        self.assertIn('20 jobs done, 0 failed', out.getvalue())
+
+    def test_unknown_job(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('missing')
+
+
+class RelatedProductsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Category')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='Test', price=10, stock=5, category=self.category)
+            for i in range(6)
+        ]
+        self.user = User.objects.create_user('customer')
+
+    def order(self, *indexes, status='pending'):
+        order = Order.objects.create(
+            user=self.user, total_amount=10, status=status, payment_method='cod', shipping_address='x', phone='1',
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.products[i], quantity=1, price=10) for i in indexes
+        ])
+        # Only orders that have settled are counted
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        return order
+
+    def neighbours(self, index):
+        return [
+            self.products.index(row.related)
+            for row in RelatedProduct.objects.filter(product=self.products[index]).order_by('rank')
+        ]
+
+    def build(self, **kwargs):
+        return RelatedProductsBuilder(**kwargs).run()
+
+    def test_cosine_ranking(self):
+        for _ in range(3):
+            self.order(0, 1)
+        self.order(0, 2)
+        # 2 sells a lot with 3; the one order shared with 0 matters less to 2 than to 0
+        for _ in range(5):
+            self.order(2, 3)
+        self.order(4, status='cancelled')
+        self.order(0, 4, status='cancelled')
+        self.assertEqual(self.build(), (9, 4))
+        self.assertEqual(self.neighbours(0), [1, 2])
+        self.assertEqual(self.neighbours(2), [3, 0])
+        self.assertEqual(self.neighbours(4), [])
+        pair = ProductPair.objects.get(product=self.products[0], other=self.products[1])
+        self.assertEqual(pair.orders, 3)
+
+    def test_incremental_matches_full(self):
+        self.order(0, 1)
+        self.order(1, 2, 3)
+        self.build(batch_size=1)
+        self.order(0, 2)
+        self.order(2, 3)
+        self.order(0, 1, 5)
+        # Orders still being placed are left for the next run
+        recent = self.order(0, 5)
+        Order.objects.filter(id=recent.id).update(created_at=timezone.now())
+        self.assertEqual(self.build()[0], 3)
+        self.assertEqual(ProductPairCursor.objects.get().last_order_id, recent.id - 1)
+        incremental = sorted(RelatedProduct.objects.values_list('product', 'related', 'rank', 'score'))
+        self.assertEqual(RelatedProductsBuilder().run(full=True)[0], 5)
+        self.assertEqual(sorted(RelatedProduct.objects.values_list('product', 'related', 'rank', 'score')), incremental)
+
+    def test_wishlists(self):
+        self.order(0, 1)
+        for user in ('a', 'b'):
+            user = User.objects.create_user(user)
+            Wishlist.objects.create(user=user, product=self.products[0])
+            Wishlist.objects.create(user=user, product=self.products[5])
+        self.build(wishlist_weight=1)
+        self.assertEqual(self.neighbours(0), [5, 1])
+
+    def test_product_page(self):
+        for _ in range(2):
+            self.order(0, 3)
+        self.order(0, 2)
+        call_command('build_related_products', stdout=StringIO())
+        url = reverse('product_detail', args=[self.products[0].id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(list(response.context['related_products']), [self.products[3], self.products[2]])
+        self.assertEqual(len([q for q in queries.captured_queries if 'myapp_relatedproduct' in q['sql']]), 1)
+        # No orders yet: the rest of the category
+        response = self.client.get(reverse('product_detail', args=[self.products[5].id]))
+        self.assertEqual(len(response.context['related_products']), 4)
@@ -1,11 +1,15 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Read-heavy views have async versions for ASGI deployments
+catalog = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # Public pages
-    path('', views.home, name='home'),
-    path('shop/', views.shop, name='shop'),
-    path('product/<int:product_id>/', views.product_detail, name='product_detail'),
+    path('', catalog.home, name='home'),
+    path('shop/', catalog.shop, name='shop'),
+    path('product/<int:product_id>/', catalog.product_detail, name='product_detail'),
     path('contact/', views.contact, name='contact'),
     path('about/', views.about, name='about'),
 
@@ -19,6 +23,8 @@ urlpatterns = [
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('cart/update/<int:item_id>/', views.update_cart, name='update_cart_quantity'),
+    path('cart/coupon/', views.apply_coupon, name='apply_coupon'),
+    path('cart/coupon/remove/', views.remove_coupon, name='remove_coupon'),
 
     # Checkout and orders
     path('checkout/', views.checkout, name='checkout'),
@@ -33,6 +39,7 @@ urlpatterns = [
     path('admin-panel/products/<int:product_id>/edit/', views.edit_product, name='edit_product'),
     path('admin-panel/products/<int:product_id>/delete/', views.delete_product, name='delete_product'),
     path('admin-panel/orders/', views.admin_orders, name='admin_orders'),
+    path('admin-panel/orders/export/', views.export_orders, name='export_orders'),
     path('admin-panel/orders/<int:order_id>/update/', views.update_order_status, name='update_order_status'),
     path('admin-panel/users/', views.admin_users, name='admin_users'),
     path('admin-panel/users/<int:user_id>/delete/', views.delete_user, name='delete_user'),
@@ -48,7 +55,8 @@ urlpatterns = [
     path('profile/', views.update_profile, name='update_profile'),
     path('my-messages/', views.customer_messages, name='customer_messages'),
     path('my-messages/<int:message_id>/', views.customer_message_detail, name='customer_message_detail'),
-    path('api/chat-messages/<int:message_id>/', views.get_chat_messages, name='get_chat_messages'),
+    path('api/chat-messages/<int:message_id>/', catalog.get_chat_messages, name='get_chat_messages'),
+    path('api/chat-messages/<int:message_id>/stream/', views.chat_stream, name='chat_stream'),
 
     # Wishlist
     path('wishlist/', views.view_wishlist, name='view_wishlist'),
@@ -56,5 +64,5 @@ urlpatterns = [
     path('wishlist/remove/<int:item_id>/', views.remove_from_wishlist, name='remove_from_wishlist'),
 
     # Dynamic pages
-    path('page/<slug:slug>/', views.page_detail, name='page_detail'),
+    path('page/<slug:slug>/', catalog.page_detail, name='page_detail'),
 ]
@@ -0,0 +1,10 @@
+try:
+    from itertools import batched
+except ImportError:  # Python < 3.12
+    from itertools import islice
+
+    def batched(iterable, n):
+        """Tuples of ``n`` consecutive items from ``iterable``, the last one possibly shorter."""
+        iterator = iter(iterable)
+        while batch := tuple(islice(iterator, n)):
+            yield batch
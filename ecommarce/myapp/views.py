@@ -3,11 +3,23 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q, Sum, Count
-from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 import datetime
 from .models import *
 from .forms import *
+from .orders import place_order, InsufficientStock
+from .order_export import EXPORT_FORMATS, export_lines, filter_orders, parse_date
+from .cart import GuestCart, merge_guest_cart, refresh_cart_summary
+from .pricing import COUPON_SESSION_KEY, cart_lines, get_coupon, price_cart, price_lines, session_coupon
+from .search import get_search_backend
+from .db import retry_on_lock
+from .jobs import enqueue
+from .pagination import KeysetPaginator
+from .page_cache import anonymous_page_cache
+from .recommendations import related_products
+from .counters import get_counters
+from .chat import latest_reply_id, parse_cursor, replies_since, serialize_reply, stream_replies
 from django.contrib.auth.forms import UserCreationForm
 from django.urls import reverse
 from functools import wraps
@@ -24,44 +36,39 @@ def admin_required(view_func):
     return _wrapped_view
 
 # Public views
+@anonymous_page_cache
 def home(request):
     products = Product.objects.filter(stock__gt=0).select_related('category')[:8]  # Featured products
     categories = Category.objects.all()[:6]  # Featured categories
 
     # Statistics for home page
-    total_products = Product.objects.count()
-    total_orders = Order.objects.count()
-    total_users = User.objects.count()
-    total_categories = Category.objects.count()
+    counters = get_counters()
 
     context = {
         'products': products,
         'categories': categories,
-        'total_products': total_products,
-        'total_orders': total_orders,
-        'total_users': total_users,
-        'total_categories': total_categories,
+        'total_products': counters['total_products'],
+        'total_orders': counters['total_orders'],
+        'total_users': counters['total_users'],
+        'total_categories': counters['total_categories'],
     }
     return render(request, 'home.html', context)
 
-def shop(request):
+def shop_listing(request):
+    """The filtered shop paginator and its template context, shared with async_views.shop."""
     products = Product.objects.filter(stock__gt=0).select_related('category')
-    categories = Category.objects.all()
 
     # Filtering
     category_id = request.GET.get('category')
     search_query = request.GET.get('search')
-    sort_by = request.GET.get('sort', 'name')
+    has_search = bool(search_query and search_query != 'None')
+    sort_by = request.GET.get('sort', 'relevance' if has_search else 'name')
 
     if category_id and category_id != 'None':
         products = products.filter(category_id=category_id)
 
-    if search_query and search_query != 'None':
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query)
-        )
+    if has_search:
+        products = get_search_backend().search(products, search_query)
 
     # Price Filtering
     min_price = request.GET.get('min_price')
@@ -72,35 +79,60 @@ def shop(request):
     if max_price and max_price != 'None':
         products = products.filter(price__lte=max_price)
 
+    # Rating filter (1-5 stars), a range on the denormalized average
+    min_rating = request.GET.get('min_rating')
+    try:
+        min_rating = min(max(int(min_rating), 1), 5)
+    except (TypeError, ValueError):
+        min_rating = None
+    if min_rating:
+        products = products.filter(rating_avg__gte=min_rating)
+
     # Sorting
     if sort_by == 'price_low':
-        products = products.order_by('price')
+        ordering = ['price']
     elif sort_by == 'price_high':
-        products = products.order_by('-price')
+        ordering = ['-price']
     elif sort_by == 'newest':
-        products = products.order_by('-created_at')
+        ordering = ['-created_at']
+    elif sort_by == 'top_rated':
+        ordering = ['-rating_avg', '-rating_count']
+    elif sort_by == 'relevance' and has_search:
+        ordering = ['search_rank']
     else:
-        products = products.order_by('name')
-
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        ordering = ['name']
 
     context = {
-        'page_obj': page_obj,
-        'categories': categories,
         'selected_category': category_id,
         'search_query': search_query,
         'sort_by': sort_by,
         'min_price': min_price,
         'max_price': max_price,
+        'min_rating': min_rating,
     }
+    return KeysetPaginator(products, 12, ordering), context
+
+@anonymous_page_cache
+def shop(request):
+    paginator, context = shop_listing(request)
+    context['page_obj'] = paginator.get_page(request.GET.get('cursor'))
+    context['categories'] = Category.objects.all()
     return render(request,'shop.html', context)
 
+def is_new_arrival(product):
+    """Whether a product is a "new arrival" (within the last 7 days)."""
+    try:
+        if getattr(product, 'created_at', None):
+            return product.created_at >= (timezone.now() - datetime.timedelta(days=7))
+    except Exception:
+        pass
+    return False
+
+@anonymous_page_cache
 def product_detail(request, product_id):
     product = get_object_or_404(Product.objects.select_related('category'), id=product_id)
-    related_products = Product.objects.filter(category=product.category).exclude(id=product.id).select_related('category')[:4]
+    # Evaluated only when the related products fragment is not cached
+    related = SimpleLazyObject(lambda: related_products(product))
 
     # Check if product is in user's wishlist
     in_wishlist = False
@@ -111,23 +143,16 @@ def product_detail(request, product_id):
             in_wishlist = True
             wishlist_item_id = wishlist_item.id
 
-    # Determine if product is a "new arrival" (within the last 7 days)
-    is_new = False
-    try:
-        if getattr(product, 'created_at', None):
-            is_new = product.created_at >= (timezone.now() - datetime.timedelta(days=7))
-    except Exception:
-        is_new = False
-
     context = {
         'product': product,
-        'related_products': related_products,
+        'related_products': related,
         'in_wishlist': in_wishlist,
         'wishlist_item_id': wishlist_item_id,
-        'is_new': is_new,
+        'is_new': is_new_arrival(product),
     }
     return render(request, 'product_detail.html', context)
 
+@anonymous_page_cache
 def about(request):
     return render(request, 'about.html')
 
@@ -138,7 +163,7 @@ def contact(request):
             contact_message = form.save(commit=False)
             if request.user.is_authenticated:
                 contact_message.user = request.user
-            contact_message.save()
+            retry_on_lock(contact_message.save)()
             messages.success(request, 'Thank you for your message. We will get back to you soon!')
             return redirect('contact')
     else:
@@ -147,6 +172,15 @@ def contact(request):
     return render(request, 'contact.html', {'form': form})
 
 # Authentication views
+def adopt_guest_cart(request, user, response):
+    # Admins cannot purchase items, so their guest cart is just discarded
+    guest_cart = GuestCart(request)
+    if user.userprofile.role == 'admin':
+        guest_cart.clear()
+    else:
+        merge_guest_cart(user, guest_cart)
+    guest_cart.save(response)
+
 def login_view(request):
     if request.user.is_authenticated:
         return redirect('home')
@@ -160,7 +194,9 @@ def login_view(request):
             login(request, user)
             messages.success(request, f'Welcome back, {user.first_name or user.username}!')
             next_url = request.GET.get('next', 'home')
-            return redirect(next_url)
+            response = redirect(next_url)
+            adopt_guest_cart(request, user, response)
+            return response
         else:
             messages.error(request, 'Invalid username or password.')
 
@@ -179,7 +215,9 @@ def register_view(request):
             user.userprofile.save()
             login(request, user)
             messages.success(request, f'Welcome to E-Shop, {user.first_name or user.username}!')
-            return redirect('home')
+            response = redirect('home')
+            adopt_guest_cart(request, user, response)
+            return response
     else:
         form = UserRegistrationForm()
 
@@ -229,33 +267,49 @@ def update_profile(request):
 
 @login_required
 def order_history(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    paginator = Paginator(orders, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    orders = Order.objects.filter(user=request.user)
+    paginator = KeysetPaginator(orders, 10, ['-created_at'], count=False)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'order_history.html', {'page_obj': page_obj})
 
-@login_required
 def view_cart(request):
-    try:
-        cart = Cart.objects.get(user=request.user)
-        cart_items = cart.cartitem_set.select_related('product__category').all()
-        total = cart.get_total()
-    except Cart.DoesNotExist:
-        cart_items = []
-        total = 0
+    if request.user.is_authenticated:
+        cart_items = list(cart_lines(request.user))
+        price = price_cart(request.user, session_coupon(request))
+    else:
+        cart_items = GuestCart(request).lines()
+        price = price_lines(cart_items)
 
     context = {
         'cart_items': cart_items,
-        'total': total,
+        'price': price,
+        'total': price['total'],
     }
     return render(request, 'cart.html', context)
 
 @login_required
+def apply_coupon(request):
+    if request.method == 'POST':
+        code = request.POST.get('code', '').strip()
+        coupon = get_coupon(code)
+        if coupon is None:
+            request.session.pop(COUPON_SESSION_KEY, None)
+            messages.error(request, f'Coupon "{code}" is not valid.')
+        else:
+            request.session[COUPON_SESSION_KEY] = coupon.code
+            messages.success(request, f'Coupon {coupon.code} applied: {coupon.discount_percentage}% off.')
+    return redirect('view_cart')
+
+@login_required
+def remove_coupon(request):
+    request.session.pop(COUPON_SESSION_KEY, None)
+    messages.info(request, 'Coupon removed.')
+    return redirect('view_cart')
+
 def add_to_cart(request, product_id):
     # Admins cannot purchase items
-    if request.user.userprofile.role == 'admin':
+    if request.user.is_authenticated and request.user.userprofile.role == 'admin':
         messages.error(request, 'Admins cannot place orders.')
         return redirect('admin_dashboard')
 
@@ -268,55 +322,99 @@ def add_to_cart(request, product_id):
     # Get quantity from POST, default to 1
     quantity = int(request.POST.get('quantity', 1))
 
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_item, item_created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'quantity': quantity}
-    )
-
-    if not item_created:
-        # If item exists, add the new quantity to existing
-        if cart_item.quantity + quantity > product.stock:
+    if not request.user.is_authenticated:
+        # Guests get a cookie cart; nothing is written until they log in or register
+        guest_cart = GuestCart(request)
+        current = guest_cart.quantity(product.id)
+        if guest_cart.is_full(product.id):
+            messages.error(request, 'Your cart is full. Please log in to add more items.')
+        elif current and current + quantity > product.stock:
             messages.error(request, 'Cannot add items. Stock limit reached.')
+        elif not current and quantity > product.stock:
+            guest_cart.set(product.id, product.stock)
+            messages.warning(request, f'Stock limit reached. Added {product.stock} only.')
         else:
+            guest_cart.set(product.id, current + quantity)
+            messages.success(request, f'Added {quantity} x {product.name} to cart.')
+        response = redirect('view_cart')
+        guest_cart.save(response)
+        return response
+
+    @retry_on_lock
+    def add():
+        # Returns the message to show; messages are added once the write has committed
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        cart_item, item_created = CartItem.objects.get_or_create(
+            cart=cart,
+            product=product,
+            defaults={'quantity': quantity}
+        )
+
+        if not item_created:
+            # If item exists, add the new quantity to existing
+            if cart_item.quantity + quantity > product.stock:
+                return messages.error, 'Cannot add items. Stock limit reached.'
             cart_item.quantity += quantity
             cart_item.save()
-            messages.success(request, f'Added {quantity} x {product.name} to cart.')
-    else:
         # If newly created, we just need to verify stock one more time (though get_or_create defaults handles init)
-        if quantity > product.stock:
-             # This is a rare edge case if defaults was used but quantity > stock
-             cart_item.quantity = product.stock # MAX out
-             cart_item.save()
-             messages.warning(request, f'Stock limit reached. Added {product.stock} only.')
-        else:
-             messages.success(request, f'Added {quantity} x {product.name} to cart.')
+        elif quantity > product.stock:
+            # This is a rare edge case if defaults was used but quantity > stock
+            cart_item.quantity = product.stock # MAX out
+            cart_item.save()
+            return messages.warning, f'Stock limit reached. Added {product.stock} only.'
+        return messages.success, f'Added {quantity} x {product.name} to cart.'
 
+    notify, text = add()
+    notify(request, text)
+    refresh_cart_summary(request.user)
     return redirect('view_cart')
 
-@login_required
 def remove_from_cart(request, item_id):
+    # For guests item_id is the product id of the line
+    if not request.user.is_authenticated:
+        guest_cart = GuestCart(request)
+        guest_cart.remove(item_id)
+        messages.success(request, 'Item removed from cart.')
+        response = redirect('view_cart')
+        guest_cart.save(response)
+        return response
+
     cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    cart_item.delete()
+    retry_on_lock(cart_item.delete)()
+    refresh_cart_summary(request.user)
     messages.success(request, 'Item removed from cart.')
     return redirect('view_cart')
 
-@login_required
 def update_cart(request, item_id):
+    if request.method == 'POST' and not request.user.is_authenticated:
+        guest_cart = GuestCart(request)
+        quantity = int(request.POST.get('quantity', 1))
+        if quantity <= 0:
+            guest_cart.remove(item_id)
+            messages.success(request, 'Item removed from cart.')
+        elif quantity > get_object_or_404(Product, id=item_id).stock:
+            messages.error(request, 'Quantity exceeds available stock.')
+        elif guest_cart.quantity(item_id):
+            guest_cart.set(item_id, quantity)
+            messages.success(request, 'Cart updated successfully.')
+        response = redirect('view_cart')
+        guest_cart.save(response)
+        return response
+
     if request.method == 'POST':
         cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
         quantity = int(request.POST.get('quantity', 1))
 
         if quantity <= 0:
-            cart_item.delete()
+            retry_on_lock(cart_item.delete)()
             messages.success(request, 'Item removed from cart.')
         elif quantity > cart_item.product.stock:
             messages.error(request, 'Quantity exceeds available stock.')
         else:
             cart_item.quantity = quantity
-            cart_item.save()
+            retry_on_lock(cart_item.save)()
             messages.success(request, 'Cart updated successfully.')
+        refresh_cart_summary(request.user)
 
     return redirect('view_cart')
 
@@ -327,43 +425,32 @@ def checkout(request):
         messages.error(request, 'Admins cannot place orders.')
         return redirect('admin_dashboard')
 
-    try:
-        cart = Cart.objects.get(user=request.user)
-        cart_items = cart.cartitem_set.all()
-        if not cart_items:
-            messages.error(request, 'Your cart is empty.')
-            return redirect('view_cart')
-        total = cart.get_total()
-    except Cart.DoesNotExist:
+    cart_items = list(cart_lines(request.user))
+    if not cart_items:
         messages.error(request, 'Your cart is empty.')
         return redirect('view_cart')
+    coupon = session_coupon(request)
+    price = price_cart(request.user, coupon)
 
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            order = Order.objects.create(
-                user=request.user,
-                total_amount=total,
-                payment_method=form.cleaned_data['payment_method'],
-                shipping_address=form.cleaned_data['shipping_address'],
-                phone=form.cleaned_data['phone'],
-            )
-
-            # Create order items
-            for item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price=item.product.price,
+            try:
+                order = retry_on_lock(place_order)(
+                    request.user,
+                    cart_items,
+                    coupon=coupon,
+                    payment_method=form.cleaned_data['payment_method'],
+                    shipping_address=form.cleaned_data['shipping_address'],
+                    phone=form.cleaned_data['phone'],
                 )
-                # Update stock
-                item.product.stock -= item.quantity
-                item.product.save()
-
-            # Clear cart
-            cart_items.delete()
+            except InsufficientStock as e:
+                for item, available in e.shortages:
+                    messages.error(request, f'Only {available} x {item.product.name} left in stock, you have {item.quantity} in your cart.')
+                return redirect('view_cart')
 
+            refresh_cart_summary(request.user)
+            request.session.pop(COUPON_SESSION_KEY, None)
             messages.success(request, f'Order placed successfully! Order number: {order.order_number}')
             return redirect('order_history')
     else:
@@ -371,7 +458,8 @@ def checkout(request):
 
     context = {
         'cart_items': cart_items,
-        'total': total,
+        'price': price,
+        'total': price['total'],
         'form': form,
     }
     return render(request, 'checkout.html', context)
@@ -407,25 +495,13 @@ def remove_from_wishlist(request, item_id):
 @admin_required
 def admin_dashboard(request):
     # Statistics
-    total_products = Product.objects.count()
-    total_orders = Order.objects.count()
-    total_users = User.objects.count()
-    total_categories = Category.objects.count()
-    pending_orders = Order.objects.filter(status='pending').count()
-    total_revenue = Order.objects.filter(status__in=['shipped', 'delivered']).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    counters = get_counters()
 
     # Recent orders
     recent_orders = Order.objects.select_related('user').order_by('-created_at')[:10]
 
     context = {
-        'total_products': total_products,
-        'total_orders': total_orders,
-        'total_users': total_users,
-        'total_categories': total_categories,
-        'pending_orders': pending_orders,
-        'total_revenue': total_revenue,
+        **counters,
         'recent_orders': recent_orders,
     }
     return render(request, 'admin/dashboard.html', context)
@@ -433,9 +509,8 @@ def admin_dashboard(request):
 @admin_required
 def admin_products(request):
     products = Product.objects.select_related('category').all()
-    paginator = Paginator(products, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(products, 20, ['id'], count=False)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'admin/products.html', {'page_obj': page_obj})
 
@@ -478,12 +553,12 @@ def delete_product(request, product_id):
 
 @admin_required
 def admin_categories(request):
-    categories = Category.objects.all()
+    categories = list(Category.objects.all())
 
-    # Additional statistics
-    total_products = Product.objects.count()
-    active_categories = categories.count()
-    empty_categories = categories.filter(product__isnull=True).distinct().count()
+    # Additional statistics, from the denormalized product counts
+    total_products = sum(category.product_count for category in categories)
+    active_categories = len(categories)
+    empty_categories = sum(1 for category in categories if not category.product_count)
 
     return render(request, 'admin/categories.html', {
         'categories': categories,
@@ -531,12 +606,36 @@ def delete_category(request, category_id):
 
 @admin_required
 def admin_orders(request):
-    orders = Order.objects.select_related('user').all()
-    paginator = Paginator(orders, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    orders = Order.objects.select_related('user')
+    paginator = KeysetPaginator(orders, 20, ['-created_at'], count=False)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
-    return render(request, 'admin/orders.html', {'page_obj': page_obj})
+    return render(request, 'admin/orders.html', {
+        'page_obj': page_obj,
+        'status_choices': Order.STATUS_CHOICES,
+    })
+
+@admin_required
+def export_orders(request):
+    """
+    Download the orders matching ``date_from``/``date_to`` (YYYY-MM-DD, inclusive) and
+    ``status`` (repeatable) as CSV (one row per item) or JSONL (one order per line).
+    The file is streamed as it is read, so large exports start at once and use
+    constant memory.
+    """
+    fmt = request.GET.get('format')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    date_from = parse_date(request.GET.get('date_from'))
+    date_to = parse_date(request.GET.get('date_to'))
+    statuses = [s for s in request.GET.getlist('status') if s in dict(Order.STATUS_CHOICES)]
+    orders = filter_orders(date_from, date_to, statuses)
+
+    response = StreamingHttpResponse(export_lines(fmt, orders), content_type=EXPORT_FORMATS[fmt])
+    filename = '-'.join(['orders', *(str(d) for d in (date_from, date_to) if d)])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @admin_required
 def update_order_status(request, order_id):
@@ -552,10 +651,9 @@ def update_order_status(request, order_id):
 
 @admin_required
 def admin_users(request):
-    users = User.objects.select_related('userprofile').order_by('-date_joined')
-    paginator = Paginator(users, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    users = User.objects.select_related('userprofile')
+    paginator = KeysetPaginator(users, 20, ['-date_joined'], count=False)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'admin/users.html', {'page_obj': page_obj})
 
@@ -584,56 +682,54 @@ def order_detail(request, order_id):
         order = get_object_or_404(Order, id=order_id)
     else:
         order = get_object_or_404(Order, id=order_id, user=request.user)
-    
-    return render(request, 'order_detail.html', {'order': order})
 
+    items = order.orderitem_set.select_related('product__category')
+    return render(request, 'order_detail.html', {'order': order, 'items': items})
+
+@anonymous_page_cache
 def page_detail(request, slug):
     page = get_object_or_404(Page, slug=slug, is_active=True)
     return render(request, 'page.html', {'page': page})
 
-from django.core.mail import send_mail
-from django.conf import settings
-
 @admin_required
 def admin_messages(request):
-    messages_list = ContactMessage.objects.all().order_by('-created_at')
-    paginator = Paginator(messages_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    messages_list = ContactMessage.objects.all()
+    paginator = KeysetPaginator(messages_list, 10, ['-created_at'], count=False)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     return render(request, 'admin/messages.html', {'page_obj': page_obj})
 
 @admin_required
 def reply_message(request, message_id):
     contact_message = get_object_or_404(ContactMessage, id=message_id)
+
+    @retry_on_lock
+    def send_reply(reply_content):
+        # 1. Create Reply Object
+        MessageReply.objects.create(
+            message=contact_message,
+            user=request.user,
+            content=reply_content,
+            is_admin=True
+        )
+
+        # 2. Update Main Message Status
+        contact_message.is_replied = True
+        contact_message.replied_at = timezone.now()
+        contact_message.save()
+
+        # 3. Queue the Email Notification; the job commits with the reply (a retried attempt must not send twice)
+        enqueue('send_mail', {
+            'subject': f"Reply to your message: {contact_message.subject}",
+            'message': reply_content,
+            'recipient_list': [contact_message.email],
+        })
     
     if request.method == 'POST':
         reply_content = request.POST.get('reply_content')
         if reply_content:
             try:
-                # 1. Create Reply Object
-                MessageReply.objects.create(
-                    message=contact_message,
-                    user=request.user,
-                    content=reply_content,
-                    is_admin=True
-                )
-                
-                # 2. Update Main Message Status
-                contact_message.is_replied = True
-                contact_message.replied_at = timezone.now()
-                contact_message.save()
-
-                # 3. Send Email Notification (Optional - keeping existing logic)
-                subject = f"Reply to your message: {contact_message.subject}"
-                send_mail(
-                    subject,
-                    reply_content,
-                    settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@luxshop.com',
-                    [contact_message.email],
-                    fail_silently=True,
-                )
-                
+                send_reply(reply_content)
                 messages.success(request, 'Reply sent successfully!')
                 return redirect('reply_message', message_id=message_id)
             except Exception as e:
@@ -641,7 +737,12 @@ def reply_message(request, message_id):
         else:
              messages.error(request, 'Reply content cannot be empty.')
              
-    return render(request, 'admin/reply_message.html', {'message': contact_message})
+    replies = list(contact_message.replies.select_related('user').order_by('id'))
+    return render(request, 'admin/reply_message.html', {
+        'message': contact_message,
+        'replies': replies,
+        'last_reply_id': replies[-1].id if replies else 0,
+    })
 
 @login_required
 def customer_messages(request):
@@ -651,55 +752,85 @@ def customer_messages(request):
 @login_required
 def customer_message_detail(request, message_id):
     contact_message = get_object_or_404(ContactMessage, id=message_id, user=request.user)
+
+    @retry_on_lock
+    def send_reply(reply_content):
+        MessageReply.objects.create(
+            message=contact_message,
+            user=request.user,
+            content=reply_content,
+            is_admin=False
+        )
+        # Update status to pending so admin knows there is a new reply
+        contact_message.is_replied = False 
+        contact_message.save()
     
     if request.method == 'POST':
         reply_content = request.POST.get('content')
         if reply_content:
-            MessageReply.objects.create(
-                message=contact_message,
-                user=request.user,
-                content=reply_content,
-                is_admin=False
-            )
-            # Update status to pending so admin knows there is a new reply
-            contact_message.is_replied = False 
-            contact_message.save()
-            
+            send_reply(reply_content)
             messages.success(request, 'Reply sent!')
             return redirect('customer_message_detail', message_id=message_id)
             
-    return render(request, 'customer/message_detail.html', {'message': contact_message})
+    replies = list(contact_message.replies.order_by('id'))
+    return render(request, 'customer/message_detail.html', {
+        'message': contact_message,
+        'replies': replies,
+        'last_reply_id': replies[-1].id if replies else 0,
+    })
 
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 @login_required
 def get_chat_messages(request, message_id):
     """
     API to fetch replies for a specific message thread.
-    Used for real-time polling in chat UI.
+    Used for polling in the chat UI: pass ``since`` (the last reply id seen) to get
+    only newer replies. Answers 304 when the thread has not changed.
     """
     # Allow access if user is admin OR if user owns the message
     if request.user.userprofile.role == 'admin':
-        contact_message = get_object_or_404(ContactMessage, id=message_id)
+        contact_message = get_object_or_404(ContactMessage.objects.only('id'), id=message_id)
     else:
-        contact_message = get_object_or_404(ContactMessage, id=message_id, user=request.user)
-    
-    replies = contact_message.replies.all().order_by('created_at')
-    
-    data = []
-    data = []
-    for reply in replies:
-        user_name = "Unknown"
-        if reply.is_admin:
-            user_name = "Support Team"
-        elif reply.user:
-             user_name = reply.user.first_name or reply.user.username
-             
-        data.append({
-            'user': user_name,
-            'content': reply.content,
-            'is_admin': reply.is_admin,
-            'created_at': reply.created_at.strftime("%M %d, %Y %I:%M %p")
-        })
-        
-    return JsonResponse({'replies': data})
+        contact_message = get_object_or_404(ContactMessage.objects.only('id'), id=message_id, user=request.user)
+
+    since = parse_cursor(request.GET.get('since'))
+    latest = latest_reply_id(contact_message.id)
+    etag = f'"chat-{contact_message.id}-{latest}-{since}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        data = []
+        if latest > since:
+            data = [serialize_reply(reply) for reply in replies_since(contact_message.id, since)]
+        cursor = data[-1]['id'] if data else since
+        response = JsonResponse({'replies': data, 'cursor': cursor})
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+async def chat_stream(request, message_id):
+    """
+    Server-sent events push for a chat thread, for deployments served through ecommarce/asgi.py.
+    Under WSGI a long-lived stream would pin a worker, so it answers 204 and the
+    page falls back to polling get_chat_messages.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    role = await UserProfile.objects.filter(user=user).values_list('role', flat=True).afirst()
+    messages_qs = ContactMessage.objects.filter(id=message_id)
+    if role != 'admin':
+        messages_qs = messages_qs.filter(user=user)
+    if not await messages_qs.aexists():
+        return HttpResponse(status=404)
+
+    since = parse_cursor(request.headers.get('Last-Event-ID') or request.GET.get('since'))
+    response = StreamingHttpResponse(stream_replies(message_id, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response